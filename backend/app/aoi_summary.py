@@ -0,0 +1,91 @@
+import os
+import math
+import ee
+
+# Pixels EE can reduce per second of latency budget for a yearly median composite
+SUMMARY_PIXELS_PER_SECOND = float(os.getenv('SUMMARY_PIXELS_PER_SECOND', 2e5))
+SUMMARY_LATENCY_BUDGET = float(os.getenv('SUMMARY_LATENCY_BUDGET', 10))
+# Pixels per tile above which the region is split into a grid of tiles
+SUMMARY_TILE_PIXELS = float(os.getenv('SUMMARY_TILE_PIXELS', 2.5e5))
+SUMMARY_MAX_TILES = int(os.getenv('SUMMARY_MAX_TILES', 64))
+SUMMARY_BINS = int(os.getenv('SUMMARY_BINS', 100))
+PERCENTILES = [5, 25, 50, 75, 95]
+
+EARTH_RADIUS_M = 6371008.8
+NATIVE_SCALE = 10
+
+
+def area_m2(bounds):
+    """Area of a lat/lng rectangle on a sphere"""
+    west, south, east, north = bounds
+    return (EARTH_RADIUS_M ** 2 * math.radians(east - west)
+            * abs(math.sin(math.radians(north)) - math.sin(math.radians(south))))
+
+def plan(bounds, budget=SUMMARY_LATENCY_BUDGET, refine=False):
+    """Pick a reduction scale and tile grid so the pixel count fits the latency budget.
+
+    refine asks for four times the budget, i.e. half the scale.
+    """
+    if refine:
+        budget *= 4
+    max_pixels = max(budget * SUMMARY_PIXELS_PER_SECOND, 1)
+    scale = max(NATIVE_SCALE, math.sqrt(area_m2(bounds) / max_pixels))
+    # Round up to a power-of-two multiple of the native scale so nearby AOIs share cache entries
+    scale = NATIVE_SCALE * 2 ** math.ceil(math.log2(scale / NATIVE_SCALE))
+    pixels = area_m2(bounds) / scale ** 2
+    tiles = min(SUMMARY_MAX_TILES, max(1, math.ceil(pixels / SUMMARY_TILE_PIXELS)))
+    side = math.ceil(math.sqrt(tiles))
+    return {"scale": scale, "grid": side, "pixels": int(pixels)}
+
+def grid_cells(bounds, side):
+    west, south, east, north = bounds
+    dx, dy = (east - west) / side, (north - south) / side
+    return [[west + i * dx, south + j * dy, west + (i + 1) * dx, south + (j + 1) * dy]
+            for i in range(side) for j in range(side)]
+
+
+def summarize(image, bounds, scale, side):
+    """Reduce an NDVI image over a grid of tiles in one request and merge the tiles locally"""
+    cells = ee.FeatureCollection([ee.Feature(ee.Geometry.Rectangle(c)) for c in grid_cells(bounds, side)])
+    reducer = ee.Reducer.mean().combine(ee.Reducer.count(), '', True)\
+                .combine(ee.Reducer.fixedHistogram(-1, 1, SUMMARY_BINS), '', True)
+    reduced = image.reduceRegions(collection=cells, reducer=reducer, scale=scale, tileScale=4)
+    info = ee.Dictionary({
+        'mean': reduced.aggregate_array('mean'),
+        'count': reduced.aggregate_array('count'),
+        'histogram': reduced.aggregate_array('histogram')
+    }).getInfo()
+    return merge(info['mean'], info['count'], info['histogram'])
+
+def merge(means, counts, histograms):
+    """Combine per-tile mean/count/histogram into AOI-wide statistics"""
+    total = sum(c for c in counts if c)
+    bins = [0] * SUMMARY_BINS
+    edges = None
+    for histogram in histograms:
+        if not histogram:
+            continue
+        edges = [row[0] for row in histogram]
+        for i, row in enumerate(histogram):
+            bins[i] += row[1]
+    if not total or edges is None:
+        return {"pixel_count": 0, "mean": None, "percentiles": {}, "histogram": {"edges": [], "counts": []}}
+    mean = sum(m * c for m, c in zip(means, counts) if m is not None and c) / total
+    width = edges[1] - edges[0] if len(edges) > 1 else 2.0 / SUMMARY_BINS
+    return {
+        "pixel_count": int(total),
+        "mean": round(mean, 3),
+        "percentiles": {str(p): round(percentile(edges, width, bins, p), 3) for p in PERCENTILES},
+        "histogram": {"edges": [round(e, 4) for e in edges] + [round(edges[-1] + width, 4)],
+                      "counts": [round(b, 2) for b in bins]}
+    }
+
+def percentile(edges, width, bins, p):
+    """Percentile from a fixed-width histogram, interpolating linearly inside the bucket"""
+    target = sum(bins) * p / 100.0
+    cumulative = 0.0
+    for edge, count in zip(edges, bins):
+        if count and cumulative + count >= target:
+            return edge + width * (target - cumulative) / count
+        cumulative += count
+    return edges[-1] + width
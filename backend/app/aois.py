@@ -0,0 +1,197 @@
+import os
+import re
+import json
+import time
+import hashlib
+import sqlite3
+import threading
+from app import geometry
+from app.pipeline import rect_spec, polygon_spec
+
+# Registered AOIs persist here alongside the built-in ones
+AOI_REGISTRY_PATH = os.getenv('AOI_REGISTRY_PATH', '/tmp/ndvi-aois.sqlite')
+# Douglas-Peucker tolerance in degrees for the copy sent to EE (~10 m, one Sentinel-2 pixel)
+AOI_SIMPLIFY_TOLERANCE = float(os.getenv('AOI_SIMPLIFY_TOLERANCE', 0.0001))
+AOI_MAX_VERTICES = int(os.getenv('AOI_MAX_VERTICES', 100000))
+# Seconds between checks for AOIs registered or deleted by other worker processes
+AOI_REGISTRY_RECHECK = float(os.getenv('AOI_REGISTRY_RECHECK', 1.0))
+
+# Built-in Areas of Interest, as [west, south, east, north]
+BUILTIN_AOIS = {
+    "nyc": {
+        "name": "New York City",
+        "bounds": [-74.25909, 40.477399, -73.700272, 40.917577]
+    },
+    "amazon": {
+        "name": "Amazon Rainforest",
+        "bounds": [-70.0, -10.0, -50.0, 5.0]
+    },
+    "sahara": {
+        "name": "Sahara Desert",
+        "bounds": [-10.0, 15.0, 30.0, 35.0]
+    }
+}
+
+NDVI_VIS = {
+    'min': -0.2,
+    'max': 0.8,
+    'palette': ['red', 'orange', 'yellow', 'lightgreen', 'green', 'darkgreen']
+}
+
+_NAME = re.compile(r'^[a-z0-9][a-z0-9_-]{0,63}$')
+
+
+class AoiConflict(Exception):
+    """The AOI id is taken, or belongs to a built-in AOI"""
+    pass
+
+
+def _entry(aoi_id, name, shape, simplified, builtin=False):
+    return {
+        "id": aoi_id,
+        "name": name,
+        "bounds": geometry.bbox(shape),
+        "geometry": shape,
+        "simplified": simplified,
+        # Part of the map ID and summary cache keys, so a redefined id never serves the old shape
+        "version": hashlib.sha1(json.dumps(simplified, sort_keys=True).encode()).hexdigest()[:12],
+        # Built-in rectangles keep the rectangle geometry the pipelines were keyed by
+        "spec": rect_spec(geometry.bbox(shape)) if builtin else polygon_spec(simplified),
+        "builtin": builtin,
+    }
+
+
+class AoiRegistry:
+    """Built-in and user-registered AOIs with a spatial index for point lookups.
+
+    Behaves as a read-only mapping of id -> AOI. Each AOI keeps the polygon it
+    was registered with plus a simplified copy used for EE requests. An
+    STR-packed R-tree over the bounding boxes narrows point lookups to a few
+    candidates before the exact point-in-polygon test.
+
+    Other worker processes share the SQLite file, so the in-memory copy is
+    reloaded when SQLite's data_version shows another connection committed,
+    checked at most every AOI_REGISTRY_RECHECK seconds and on every id miss.
+    """
+
+    def __init__(self, path=AOI_REGISTRY_PATH):
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._lock = threading.Lock()
+        with self._lock, self._conn:
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS aois (
+                    id TEXT PRIMARY KEY,
+                    name TEXT NOT NULL,
+                    geometry TEXT NOT NULL,
+                    simplified TEXT NOT NULL,
+                    created_at REAL NOT NULL
+                )""")
+            self._builtin = {}
+            for aoi_id, aoi in BUILTIN_AOIS.items():
+                shape = geometry.rectangle(aoi["bounds"])
+                self._builtin[aoi_id] = _entry(aoi_id, aoi["name"], shape, shape, builtin=True)
+            self._aois = {}
+            self._data_version = None
+            self._reload()
+
+    def _reload(self):
+        """Rebuild the AOI map from SQLite if another connection has committed; caller holds the lock"""
+        self._checked_at = time.monotonic()
+        version = self._conn.execute("PRAGMA data_version").fetchone()[0]
+        if version == self._data_version:
+            return
+        rows = self._conn.execute("SELECT id, name, geometry, simplified FROM aois").fetchall()
+        aois = dict(self._builtin)
+        for aoi_id, name, shape, simplified in rows:
+            if aoi_id in aois:
+                continue
+            # Parsed entries are reused so a reload only pays for AOIs it has not seen
+            known = self._aois.get(aoi_id)
+            if known and known["name"] == name and json.dumps(known["simplified"]) == simplified:
+                aois[aoi_id] = known
+            else:
+                aois[aoi_id] = _entry(aoi_id, name, json.loads(shape), json.loads(simplified))
+        self._data_version = version
+        self._aois = aois
+        self._reindex()
+
+    def _refresh(self, force=False):
+        if force or time.monotonic() - self._checked_at >= AOI_REGISTRY_RECHECK:
+            with self._lock:
+                self._reload()
+
+    def _reindex(self):
+        self._index = geometry.STRTree([(aoi["bounds"], aoi_id) for aoi_id, aoi in self._aois.items()])
+
+    def __contains__(self, aoi_id):
+        self._refresh(aoi_id not in self._aois)
+        return aoi_id in self._aois
+
+    def __getitem__(self, aoi_id):
+        self._refresh(aoi_id not in self._aois)
+        return self._aois[aoi_id]
+
+    def __iter__(self):
+        self._refresh()
+        return iter(list(self._aois))
+
+    def __len__(self):
+        self._refresh()
+        return len(self._aois)
+
+    def keys(self):
+        self._refresh()
+        return list(self._aois)
+
+    def register(self, aoi_id, shape, name=None):
+        """Validate, simplify and persist a GeoJSON polygon under aoi_id; raises ValueError or AoiConflict"""
+        if not isinstance(aoi_id, str) or not _NAME.match(aoi_id):
+            raise ValueError("id must be 1-64 lowercase letters, digits, '-' or '_'")
+        shape = geometry.validate(shape)
+        if geometry.vertex_count(shape) > AOI_MAX_VERTICES:
+            raise ValueError(f"geometry has more than {AOI_MAX_VERTICES} vertices")
+        simplified = geometry.simplify(shape, AOI_SIMPLIFY_TOLERANCE)
+        aoi = _entry(aoi_id, name or aoi_id, shape, simplified)
+        with self._lock:
+            if aoi_id in self._aois:
+                raise AoiConflict(f"AOI '{aoi_id}' already exists")
+            try:
+                with self._conn:
+                    self._conn.execute(
+                        "INSERT INTO aois (id, name, geometry, simplified, created_at) VALUES (?, ?, ?, ?, ?)",
+                        (aoi_id, aoi["name"], json.dumps(shape), json.dumps(simplified), time.time()))
+            except sqlite3.IntegrityError:
+                # Registered by another worker since the last reload
+                self._reload()
+                raise AoiConflict(f"AOI '{aoi_id}' already exists")
+            self._aois = {**self._aois, aoi_id: aoi}
+            self._reindex()
+        return aoi
+
+    def remove(self, aoi_id):
+        """Delete a registered AOI; returns False if it does not exist"""
+        with self._lock:
+            self._reload()
+            aoi = self._aois.get(aoi_id)
+            if aoi is None:
+                return False
+            if aoi["builtin"]:
+                raise AoiConflict(f"AOI '{aoi_id}' is built in")
+            with self._conn:
+                self._conn.execute("DELETE FROM aois WHERE id = ?", (aoi_id,))
+            self._aois = {k: v for k, v in self._aois.items() if k != aoi_id}
+            self._reindex()
+        return True
+
+    def containing(self, lat, lng):
+        """AOIs whose polygon contains the point, smallest bounding box first"""
+        self._refresh()
+        aois, index = self._aois, self._index
+        found = [aois[aoi_id] for aoi_id in index.query_point(lng, lat)
+                 if aoi_id in aois and geometry.contains(aois[aoi_id]["geometry"], lng, lat)]
+        return sorted(found, key=lambda a: (a["bounds"][2] - a["bounds"][0]) * (a["bounds"][3] - a["bounds"][1]))
+
+
+aoi_registry = AoiRegistry()
@@ -0,0 +1,64 @@
+import asyncio
+from fastapi import APIRouter
+from pydantic import BaseModel
+from typing import Any, Dict, Optional
+from app.aois import aoi_registry, AoiConflict
+from app import geometry
+
+router = APIRouter()
+
+
+class AoiRequest(BaseModel):
+    id: str
+    name: Optional[str] = None
+    # GeoJSON Polygon or MultiPolygon, or a Feature holding one
+    geometry: Dict[str, Any]
+
+
+def _summary(aoi):
+    return {
+        "id": aoi["id"],
+        "name": aoi["name"],
+        "bounds": aoi["bounds"],
+        "builtin": aoi["builtin"],
+        "vertices": geometry.vertex_count(aoi["geometry"]),
+        "simplified_vertices": geometry.vertex_count(aoi["simplified"]),
+    }
+
+
+@router.get("")
+async def list_aois():
+    """List built-in and registered AOIs"""
+    return {"aois": [_summary(aoi_registry[aoi_id]) for aoi_id in aoi_registry]}
+
+@router.post("")
+async def register_aoi(req: AoiRequest):
+    """Register a GeoJSON polygon as an AOI usable by every /aoi/{aoi_name} endpoint"""
+    try:
+        # Validating and simplifying a large polygon takes seconds, so it stays off the event loop
+        aoi = await asyncio.to_thread(aoi_registry.register, req.id, req.geometry, req.name)
+    except (ValueError, AoiConflict) as e:
+        return {"error": str(e)}
+    return await asyncio.to_thread(_summary, aoi)
+
+@router.get("/at/{lat}/{lng}")
+async def aois_at(lat: float, lng: float):
+    """AOIs containing a point, smallest first"""
+    return {"point": {"lat": lat, "lng": lng}, "aois": [_summary(aoi) for aoi in aoi_registry.containing(lat, lng)]}
+
+@router.get("/{aoi_id}")
+async def get_aoi(aoi_id: str):
+    """An AOI with its registered geometry and the simplified copy sent to Earth Engine"""
+    if aoi_id not in aoi_registry:
+        return {"error": f"AOI '{aoi_id}' not found"}
+    aoi = aoi_registry[aoi_id]
+    return {**_summary(aoi), "geometry": aoi["geometry"], "simplified": aoi["simplified"]}
+
+@router.delete("/{aoi_id}")
+async def delete_aoi(aoi_id: str):
+    try:
+        if not await asyncio.to_thread(aoi_registry.remove, aoi_id):
+            return {"error": f"AOI '{aoi_id}' not found"}
+    except AoiConflict as e:
+        return {"error": str(e)}
+    return {"deleted": aoi_id}
@@ -0,0 +1,60 @@
+import os
+from fastapi import APIRouter
+from fastapi.responses import FileResponse, JSONResponse
+from pydantic import BaseModel
+from typing import Any, Dict, Optional
+from app.jobs import job_queue, DONE
+
+router = APIRouter()
+
+
+class JobRequest(BaseModel):
+    # composite, cube, zonal-stats or time-series
+    kind: str
+    params: Optional[Dict[str, Any]] = None
+
+
+def job_view(job):
+    # Parameters can hold thousands of parcels, so they stay in the job record on disk
+    view = {k: v for k, v in job.items() if k != "params"}
+    if job["status"] == DONE:
+        view["result_url"] = f"/jobs/{job['id']}/result"
+    return view
+
+
+@router.post("")
+async def submit_job(req: JobRequest):
+    """Queue a long-running computation; identical work returns the existing job"""
+    try:
+        job, created = job_queue.submit(req.kind, req.params)
+    except ValueError as e:
+        return {"error": str(e)}
+    return {**job_view(job), "created": created}
+
+@router.get("")
+async def list_jobs(limit: int = 100):
+    return {"jobs": [job_view(job) for job in job_queue.list(limit)], **job_queue.status()}
+
+@router.get("/{job_id}")
+async def get_job(job_id: str):
+    """Status and progress of a job"""
+    job = job_queue.get(job_id)
+    if job is None:
+        return JSONResponse(content={"error": f"Job '{job_id}' not found"}, status_code=404)
+    return job_view(job)
+
+@router.get("/{job_id}/result")
+async def get_job_result(job_id: str):
+    """Download a finished job's result as JSON"""
+    job = job_queue.get(job_id)
+    path = job_queue.result_path(job_id)
+    if job is None or job["status"] != DONE or not os.path.exists(path):
+        return JSONResponse(content={"error": f"No result for job '{job_id}'"}, status_code=404)
+    return FileResponse(path, media_type="application/json", filename=f"{job['kind']}-{job_id}.json")
+
+@router.delete("/{job_id}")
+async def cancel_job(job_id: str):
+    job = job_queue.cancel(job_id)
+    if job is None:
+        return JSONResponse(content={"error": f"Job '{job_id}' not found"}, status_code=404)
+    return job_view(job)
@@ -1,15 +1,304 @@
-from fastapi import APIRouter
+from fastapi import APIRouter, Request
+from pydantic import BaseModel
+from typing import Any, Dict, List, Optional
+from datetime import date
+import asyncio
+import os
+from app.gee import init_ee_once, date_window
+from app.pipeline import get_pipeline, points_spec
+from app.ee_executor import run_ee, Overloaded, EE_HEAVY_LIMIT, EE_HEAVY_MAX_QUEUE, EE_HEAVY_TIMEOUT
+from app import encoding, zonal
+from app.jobs import job_queue
 
 router = APIRouter()
 
+# Points sampled per EE request, and how many of those requests run at once
+BATCH_CHUNK_SIZE = int(os.getenv('BATCH_CHUNK_SIZE', 100))
+BATCH_MAX_CONCURRENCY = int(os.getenv('BATCH_MAX_CONCURRENCY', 4))
+BATCH_MAX_POINTS = int(os.getenv('BATCH_MAX_POINTS', 2000))
+# Chunks of all batch requests together on the heavy lane; kept below its limit plus queue, so
+# batch chunks wait for a slot here instead of being shed, and other heavy work still gets in
+BATCH_MAX_IN_FLIGHT = int(os.getenv('BATCH_MAX_IN_FLIGHT', EE_HEAVY_LIMIT + EE_HEAVY_MAX_QUEUE // 2))
+
+_in_flight = asyncio.Semaphore(BATCH_MAX_IN_FLIGHT)
+
+# Placeholder for masked pixels in stats columns
+MISSING = -9999
+
+
+class Point(BaseModel):
+    lat: float
+    lng: float
+
+
+class BatchRequest(BaseModel):
+    points: List[Point]
+    start: Optional[date] = None
+    end: Optional[date] = None
+
+
+class ZonalRequest(BaseModel):
+    # GeoJSON FeatureCollection of Polygon/MultiPolygon parcels
+    features: Dict[str, Any]
+    # Property holding each parcel's id; the feature id or its index otherwise
+    id_property: Optional[str] = None
+    start: Optional[date] = None
+    end: Optional[date] = None
+    scale: int = 10
+
+
+def _window(req):
+    today, start_date = date_window(365)
+    start = req.start.strftime('%Y-%m-%d') if req.start else start_date.strftime('%Y-%m-%d')
+    end = req.end.strftime('%Y-%m-%d') if req.end else today.strftime('%Y-%m-%d')
+    if start >= end:
+        raise ValueError(f"Empty date range {start} to {end}")
+    return start, end
+
+
+def _chunks(points):
+    return [(offset, points[offset:offset + BATCH_CHUNK_SIZE])
+            for offset in range(0, len(points), BATCH_CHUNK_SIZE)]
+
+
+def _feature_collection(offset, points):
+    import ee
+    return ee.FeatureCollection([
+        ee.Feature(ee.Geometry.Point([p.lng, p.lat]), {'point': offset + i})
+        for i, p in enumerate(points)
+    ])
+
+
+def _pipeline_for(points, start, end):
+    return get_pipeline(points_spec([(p.lng, p.lat) for p in points]), start, end)
+
+
+def _timeseries_chunk(offset, points, start, end):
+    """Sample every image in the window at all points of one chunk"""
+    import ee
+    init_ee_once()
+    fc = _feature_collection(offset, points)
+    samples = _pipeline_for(points, start, end).ndvi.map(lambda img:
+        img.reduceRegions(
+            collection=fc,
+            reducer=ee.Reducer.first().setOutputs(['NDVI']),
+            scale=10
+        ).map(lambda f: f.set('date', img.date().format('YYYY-MM-dd')))
+    ).flatten().filter(ee.Filter.notNull(['NDVI']))
+    return ee.Dictionary({
+        'point': samples.aggregate_array('point'),
+        'date': samples.aggregate_array('date'),
+        'ndvi': samples.aggregate_array('NDVI')
+    }).getInfo()
+
+
+def _stats_chunk(offset, points, start, end):
+    """Reduce the collection per pixel and sample the result at all points of one chunk"""
+    import ee
+    init_ee_once()
+    fc = _feature_collection(offset, points)
+    ndvi = _pipeline_for(points, start, end).ndvi
+    stats = ndvi.reduce(ee.Reducer.mean().combine(
+        ee.Reducer.stdDev(), '', True).combine(
+        ee.Reducer.minMax(), '', True).combine(
+        ee.Reducer.count(), '', True)
+    )
+    sampled = stats.reduceRegions(collection=fc, reducer=ee.Reducer.first(), scale=10)
+    columns = ['point', 'NDVI_mean', 'NDVI_stdDev', 'NDVI_min', 'NDVI_max', 'NDVI_count']
+    # aggregate_array skips nulls, so fill masked pixels before aggregating
+    missing = ee.Dictionary.fromLists(columns[1:], [MISSING] * (len(columns) - 1))
+    sampled = sampled.map(lambda f: f.set(missing.combine(f.toDictionary())))
+    return ee.Dictionary.fromLists(columns, [sampled.aggregate_array(c) for c in columns]).getInfo()
+
+
+async def _run_chunks(fn, req):
+    """Run fn over all chunks on the heavy EE lane.
+
+    At most BATCH_MAX_CONCURRENCY chunks of the request, and BATCH_MAX_IN_FLIGHT of all
+    batch requests, are on the lane at once. The first chunk to fail fails the request,
+    and its chunks that have not finished are cancelled so they stop spending EE quota.
+    """
+    start, end = _window(req)
+    semaphore = asyncio.Semaphore(min(BATCH_MAX_CONCURRENCY, BATCH_MAX_IN_FLIGHT))
+
+    async def run(offset, points):
+        async with semaphore:
+            try:
+                await asyncio.wait_for(_in_flight.acquire(), EE_HEAVY_TIMEOUT)
+            except asyncio.TimeoutError:
+                raise Overloaded(f"batch chunk waited more than {EE_HEAVY_TIMEOUT:.0f}s for a heavy slot")
+            try:
+                return await run_ee("heavy", fn, offset, points, start, end)
+            finally:
+                _in_flight.release()
+
+    tasks = [asyncio.ensure_future(run(offset, points)) for offset, points in _chunks(req.points)]
+    try:
+        results = await asyncio.gather(*tasks)
+    except BaseException:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        raise
+    return results, start, end
+
+
+def _validate(req):
+    """Reject a request before any chunk is sent to EE"""
+    if not req.points:
+        return {"error": "No points given"}
+    if len(req.points) > BATCH_MAX_POINTS:
+        return {"error": f"Too many points: {len(req.points)} (max {BATCH_MAX_POINTS})"}
+    try:
+        _window(req)
+    except ValueError as e:
+        return {"error": str(e)}
+    return None
+
+
+def _points_columns(req):
+    return {"lat": [p.lat for p in req.points], "lng": [p.lng for p in req.points]}
+
+
 @router.get("/tile")
-def get_tile():
+async def get_tile():
     return {"message": "Tile URL will be here"}
 
+def _stats_table(result):
+    columns = {"lat": (result["points"]["lat"], "float64"), "lng": (result["points"]["lng"], "float64")}
+    for name, values in result["statistics"].items():
+        columns[name] = ([v if v is not None else 0 for v in values], "int32") if name == "observations" \
+            else (values, "float32")
+    return columns, {"date_range": result["date_range"]}
+
+
+def _timeseries_table(result):
+    series = result["series"]
+    columns = {"point": (series["point"], "int32"), "date": (series["date"], "date"),
+               "ndvi": (series["ndvi"], "float32")}
+    return columns, {k: v for k, v in result.items() if k != "series"}
+
+
 @router.post("/stats")
-def get_stats():
-    return {"message": "NDVI stats will be here"}
+async def get_stats(req: BatchRequest, request: Request):
+    """Get NDVI statistics for many points, as columnar arrays indexed by point"""
+    media = encoding.negotiate(request.headers.get("accept"))
+    error = _validate(req)
+    if error:
+        return error
+    return encoding.respond(media, await _batch_stats(req), _stats_table)
+
+
+async def _batch_stats(req):
+    try:
+        results, start, end = await _run_chunks(_stats_chunk, req)
+        n = len(req.points)
+        columns = {"mean": [None] * n, "std_dev": [None] * n, "min": [None] * n,
+                   "max": [None] * n, "observations": [0] * n}
+        names = {"mean": "NDVI_mean", "std_dev": "NDVI_stdDev", "min": "NDVI_min",
+                 "max": "NDVI_max", "observations": "NDVI_count"}
+        for result in results:
+            for row, index in enumerate(result.get('point', [])):
+                for column, name in names.items():
+                    value = result[name][row]
+                    if value != MISSING:
+                        columns[column][index] = value if column == "observations" else round(value, 3)
+        return {
+            "points": _points_columns(req),
+            "statistics": columns,
+            "date_range": {"start": start, "end": end}
+        }
+    except Overloaded:
+        raise
+    except Exception as e:
+        print(f"Error in batch stats: {e}")
+        return {"error": str(e)}
 
 @router.post("/timeseries")
-def get_timeseries():
-    return {"message": "Time-series data will be here"}
+async def get_timeseries(req: BatchRequest, request: Request):
+    """Get NDVI time series for many points, as columnar (point, date, ndvi) arrays"""
+    media = encoding.negotiate(request.headers.get("accept"))
+    error = _validate(req)
+    if error:
+        return error
+    return encoding.respond(media, await _batch_timeseries(req), _timeseries_table)
+
+
+async def _batch_timeseries(req):
+    try:
+        results, start, end = await _run_chunks(_timeseries_chunk, req)
+        rows = []
+        for result in results:
+            rows.extend(zip(result.get('point', []), result.get('date', []), result.get('ndvi', [])))
+        rows.sort()
+        return {
+            "points": _points_columns(req),
+            "series": {
+                "point": [r[0] for r in rows],
+                "date": [r[1] for r in rows],
+                "ndvi": [round(r[2], 3) for r in rows]
+            },
+            "count": len(rows),
+            "date_range": {"start": start, "end": end}
+        }
+    except Overloaded:
+        raise
+    except Exception as e:
+        print(f"Error in batch timeseries: {e}")
+        return {"error": str(e)}
+
+
+@router.post("/zonal-stats")
+async def get_zonal_stats(req: ZonalRequest, request: Request):
+    """Per-parcel NDVI mean, median, std dev and pixel count of the period's median composite"""
+    media = encoding.negotiate(request.headers.get("accept"))
+    return encoding.respond(media, await _zonal_stats(req), _zonal_table)
+
+
+async def _zonal_stats(req, on_chunk=None, lane="heavy"):
+    try:
+        features = zonal.parse_features(req.features, req.id_property)
+        start, end = _window(req)
+    except ValueError as e:
+        return {"error": str(e)}
+    ids = [feature_id for feature_id, _ in features]
+    chunks = zonal.chunk([(row, shape) for row, (_, shape) in enumerate(features)])
+    results, failures = await zonal.run_chunks(chunks, start, end, max(req.scale, 10), on_chunk, lane)
+    columns, failed = zonal.merge(ids, results, failures)
+    return {
+        "parcels": columns,
+        "count": len(ids),
+        "chunks": len(chunks),
+        "failed": failed,
+        "date_range": {"start": start, "end": end}
+    }
+
+
+def _zonal_table(result):
+    parcels = result["parcels"]
+    ids = [str(i) for i in parcels["id"]]
+    columns = {"id": (ids, "str"), "mean": (parcels["mean"], "float32"), "median": (parcels["median"], "float32"),
+               "std_dev": (parcels["std_dev"], "float32"), "pixels": (parcels["pixels"], "int32")}
+    return columns, {k: v for k, v in result.items() if k != "parcels"}
+
+
+def _normalize_zonal_job(params):
+    req = ZonalRequest(**params)
+    zonal.parse_features(req.features, req.id_property)
+    start, end = _window(req)
+    return {**req.model_dump(mode='json'), "start": start, "end": end}
+
+
+async def _run_zonal_job(params, progress):
+    req = ZonalRequest(**params)
+    total = len(req.features.get("features", []))
+    done = [0]
+
+    def on_chunk(count):
+        done[0] += count
+        progress(done[0] / total, f"{done[0]}/{total} parcels")
+
+    return await _zonal_stats(req, on_chunk, lane="jobs")
+
+
+job_queue.register("zonal-stats", _normalize_zonal_job, _run_zonal_job)
@@ -0,0 +1,403 @@
+import os
+import json
+import time
+import asyncio
+import socket
+import sqlite3
+import threading
+from collections import OrderedDict
+from urllib.parse import urlparse
+from app import metrics
+
+# 'memory' is private to each worker process; 'sqlite' is shared by the workers on one host
+# and 'redis' by every instance pointed at the same server
+CACHE_BACKEND = os.getenv('CACHE_BACKEND', 'memory').lower()
+CACHE_MAX_BYTES = int(os.getenv('CACHE_MAX_BYTES', 64 * 1024 * 1024))
+# Larger values are not cached so a single huge result cannot flush everything else
+CACHE_MAX_ITEM_BYTES = int(os.getenv('CACHE_MAX_ITEM_BYTES', 1024 * 1024))
+CACHE_PATH = os.getenv('CACHE_PATH', '/tmp/ndvi-cache.sqlite')
+# SQLite reads record their LRU touch in memory and write this many out in one statement
+CACHE_SQLITE_TOUCH_BATCH = int(os.getenv('CACHE_SQLITE_TOUCH_BATCH', 100))
+CACHE_REDIS_URL = os.getenv('CACHE_REDIS_URL', 'redis://localhost:6379/0')
+CACHE_REDIS_TIMEOUT = float(os.getenv('CACHE_REDIS_TIMEOUT', 0.5))
+# Seconds Redis is skipped after a connect or read failure, so a dead server costs no waiting
+CACHE_REDIS_RETRY = float(os.getenv('CACHE_REDIS_RETRY', 5))
+
+
+class MemoryBackend:
+    """In-process LRU of serialized values, bounded by their total size in bytes"""
+
+    name = 'memory'
+
+    def __init__(self, max_bytes=CACHE_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self.bytes = 0
+        self.evictions = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry[0] <= time.time():
+                self._discard(key)
+                return None
+            self._entries.move_to_end(key)
+            return entry[1]
+
+    def set(self, key, data, ttl):
+        with self._lock:
+            self._discard(key)
+            self._entries[key] = (time.time() + ttl, data)
+            self.bytes += len(data)
+            while self.bytes > self.max_bytes:
+                self._discard(next(iter(self._entries)))
+                self.evictions += 1
+
+    def delete_prefix(self, prefix):
+        with self._lock:
+            for key in [k for k in self._entries if k.startswith(prefix)]:
+                self._discard(key)
+
+    def _discard(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self.bytes -= len(entry[1])
+
+    def status(self):
+        with self._lock:
+            return {"entries": len(self._entries), "bytes": self.bytes,
+                    "max_bytes": self.max_bytes, "evictions": self.evictions}
+
+
+class SqliteBackend:
+    """SQLite file shared by every worker process on the host, evicting least recently read rows.
+
+    The total size and row count live in a meta row updated in the same
+    transaction as each write, so a write never scans the table. Reads are
+    plain SELECTs: their LRU touches are kept in memory and written out in
+    one batch with the next write, or once ``touch_batch`` have piled up.
+    """
+
+    name = 'sqlite'
+
+    def __init__(self, path=CACHE_PATH, max_bytes=CACHE_MAX_BYTES, touch_batch=CACHE_SQLITE_TOUCH_BATCH):
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.max_bytes = max_bytes
+        self.touch_batch = touch_batch
+        self.evictions = 0
+        self._touched = {}
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=5)
+        self._lock = threading.Lock()
+        with self._lock, self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS cache (
+                    key TEXT PRIMARY KEY,
+                    value BLOB NOT NULL,
+                    size INTEGER NOT NULL,
+                    expires_at REAL NOT NULL,
+                    accessed_at REAL NOT NULL
+                )""")
+            self._conn.execute("CREATE INDEX IF NOT EXISTS cache_accessed ON cache (accessed_at)")
+            self._conn.execute("CREATE INDEX IF NOT EXISTS cache_expires ON cache (expires_at)")
+            self._conn.execute("CREATE TABLE IF NOT EXISTS cache_meta (id INTEGER PRIMARY KEY CHECK (id = 0), "
+                               "bytes INTEGER NOT NULL, entries INTEGER NOT NULL)")
+            # Counted once for a file written before the totals were kept
+            self._conn.execute("INSERT OR IGNORE INTO cache_meta (id, bytes, entries) "
+                               "SELECT 0, COALESCE(SUM(size), 0), COUNT(*) FROM cache")
+
+    def get(self, key):
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute("SELECT value, expires_at, size FROM cache WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            if row[1] <= now:
+                with self._conn:
+                    self._conn.execute("DELETE FROM cache WHERE key = ?", (key,))
+                    self._adjust(-row[2], -1)
+                return None
+            self._touched[key] = now
+            if len(self._touched) >= self.touch_batch:
+                with self._conn:
+                    self._flush_touches()
+            return row[0]
+
+    def set(self, key, data, ttl):
+        now = time.time()
+        with self._lock, self._conn:
+            self._flush_touches()
+            old = self._conn.execute("SELECT size FROM cache WHERE key = ?", (key,)).fetchone()
+            self._conn.execute(
+                "INSERT OR REPLACE INTO cache (key, value, size, expires_at, accessed_at) VALUES (?, ?, ?, ?, ?)",
+                (key, data, len(data), now + ttl, now))
+            total = self._adjust(len(data) - (old[0] if old else 0), 0 if old else 1)
+            if total > self.max_bytes:
+                self._evict(total, now)
+
+    def _adjust(self, size, entries):
+        """Apply a change to the stored totals inside the caller's transaction; returns the new byte total"""
+        self._conn.execute("UPDATE cache_meta SET bytes = bytes + ?, entries = entries + ? WHERE id = 0",
+                           (size, entries))
+        return self._conn.execute("SELECT bytes FROM cache_meta WHERE id = 0").fetchone()[0]
+
+    def _flush_touches(self):
+        if self._touched:
+            self._conn.executemany("UPDATE cache SET accessed_at = ? WHERE key = ?",
+                                   [(at, key) for key, at in self._touched.items()])
+            self._touched = {}
+
+    def _evict(self, total, now):
+        # Down to 90% so the next writes do not each pay for an eviction pass
+        excess = total - self.max_bytes * 0.9
+        # Expired rows go first, then the least recently read until the table fits again
+        freed, count = self._conn.execute(
+            "SELECT COALESCE(SUM(size), 0), COUNT(*) FROM cache WHERE expires_at <= ?", (now,)).fetchone()
+        self._conn.execute("DELETE FROM cache WHERE expires_at <= ?", (now,))
+        excess -= freed
+        victims = []
+        for key, size in self._conn.execute("SELECT key, size FROM cache ORDER BY accessed_at"):
+            if excess <= 0:
+                break
+            victims.append((key,))
+            freed += size
+            excess -= size
+        self._conn.executemany("DELETE FROM cache WHERE key = ?", victims)
+        self._adjust(-freed, -count - len(victims))
+        self.evictions += len(victims)
+
+    def delete_prefix(self, prefix):
+        with self._lock, self._conn:
+            size, count = self._conn.execute(
+                "SELECT COALESCE(SUM(size), 0), COUNT(*) FROM cache WHERE substr(key, 1, ?) = ?",
+                (len(prefix), prefix)).fetchone()
+            self._conn.execute("DELETE FROM cache WHERE substr(key, 1, ?) = ?", (len(prefix), prefix))
+            self._adjust(-size, -count)
+            self._touched = {k: at for k, at in self._touched.items() if not k.startswith(prefix)}
+
+    def status(self):
+        with self._lock:
+            total, entries = self._conn.execute("SELECT bytes, entries FROM cache_meta WHERE id = 0").fetchone()
+        return {"entries": entries, "bytes": total, "max_bytes": self.max_bytes, "evictions": self.evictions}
+
+
+class RedisError(Exception):
+    pass
+
+
+class BackendUnavailable(RedisError):
+    """The server is marked down; raised without touching the network"""
+
+
+class RedisBackend:
+    """Minimal RESP client for GET/SET with expiry; one connection per thread.
+
+    The byte bound is the server's business: run Redis with ``maxmemory`` and
+    an ``allkeys-lru`` policy. After a connection or read failure every
+    command fails fast for ``retry`` seconds before the server is tried again.
+    """
+
+    name = 'redis'
+
+    def __init__(self, url=CACHE_REDIS_URL, timeout=CACHE_REDIS_TIMEOUT, retry=CACHE_REDIS_RETRY):
+        parsed = urlparse(url)
+        self.host = parsed.hostname or 'localhost'
+        self.port = parsed.port or 6379
+        self.password = parsed.password
+        self.db = int(parsed.path.lstrip('/') or 0)
+        self.timeout = timeout
+        self.retry = retry
+        self.failures = 0
+        self._down_until = 0.0
+        self._local = threading.local()
+
+    def _connect(self):
+        sock = socket.create_connection((self.host, self.port), timeout=self.timeout)
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self._local.sock = sock
+        self._local.reader = sock.makefile('rb')
+        if self.password:
+            self._call('AUTH', self.password)
+        if self.db:
+            self._call('SELECT', self.db)
+
+    def _close(self):
+        sock = getattr(self._local, 'sock', None)
+        if sock is not None:
+            sock.close()
+        self._local.sock = None
+
+    def command(self, *args):
+        if time.time() < self._down_until:
+            raise BackendUnavailable(f"redis at {self.host}:{self.port} is down; retrying in "
+                                     f"{self._down_until - time.time():.1f}s")
+        try:
+            if getattr(self._local, 'sock', None) is None:
+                self._connect()
+            return self._call(*args)
+        except OSError:
+            # Covers refused connections and read timeouts from a server that stopped answering
+            self._close()
+            self.failures += 1
+            self._down_until = time.time() + self.retry
+            raise
+        except RedisError:
+            # A desynchronized connection is reopened on the next command
+            self._close()
+            raise
+
+    def _call(self, *args):
+        parts = [f"*{len(args)}\r\n".encode()]
+        for arg in args:
+            data = arg if isinstance(arg, bytes) else str(arg).encode()
+            parts.append(b"$%d\r\n%s\r\n" % (len(data), data))
+        self._local.sock.sendall(b"".join(parts))
+        return self._reply()
+
+    def _reply(self):
+        line = self._local.reader.readline()
+        if not line.endswith(b"\r\n"):
+            raise ConnectionError("connection closed")
+        kind, body = line[:1], line[1:-2]
+        if kind == b'+':
+            return body.decode()
+        if kind == b'-':
+            raise RedisError(body.decode())
+        if kind == b':':
+            return int(body)
+        if kind == b'$':
+            length = int(body)
+            if length < 0:
+                return None
+            data = self._local.reader.read(length + 2)
+            return data[:-2]
+        if kind == b'*':
+            length = int(body)
+            return None if length < 0 else [self._reply() for _ in range(length)]
+        raise RedisError(f"unexpected reply {line!r}")
+
+    def get(self, key):
+        return self.command('GET', key)
+
+    def set(self, key, data, ttl):
+        self.command('SET', key, data, 'PX', max(int(ttl * 1000), 1))
+
+    def delete_prefix(self, prefix):
+        cursor = '0'
+        while True:
+            cursor, keys = self.command('SCAN', cursor, 'MATCH', prefix + '*', 'COUNT', 500)
+            cursor = cursor.decode() if isinstance(cursor, bytes) else cursor
+            if keys:
+                self.command('DEL', *keys)
+            if cursor == '0':
+                return
+
+    def status(self):
+        try:
+            return {"entries": self.command('DBSIZE'), "server": f"{self.host}:{self.port}/{self.db}",
+                    "failures": self.failures}
+        except (OSError, RedisError) as e:
+            return {"error": str(e), "server": f"{self.host}:{self.port}/{self.db}", "failures": self.failures}
+
+
+def make_backend(kind=CACHE_BACKEND):
+    if kind == 'memory':
+        return MemoryBackend()
+    if kind == 'sqlite':
+        return SqliteBackend()
+    if kind == 'redis':
+        return RedisBackend()
+    raise ValueError(f"Unknown CACHE_BACKEND '{kind}'; use memory, sqlite or redis")
+
+
+_backend = None
+_backend_lock = threading.Lock()
+
+def default_backend():
+    """The process-wide backend every Cache shares unless given its own"""
+    global _backend
+    with _backend_lock:
+        if _backend is None:
+            _backend = make_backend()
+        return _backend
+
+
+class Cache:
+    """JSON-serializable values under tuple keys in one namespace of a cache backend.
+
+    Backend failures are logged and treated as misses so an unreachable Redis
+    degrades to recomputing rather than failing requests.
+    """
+
+    def __init__(self, namespace, ttl, backend=None):
+        self.namespace = namespace
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.errors = 0
+        self.skipped = 0
+        self._backend = backend
+
+    @property
+    def backend(self):
+        if self._backend is None:
+            self._backend = default_backend()
+        return self._backend
+
+    def _key(self, key):
+        return f"{self.namespace}:{json.dumps(key, separators=(',', ':'))}"
+
+    def get(self, key, count_miss=True):
+        with metrics.timer(f"{self.namespace}_cache_lookup"):
+            try:
+                data = self.backend.get(self._key(key))
+            except BackendUnavailable:
+                self.errors += 1
+                data = None
+            except Exception as e:
+                self.errors += 1
+                print(f"Cache get failed ({self.backend.name}): {e}")
+                data = None
+            if data is None:
+                if count_miss:
+                    self.misses += 1
+                return None
+            self.hits += 1
+            return json.loads(data)
+
+    async def aget(self, key, count_miss=True):
+        """get() for async handlers; SQLite and Redis lookups run off the event loop"""
+        if self.backend.name == 'memory':
+            return self.get(key, count_miss)
+        return await asyncio.to_thread(self.get, key, count_miss)
+
+    def put(self, key, value, ttl=None):
+        data = json.dumps(value, separators=(',', ':')).encode()
+        if len(data) > CACHE_MAX_ITEM_BYTES:
+            self.skipped += 1
+            return
+        try:
+            self.backend.set(self._key(key), data, ttl or self.ttl)
+        except BackendUnavailable:
+            self.errors += 1
+        except Exception as e:
+            self.errors += 1
+            print(f"Cache put failed ({self.backend.name}): {e}")
+
+    def clear(self):
+        self.backend.delete_prefix(f"{self.namespace}:")
+
+    def status(self):
+        total = self.hits + self.misses
+        return {"backend": self.backend.name, "hits": self.hits, "misses": self.misses,
+                "hit_rate": round(self.hits / total, 3) if total else 0.0,
+                "errors": self.errors, "skipped": self.skipped, "store": self.backend.status()}
+
+    async def astatus(self):
+        if self.backend.name == 'memory':
+            return self.status()
+        return await asyncio.to_thread(self.status)
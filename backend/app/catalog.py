@@ -0,0 +1,209 @@
+import os
+import json
+import time
+import sqlite3
+import threading
+from datetime import date
+from app.gee import init_ee_once, is_initialized
+from app.pipeline import get_pipeline
+from app.aois import aoi_registry, NDVI_VIS
+from app.mapid_cache import MAPID_CACHE_TTL
+from app.ee_executor import submit_ee
+from app.scene_index import image_count, SCENE_INDEX_MAX_SYNC_CELLS
+
+# Precomputed monthly and seasonal composites per AOI
+CATALOG_PATH = os.getenv('CATALOG_PATH', '/tmp/ndvi-catalog.sqlite')
+CATALOG_ENABLED = os.getenv('CATALOG_ENABLED', 'false').lower() == 'true'
+# Seconds between scheduler passes, and months back from the current one that each pass covers
+CATALOG_INTERVAL = float(os.getenv('CATALOG_INTERVAL', 6 * 3600))
+CATALOG_MONTHS = int(os.getenv('CATALOG_MONTHS', 24))
+# Comma-separated AOIs the scheduler precomputes; empty means every registered AOI
+CATALOG_AOIS = [a for a in os.getenv('CATALOG_AOIS', '').split(',') if a]
+# Scenes keep arriving for a few days after a period ends; until then it is recomputed every pass
+CATALOG_SETTLE_DAYS = int(os.getenv('CATALOG_SETTLE_DAYS', 7))
+# Latency budget used to size the summary reduction, as for /aoi/{aoi_name}/summary
+CATALOG_SUMMARY_BUDGET = float(os.getenv('CATALOG_SUMMARY_BUDGET', 10))
+
+# Meteorological seasons; DJF is labelled with the year of its January
+SEASONS = {'DJF': 12, 'MAM': 3, 'JJA': 6, 'SON': 9}
+
+
+def _month_start(year, month):
+    return date(year + (month - 1) // 12, (month - 1) % 12 + 1, 1)
+
+def parse_period(period):
+    """Return (kind, start, end) for 'YYYY-MM' or 'YYYY-DJF|MAM|JJA|SON'; raises ValueError"""
+    try:
+        year, part = period.split('-')
+        year = int(year)
+        if part.upper() in SEASONS:
+            first = SEASONS[part.upper()]
+            start = _month_start(year - 1 if first == 12 else year, first)
+            return 'season', start, _month_start(start.year, start.month + 3)
+        month = int(part)
+        if len(part) == 2 and 1 <= month <= 12:
+            return 'month', date(year, month, 1), _month_start(year, month + 1)
+    except ValueError:
+        pass
+    raise ValueError(f"Unknown period '{period}'; use YYYY-MM or YYYY-DJF|MAM|JJA|SON")
+
+def season_of(day):
+    if day.month in (12, 1, 2):
+        return f"{day.year + (day.month == 12):04d}-DJF"
+    first = day.month // 3 * 3
+    return f"{day.year:04d}-{next(name for name, month in SEASONS.items() if month == first)}"
+
+def recent_periods(today, months=CATALOG_MONTHS):
+    """Months from `months` back through the current one, then the seasons that overlap them, newest first"""
+    starts = [_month_start(today.year, today.month - back) for back in range(months + 1)]
+    seasons = list(dict.fromkeys(season_of(start) for start in starts))
+    return [f"{start.year:04d}-{start.month:02d}" for start in starts] + seasons
+
+def is_settled(end, today):
+    return (today - end).days >= CATALOG_SETTLE_DAYS
+
+
+def build_entry(aoi, period, max_sync=SCENE_INDEX_MAX_SYNC_CELLS):
+    """Compute one period's median NDVI map ID, image count and AOI summary for an AOI.
+
+    max_sync bounds the scene index cells synced for the count; None syncs them all.
+    """
+    from app import aoi_summary
+    init_ee_once()
+    kind, start, end = parse_period(period)
+    pipeline = get_pipeline(aoi["spec"], start.isoformat(), end.isoformat())
+    entry = {"aoi": aoi["id"], "version": aoi["version"], "period": period, "kind": kind,
+             "start": start.isoformat(), "end": end.isoformat(), "mapid": None, "mapid_at": None,
+             "image_count": image_count(pipeline, max_sync), "summary": None}
+    if entry["image_count"]:
+        image = pipeline.ndvi.median().clip(pipeline.geometry)
+        entry["mapid"] = image.getMapId(NDVI_VIS)["mapid"]
+        entry["mapid_at"] = time.time()
+        plan = aoi_summary.plan(aoi["bounds"], CATALOG_SUMMARY_BUDGET)
+        entry["summary"] = {**aoi_summary.summarize(image, aoi["bounds"], plan["scale"], plan["grid"]),
+                            "scale": plan["scale"]}
+    return entry
+
+def refresh_mapid(aoi, entry):
+    """Rebuild an expired map ID; the image count and summary of the period are kept"""
+    init_ee_once()
+    pipeline = get_pipeline(aoi["spec"], entry["start"], entry["end"])
+    mapid = pipeline.ndvi.median().clip(pipeline.geometry).getMapId(NDVI_VIS)["mapid"]
+    return {**entry, "mapid": mapid, "mapid_at": time.time()}
+
+def mapid_expired(entry):
+    return entry["mapid"] is not None and time.time() - entry["mapid_at"] >= MAPID_CACHE_TTL
+
+
+class Catalog:
+    """SQLite catalog of per-AOI period composites, keyed by AOI id, geometry version and period"""
+
+    def __init__(self, path=CATALOG_PATH):
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._lock = threading.Lock()
+        with self._lock, self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS composites (
+                    aoi TEXT NOT NULL,
+                    version TEXT NOT NULL,
+                    period TEXT NOT NULL,
+                    entry TEXT NOT NULL,
+                    computed_at REAL NOT NULL,
+                    PRIMARY KEY (aoi, version, period)
+                )""")
+
+    def get(self, aoi, period):
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT entry, computed_at FROM composites WHERE aoi = ? AND version = ? AND period = ?",
+                (aoi["id"], aoi["version"], period)).fetchone()
+        return {**json.loads(row[0]), "computed_at": row[1]} if row else None
+
+    def put(self, entry, computed_at=None):
+        entry = {k: v for k, v in entry.items() if k != "computed_at"}
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO composites (aoi, version, period, entry, computed_at) VALUES (?, ?, ?, ?, ?)",
+                (entry["aoi"], entry["version"], entry["period"], json.dumps(entry), computed_at or time.time()))
+
+    def list(self, aoi):
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT entry, computed_at FROM composites WHERE aoi = ? AND version = ? ORDER BY period DESC",
+                (aoi["id"], aoi["version"])).fetchall()
+        return [{**json.loads(entry), "computed_at": computed_at} for entry, computed_at in rows]
+
+    def count(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM composites").fetchone()[0]
+
+
+class CatalogScheduler:
+    """Background thread filling the catalog for recent periods of every AOI.
+
+    Each pass computes periods that are missing, plus periods that had not
+    settled when they were last computed. Entries are built one at a time on
+    the jobs lane, so the scheduler never takes a request lane's EE slot.
+    """
+
+    def __init__(self, catalog, interval=CATALOG_INTERVAL):
+        self.catalog = catalog
+        self.interval = interval
+        self.passes = 0
+        self.computed = 0
+        self.errors = 0
+        self.last_pass = None
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._loop, name='catalog', daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def _loop(self):
+        while not self._stop.is_set():
+            init_ee_once()
+            if is_initialized():
+                self.run_pass()
+            if self._stop.wait(self.interval if is_initialized() else 60):
+                return
+
+    def run_pass(self, today=None):
+        today = today or date.today()
+        for aoi_id in CATALOG_AOIS or aoi_registry.keys():
+            for period in recent_periods(today):
+                if self._stop.is_set():
+                    return
+                if aoi_id not in aoi_registry:
+                    break
+                aoi = aoi_registry[aoi_id]
+                entry = self.catalog.get(aoi, period)
+                if entry is not None and is_settled(date.fromisoformat(entry["end"]),
+                                                    date.fromtimestamp(entry["computed_at"])):
+                    continue
+                if entry is not None and time.time() - entry["computed_at"] < self.interval / 2:
+                    continue
+                try:
+                    # Off the request path, so the scene index may sync every cell of a large AOI
+                    self.catalog.put(submit_ee("jobs", build_entry, aoi, period, None).result())
+                    self.computed += 1
+                except Exception as e:
+                    self.errors += 1
+                    print(f"Catalog entry {aoi_id} {period} failed: {e}")
+        self.passes += 1
+        self.last_pass = time.time()
+
+    def status(self):
+        return {"enabled": CATALOG_ENABLED, "entries": self.catalog.count(), "passes": self.passes,
+                "computed": self.computed, "errors": self.errors, "last_pass": self.last_pass}
+
+
+catalog = Catalog()
+catalog_scheduler = CatalogScheduler(catalog)
@@ -0,0 +1,137 @@
+import os
+import json
+import time
+import shutil
+import tempfile
+import warnings
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import numpy as np
+from app.local_engine import DataCube, cube_path
+
+# Where composite rasters are written
+COMPOSITE_DIR = os.getenv('COMPOSITE_DIR', '/tmp/ndvi-composites')
+COMPOSITE_WORKERS = int(os.getenv('COMPOSITE_WORKERS', os.cpu_count() or 2))
+# Memory each worker may use for one chunk's NDVI stack and its temporaries
+COMPOSITE_WORKER_MEMORY = int(os.getenv('COMPOSITE_WORKER_MEMORY', 256 * 1024 * 1024))
+COMPOSITE_MAX_CHUNK = int(os.getenv('COMPOSITE_MAX_CHUNK', 1024))
+
+
+def chunk_size(time_steps, memory=COMPOSITE_WORKER_MEMORY, max_chunk=COMPOSITE_MAX_CHUNK):
+    """Side of the square spatial chunk whose float32 stack (plus ~3x temporaries) fits in memory"""
+    per_pixel = max(time_steps, 1) * 4 * 4
+    side = int((memory / per_pixel) ** 0.5)
+    return max(16, min(side, max_chunk))
+
+def chunks(height, width, size):
+    return [(r, min(r + size, height), c, min(c + size, width))
+            for r in range(0, height, size)
+            for c in range(0, width, size)]
+
+
+def _composite_chunk(cube_dir, out_dir, t_start, t_stop, percentiles, block):
+    """Worker: reduce one spatial chunk of the cube and write it into the output raster"""
+    r0, r1, c0, c1 = block
+    cube = DataCube(cube_dir)
+    stack = cube.ndvi(slice(t_start, t_stop), slice(r0, r1), slice(c0, c1))
+    with warnings.catch_warnings():
+        # Pixels that were never clear reduce to NaN
+        warnings.simplefilter('ignore', RuntimeWarning)
+        if stack.shape[0] == 0:
+            result = np.full((len(percentiles), r1 - r0, c1 - c0), np.nan, dtype=np.float32)
+        else:
+            result = np.nanpercentile(stack, percentiles, axis=0).astype(np.float32)
+        valid = np.sum(~np.isnan(stack), axis=0, dtype=np.uint16)
+    out = open_composite(out_dir, mode='r+')
+    out['ndvi'][:, r0:r1, c0:c1] = result
+    out['count'][r0:r1, c0:c1] = valid
+    out['ndvi'].flush()
+    out['count'].flush()
+    return block
+
+
+def open_composite(out_dir, mode='r'):
+    """Open a composite raster: 'ndvi' is (percentile, y, x) float32 and 'count' is (y, x) uint16"""
+    with open(os.path.join(out_dir, 'meta.json')) as f:
+        meta = json.load(f)
+    bands, height, width = meta['shape']
+    return {
+        'meta': meta,
+        'ndvi': np.memmap(os.path.join(out_dir, 'ndvi.f32'), dtype=np.float32, mode=mode, shape=(bands, height, width)),
+        'count': np.memmap(os.path.join(out_dir, 'count.u16'), dtype=np.uint16, mode=mode, shape=(height, width)),
+    }
+
+
+def build_composite(aoi_name, start, end, percentiles=(50,), workers=COMPOSITE_WORKERS, progress=None):
+    """Compute per-pixel NDVI percentiles for an AOI's local cube over [start, end).
+
+    The cube is split into square chunks sized so a worker's stack stays
+    within COMPOSITE_WORKER_MEMORY, and the chunks are reduced in a process
+    pool that writes straight into a memory-mapped raster on disk. Neither
+    the input nor the output is ever held in memory as a whole.
+    progress(done, total) is called as chunks finish. The raster is written to
+    a private directory and renamed into place when complete, so concurrent
+    identical builds never write into each other's files.
+    """
+    cube_dir = cube_path(aoi_name)
+    cube = DataCube(cube_dir)
+    t = cube.time_slice(start, end)
+    _, height, width = cube.shape
+    percentiles = [float(p) for p in percentiles]
+    size = chunk_size(t.stop - t.start)
+    blocks = chunks(height, width, size)
+
+    name = f"{aoi_name}_{start}_{end}_p{'-'.join(f'{p:g}' for p in percentiles)}"
+    out_dir = os.path.join(COMPOSITE_DIR, name)
+    os.makedirs(COMPOSITE_DIR, exist_ok=True)
+    tmp_dir = tempfile.mkdtemp(prefix=f"{name}.", suffix='.tmp', dir=COMPOSITE_DIR)
+    meta = {
+        'aoi': aoi_name,
+        'bounds': cube.bounds,
+        'date_range': {'start': start, 'end': end},
+        'image_count': t.stop - t.start,
+        'percentiles': percentiles,
+        'shape': [len(percentiles), height, width],
+        'chunk': size,
+    }
+    started = time.time()
+    try:
+        with open(os.path.join(tmp_dir, 'meta.json'), 'w') as f:
+            json.dump(meta, f)
+        np.memmap(os.path.join(tmp_dir, 'ndvi.f32'), dtype=np.float32, mode='w+',
+                  shape=(len(percentiles), height, width)).flush()
+        np.memmap(os.path.join(tmp_dir, 'count.u16'), dtype=np.uint16, mode='w+', shape=(height, width)).flush()
+
+        # spawn keeps the web server's threads and sockets out of the workers
+        context = multiprocessing.get_context('spawn')
+        with ProcessPoolExecutor(max_workers=min(workers, len(blocks)), mp_context=context) as pool:
+            futures = [pool.submit(_composite_chunk, cube_dir, tmp_dir, t.start, t.stop, percentiles, block)
+                       for block in blocks]
+            for done, future in enumerate(as_completed(futures), 1):
+                future.result()
+                if progress:
+                    progress(done, len(blocks))
+        _replace_dir(tmp_dir, out_dir)
+    except BaseException:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        raise
+    meta['seconds'] = round(time.time() - started, 2)
+    meta['path'] = out_dir
+    meta['chunks'] = len(blocks)
+    return meta
+
+def _replace_dir(tmp_dir, out_dir):
+    """Move a finished raster into place, replacing an earlier build of the same composite"""
+    old_dir = None
+    if os.path.exists(out_dir):
+        old_dir = tempfile.mkdtemp(prefix=os.path.basename(out_dir) + '.', suffix='.old', dir=os.path.dirname(out_dir))
+        os.rename(out_dir, os.path.join(old_dir, 'raster'))
+    try:
+        os.rename(tmp_dir, out_dir)
+    except OSError:
+        # An identical build moved its raster into place in between; keep that one
+        if not os.path.isdir(out_dir):
+            raise
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+    if old_dir:
+        shutil.rmtree(old_dir, ignore_errors=True)
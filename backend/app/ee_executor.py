@@ -0,0 +1,121 @@
+import os
+import time
+import asyncio
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+from app import metrics
+
+# Concurrency limits per lane: interactive (point clicks) and heavy (AOI composites, batches)
+EE_INTERACTIVE_LIMIT = int(os.getenv('EE_INTERACTIVE_LIMIT', 8))
+EE_HEAVY_LIMIT = int(os.getenv('EE_HEAVY_LIMIT', 4))
+EE_INTERACTIVE_TIMEOUT = float(os.getenv('EE_INTERACTIVE_TIMEOUT', 30))
+EE_HEAVY_TIMEOUT = float(os.getenv('EE_HEAVY_TIMEOUT', 120))
+EE_INTERACTIVE_MAX_QUEUE = int(os.getenv('EE_INTERACTIVE_MAX_QUEUE', 32))
+EE_HEAVY_MAX_QUEUE = int(os.getenv('EE_HEAVY_MAX_QUEUE', 8))
+# Upstream tile fetches for the tile proxy
+EE_TILE_LIMIT = int(os.getenv('EE_TILE_LIMIT', 16))
+EE_TILE_TIMEOUT = float(os.getenv('EE_TILE_TIMEOUT', 20))
+EE_TILE_MAX_QUEUE = int(os.getenv('EE_TILE_MAX_QUEUE', 128))
+# Background jobs get their own slots so they never hold up the request lanes
+EE_JOBS_LIMIT = int(os.getenv('EE_JOBS_LIMIT', 4))
+EE_JOBS_TIMEOUT = float(os.getenv('EE_JOBS_TIMEOUT', 600))
+EE_JOBS_MAX_QUEUE = int(os.getenv('EE_JOBS_MAX_QUEUE', 256))
+# Defaults to one thread per lane slot so a full heavy lane never blocks interactive work
+EE_WORKERS = int(os.getenv('EE_WORKERS', EE_INTERACTIVE_LIMIT + EE_HEAVY_LIMIT + EE_TILE_LIMIT + EE_JOBS_LIMIT))
+
+_executor = ThreadPoolExecutor(max_workers=EE_WORKERS, thread_name_prefix='ee')
+# The serving event loop, recorded by run_ee so other threads can queue lane calls onto it
+_loop = None
+
+
+class Overloaded(Exception):
+    """Raised when a lane cannot start a call within its time budget"""
+
+
+class Lane:
+    """Bounded concurrency for one class of EE calls.
+
+    Calls beyond ``limit`` wait in a queue of at most ``max_queue``. A call is
+    rejected up front when the queue is full, or when the expected wait
+    (queue depth times the recent average call duration) already exceeds its
+    timeout; otherwise it gets whatever is left of the timeout once it starts.
+    """
+
+    def __init__(self, name, limit, timeout, max_queue):
+        self.name = name
+        self.limit = limit
+        self.timeout = timeout
+        self.max_queue = max_queue
+        self.waiting = 0
+        self.active = 0
+        self.avg_duration = 1.0
+        self._semaphore = asyncio.Semaphore(limit)
+
+    def expected_wait(self):
+        if self.active < self.limit:
+            return 0.0
+        return (self.waiting + 1) / self.limit * self.avg_duration
+
+    async def run(self, fn, *args):
+        if self.waiting >= self.max_queue:
+            raise Overloaded(f"{self.name} queue is full ({self.waiting} waiting)")
+        if self.expected_wait() > self.timeout:
+            raise Overloaded(f"{self.name} expected wait {self.expected_wait():.1f}s exceeds {self.timeout:.0f}s")
+        deadline = time.monotonic() + self.timeout
+        queued = time.perf_counter()
+        self.waiting += 1
+        try:
+            await asyncio.wait_for(self._semaphore.acquire(), self.timeout)
+        except asyncio.TimeoutError:
+            raise Overloaded(f"{self.name} call waited more than {self.timeout:.0f}s to start")
+        finally:
+            self.waiting -= 1
+
+        metrics.observe(f"{self.name}_queue_wait", time.perf_counter() - queued)
+        loop = asyncio.get_running_loop()
+        started = time.monotonic()
+        self.active += 1
+        # Carry the request's metrics context into the worker thread
+        future = _executor.submit(contextvars.copy_context().run, fn, *args)
+
+        def done(_):
+            # Free the slot only when the worker thread is actually done
+            def release():
+                self.active -= 1
+                duration = time.monotonic() - started
+                self.avg_duration = 0.8 * self.avg_duration + 0.2 * duration
+                self._semaphore.release()
+            loop.call_soon_threadsafe(release)
+
+        future.add_done_callback(done)
+        try:
+            return await asyncio.wait_for(asyncio.wrap_future(future), max(deadline - time.monotonic(), 0.1))
+        except asyncio.TimeoutError:
+            raise Overloaded(f"{self.name} call exceeded {self.timeout:.0f}s")
+
+    def status(self):
+        return {"limit": self.limit, "active": self.active, "waiting": self.waiting,
+                "avg_duration": round(self.avg_duration, 3)}
+
+
+lanes = {
+    "interactive": Lane("interactive", EE_INTERACTIVE_LIMIT, EE_INTERACTIVE_TIMEOUT, EE_INTERACTIVE_MAX_QUEUE),
+    "heavy": Lane("heavy", EE_HEAVY_LIMIT, EE_HEAVY_TIMEOUT, EE_HEAVY_MAX_QUEUE),
+    "tiles": Lane("tiles", EE_TILE_LIMIT, EE_TILE_TIMEOUT, EE_TILE_MAX_QUEUE),
+    "jobs": Lane("jobs", EE_JOBS_LIMIT, EE_JOBS_TIMEOUT, EE_JOBS_MAX_QUEUE),
+}
+
+
+async def run_ee(lane, fn, *args):
+    """Run a blocking EE function on the dedicated executor under the given lane's limits"""
+    global _loop
+    _loop = asyncio.get_running_loop()
+    return await lanes[lane].run(fn, *args)
+
+
+def submit_ee(lane, fn, *args):
+    """Queue a blocking EE function on a lane from any thread without waiting; returns a concurrent Future"""
+    if _loop is None or _loop.is_closed():
+        # Nothing has been served yet, so there is no lane traffic to queue behind
+        return _executor.submit(fn, *args)
+    return asyncio.run_coroutine_threadsafe(run_ee(lane, fn, *args), _loop)
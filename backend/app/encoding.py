@@ -0,0 +1,104 @@
+import json
+from importlib.util import find_spec
+from fastapi.responses import Response, JSONResponse
+from app import metrics
+
+# Binary formats are optional; without the library the media type is simply not offered.
+# They are only looked up here and imported on first use, which keeps pyarrow and numpy out of start-up.
+_HAS_ARROW = find_spec('pyarrow') is not None
+_HAS_MSGPACK = find_spec('msgpack') is not None
+
+JSON = 'application/json'
+ARROW = 'application/vnd.apache.arrow.stream'
+MSGPACK = 'application/msgpack'
+_ALIASES = {'application/x-msgpack': MSGPACK, 'application/vnd.msgpack': MSGPACK}
+_WILDCARDS = ('*/*', 'application/*')
+
+
+class NotAcceptable(Exception):
+    """No media type in the Accept header can be produced"""
+    pass
+
+
+def available():
+    return [JSON] + ([ARROW] if _HAS_ARROW else []) + ([MSGPACK] if _HAS_MSGPACK else [])
+
+def negotiate(accept):
+    """Pick the response media type for an Accept header, highest q first; JSON when unspecified"""
+    if not accept:
+        return JSON
+    ranges = []
+    for order, part in enumerate(accept.split(',')):
+        fields = [f.strip() for f in part.split(';')]
+        media = fields[0].lower()
+        q = 1.0
+        for param in fields[1:]:
+            if param.startswith('q='):
+                try:
+                    q = float(param[2:])
+                except ValueError:
+                    q = 0.0
+        if q > 0:
+            ranges.append((-q, order, _ALIASES.get(media, media)))
+    offered = available()
+    for _, _, media in sorted(ranges):
+        if media in offered:
+            return media
+        if media in _WILDCARDS:
+            return JSON
+    raise NotAcceptable(f"Cannot produce {accept}; available: {', '.join(offered)}")
+
+
+def to_arrays(columns):
+    """Build numpy columns from {name: (values, kind)}; kind 'date' becomes int64 days since 1970-01-01"""
+    import numpy as np
+    arrays = {}
+    for name, (values, kind) in columns.items():
+        if kind == 'date':
+            arrays[name] = np.array(values, dtype='datetime64[D]').astype(np.int64)
+        elif kind.startswith('float'):
+            arrays[name] = np.array([np.nan if v is None else v for v in values], dtype=kind)
+        else:
+            arrays[name] = np.array(values, dtype=kind)
+    return arrays
+
+
+class TimedJSONResponse(JSONResponse):
+    """Default response class; times JSON rendering as the serialization stage"""
+
+    def render(self, content):
+        with metrics.timer("serialization"):
+            return super().render(content)
+
+
+def encode(media, columns, meta):
+    """Serialize one columnar table plus JSON-able metadata as Arrow IPC or MessagePack"""
+    with metrics.timer("serialization"):
+        return _encode(media, columns, meta)
+
+def _encode(media, columns, meta):
+    arrays = to_arrays(columns)
+    if media == ARROW:
+        import pyarrow as pa
+        batch = pa.record_batch([pa.array(a) for a in arrays.values()], names=list(arrays))
+        schema = batch.schema.with_metadata({'meta': json.dumps(meta)})
+        sink = pa.BufferOutputStream()
+        with pa.ipc.new_stream(sink, schema) as writer:
+            writer.write_batch(batch.replace_schema_metadata(schema.metadata))
+        return sink.getvalue().to_pybytes()
+    if media == MSGPACK:
+        import msgpack
+        # Raw little-endian buffers decode without copying via np.frombuffer(buf, dtype)
+        return msgpack.packb({
+            'columns': {name: a.tobytes() for name, a in arrays.items()},
+            'dtypes': {name: a.dtype.str for name, a in arrays.items()},
+            'meta': meta
+        })
+    raise NotAcceptable(media)
+
+def respond(media, result, to_table):
+    """Return result as JSON, or encode it with to_table(result) -> (columns, meta); errors stay JSON"""
+    if media == JSON or not isinstance(result, dict) or 'error' in result:
+        return result
+    columns, meta = to_table(result)
+    return Response(content=encode(media, columns, meta), media_type=media)
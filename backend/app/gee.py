@@ -0,0 +1,93 @@
+import os
+import json
+import threading
+from datetime import datetime, timedelta
+from app.token_manager import token_manager, SCOPES
+from app import metrics
+
+# Read configuration from environment variables
+project_id = os.getenv('EE_PROJECT_ID') or os.getenv('GCP_PROJECT') or 'gee-assignment-469904'
+service_account_key_file = os.getenv('GOOGLE_APPLICATION_CREDENTIALS') or os.getenv('SERVICE_ACCOUNT_FILE') or 'E:\\gee_assignment_key.json'
+service_account_key_json = os.getenv('GOOGLE_APPLICATION_CREDENTIALS_JSON')
+
+CLOUD_THRESHOLD = 20
+
+# EE initialization state; done at startup, or lazily by the first request
+_credentials = None
+_ee_initialized = False
+_init_error = None
+_init_lock = threading.Lock()
+
+def init_ee_once():
+    if _ee_initialized:
+        return
+    # Startup warm-up and early requests may race to initialize
+    with _init_lock:
+        if not _ee_initialized:
+            _init_ee()
+
+def _init_ee():
+    global _credentials, _ee_initialized, _init_error
+    # Imported here: loading the EE client is the slowest part of starting the app
+    import ee
+    import google.oauth2.service_account as service_account
+    metrics.instrument_ee()
+    try:
+        # Prefer JSON from env if provided (Cloud Run secret as env)
+        if service_account_key_json and service_account_key_json.strip().startswith('{'):
+            info = json.loads(service_account_key_json)
+            _credentials = service_account.Credentials.from_service_account_info(
+                info,
+                scopes=SCOPES
+            )
+        # Otherwise try file path
+        elif service_account_key_file and os.path.exists(service_account_key_file):
+            _credentials = service_account.Credentials.from_service_account_file(
+                service_account_key_file,
+                scopes=SCOPES
+            )
+        # Else rely on default ADC (Cloud Run service account)
+        if _credentials is not None:
+            ee.Initialize(_credentials, project=project_id)
+        else:
+            ee.Initialize(project=project_id)
+        _ee_initialized = True
+        _init_error = None
+        print("EE initialized")
+    except Exception as e:
+        _init_error = str(e)
+        print(f"EE init failed: {e}")
+        # Do not crash; endpoints will report errors
+        return
+    try:
+        # Keep the tile access token fresh in the background (ADC when no key is configured)
+        token_manager.start(_credentials)
+    except Exception as e:
+        print(f"Token manager start failed: {e}")
+
+def is_initialized():
+    return _ee_initialized
+
+def init_error():
+    """Message of the last failed initialization, or None"""
+    return _init_error
+
+def get_access_token():
+    """Return a valid OAuth access token for tile requests"""
+    return token_manager.get_token()
+
+def date_window(days):
+    """Return (today, start) as datetimes snapped to midnight"""
+    today = datetime.combine(datetime.now().date(), datetime.min.time())
+    return today, today - timedelta(days=days)
+
+def month_windows(start, end, months=1):
+    """Split [start, end) ('YYYY-MM-DD' strings) into consecutive windows of whole calendar months"""
+    windows = []
+    current = start
+    while current < end:
+        year, month = int(current[:4]), int(current[5:7]) - 1 + months
+        boundary = f"{year + month // 12:04d}-{month % 12 + 1:02d}-01"
+        windows.append((current, min(boundary, end)))
+        current = boundary
+    return windows
@@ -0,0 +1,218 @@
+import math
+
+
+def polygons(geometry):
+    """Return a GeoJSON Polygon or MultiPolygon as a list of polygons, each a list of rings"""
+    if geometry["type"] == "Polygon":
+        return [geometry["coordinates"]]
+    return geometry["coordinates"]
+
+def validate(geometry):
+    """Check a GeoJSON Polygon/MultiPolygon (or a Feature holding one) and return it with closed rings.
+
+    Raises ValueError describing the first problem found.
+    """
+    if not isinstance(geometry, dict):
+        raise ValueError("geometry must be a GeoJSON object")
+    if geometry.get("type") == "Feature":
+        geometry = geometry.get("geometry") or {}
+    kind = geometry.get("type")
+    if kind not in ("Polygon", "MultiPolygon"):
+        raise ValueError(f"geometry type must be Polygon or MultiPolygon, got {kind}")
+    coordinates = geometry.get("coordinates")
+    parts = [coordinates] if kind == "Polygon" else coordinates
+    if not isinstance(parts, list) or not parts:
+        raise ValueError("geometry has no coordinates")
+    closed = []
+    for polygon in parts:
+        if not isinstance(polygon, list) or not polygon:
+            raise ValueError("each polygon needs at least an outer ring")
+        rings = []
+        for ring in polygon:
+            try:
+                ring = [[float(p[0]), float(p[1])] for p in ring]
+            except (TypeError, ValueError, IndexError):
+                raise ValueError("positions must be [lng, lat] numbers")
+            for lng, lat in ring:
+                if not (-180 <= lng <= 180 and -90 <= lat <= 90):
+                    raise ValueError(f"position [{lng}, {lat}] is outside lng/lat bounds")
+            if ring and ring[0] != ring[-1]:
+                ring.append(ring[0])
+            if len(ring) < 4:
+                raise ValueError("rings need at least 3 distinct positions")
+            rings.append(ring)
+        closed.append(rings)
+    return {"type": kind, "coordinates": closed[0] if kind == "Polygon" else closed}
+
+def bbox(geometry):
+    """[west, south, east, north] of a Polygon or MultiPolygon"""
+    xs = [p[0] for polygon in polygons(geometry) for p in polygon[0]]
+    ys = [p[1] for polygon in polygons(geometry) for p in polygon[0]]
+    return [min(xs), min(ys), max(xs), max(ys)]
+
+def vertex_count(geometry):
+    return sum(len(ring) for polygon in polygons(geometry) for ring in polygon)
+
+def rectangle(bounds):
+    west, south, east, north = bounds
+    return {"type": "Polygon",
+            "coordinates": [[[west, south], [east, south], [east, north], [west, north], [west, south]]]}
+
+
+def _in_ring(ring, x, y):
+    # Even-odd ray casting towards +x
+    inside = False
+    for (x1, y1), (x2, y2) in zip(ring, ring[1:]):
+        if (y1 > y) != (y2 > y) and x < x1 + (y - y1) * (x2 - x1) / (y2 - y1):
+            inside = not inside
+    return inside
+
+def contains(geometry, lng, lat):
+    """True if the point lies inside an outer ring and outside that polygon's holes"""
+    for polygon in polygons(geometry):
+        if _in_ring(polygon[0], lng, lat) and not any(_in_ring(hole, lng, lat) for hole in polygon[1:]):
+            return True
+    return False
+
+
+def _orientation(a, b, c):
+    value = (b[0] - a[0]) * (c[1] - a[1]) - (b[1] - a[1]) * (c[0] - a[0])
+    return (value > 0) - (value < 0)
+
+def _segments_cross(p1, p2, q1, q2):
+    # Proper crossings only; touching endpoints are caught by the containment tests
+    return (_orientation(p1, p2, q1) * _orientation(p1, p2, q2) < 0
+            and _orientation(q1, q2, p1) * _orientation(q1, q2, p2) < 0)
+
+def intersects_bbox(geometry, bounds):
+    """True if a Polygon or MultiPolygon overlaps the [west, south, east, north] rectangle"""
+    west, south, east, north = bounds
+    box = bbox(geometry)
+    if box[0] > east or box[2] < west or box[1] > north or box[3] < south:
+        return False
+    corners = [(west, south), (east, south), (east, north), (west, north)]
+    edges = list(zip(corners, corners[1:] + corners[:1]))
+    for polygon in polygons(geometry):
+        ring = polygon[0]
+        if any(west <= x <= east and south <= y <= north for x, y in ring):
+            return True
+        if any(_in_ring(ring, x, y) for x, y in corners):
+            return True
+        for a, b in zip(ring, ring[1:]):
+            if any(_segments_cross(a, b, c, d) for c, d in edges):
+                return True
+    return False
+
+
+def _edges(ring, bounds):
+    """Edges of a ring whose bounding boxes overlap the [west, south, east, north] rectangle"""
+    west, south, east, north = bounds
+    return [(a, b) for a, b in zip(ring, ring[1:])
+            if min(a[0], b[0]) <= east and max(a[0], b[0]) >= west
+            and min(a[1], b[1]) <= north and max(a[1], b[1]) >= south]
+
+def intersects(a, b):
+    """True if two Polygons or MultiPolygons overlap; holes are ignored, so this can only overcount"""
+    box_a, box_b = bbox(a), bbox(b)
+    if box_a[0] > box_b[2] or box_a[2] < box_b[0] or box_a[1] > box_b[3] or box_a[3] < box_b[1]:
+        return False
+    for ring_a in (polygon[0] for polygon in polygons(a)):
+        for ring_b in (polygon[0] for polygon in polygons(b)):
+            edges_b = _edges(ring_b, box_a)
+            for p1, p2 in _edges(ring_a, box_b):
+                if any(_segments_cross(p1, p2, q1, q2) for q1, q2 in edges_b):
+                    return True
+            # Without crossing edges the rings overlap only if one lies inside the other
+            if _in_ring(ring_b, *ring_a[0]) or _in_ring(ring_a, *ring_b[0]):
+                return True
+    return False
+
+
+def _distance(p, a, b):
+    dx, dy = b[0] - a[0], b[1] - a[1]
+    if dx == 0 and dy == 0:
+        return math.hypot(p[0] - a[0], p[1] - a[1])
+    return abs(dy * p[0] - dx * p[1] + b[0] * a[1] - b[1] * a[0]) / math.hypot(dx, dy)
+
+def _simplify_line(points, tolerance):
+    """Douglas-Peucker on an open polyline, iteratively so long rings cannot hit the recursion limit"""
+    keep = [False] * len(points)
+    keep[0] = keep[-1] = True
+    stack = [(0, len(points) - 1)]
+    while stack:
+        first, last = stack.pop()
+        index, worst = None, tolerance
+        for i in range(first + 1, last):
+            d = _distance(points[i], points[first], points[last])
+            if d > worst:
+                index, worst = i, d
+        if index is not None:
+            keep[index] = True
+            stack.append((first, index))
+            stack.append((index, last))
+    return [p for p, k in zip(points, keep) if k]
+
+def _simplify_ring(ring, tolerance):
+    # A closed ring has no baseline of its own: split it at the vertex farthest from the start
+    far = max(range(len(ring) - 1), key=lambda i: math.hypot(ring[i][0] - ring[0][0], ring[i][1] - ring[0][1]))
+    simplified = _simplify_line(ring[:far + 1], tolerance)[:-1] + _simplify_line(ring[far:], tolerance)
+    # Rings that would collapse below a triangle keep their original shape
+    return simplified if len(simplified) >= 4 else ring
+
+def simplify(geometry, tolerance, precision=6):
+    """Douglas-Peucker simplified copy with coordinates rounded to precision decimals"""
+    parts = [[[[round(x, precision), round(y, precision)] for x, y in _simplify_ring(ring, tolerance)]
+              for ring in polygon] for polygon in polygons(geometry)]
+    return {"type": geometry["type"], "coordinates": parts[0] if geometry["type"] == "Polygon" else parts}
+
+
+class STRTree:
+    """Static R-tree bulk-loaded with Sort-Tile-Recursive packing.
+
+    Items are (bbox, value) with bbox as [west, south, east, north]. Point
+    queries descend only into nodes whose box contains the point, so a lookup
+    touches O(log n) nodes for non-overlapping boxes. Rebuild it when items
+    change; packing n items costs O(n log n).
+    """
+
+    def __init__(self, items, node_size=16):
+        self.node_size = node_size
+        self.size = len(items)
+        level = [(tuple(box), value, True) for box, value in items]
+        while len(level) > node_size:
+            level = self._pack(level)
+        self.root = (self._union(level), level, False) if level else None
+
+    def _pack(self, entries):
+        count = math.ceil(len(entries) / self.node_size)
+        slices = math.ceil(math.sqrt(count))
+        per_slice = slices * self.node_size
+        entries = sorted(entries, key=lambda e: e[0][0] + e[0][2])
+        nodes = []
+        for s in range(0, len(entries), per_slice):
+            column = sorted(entries[s:s + per_slice], key=lambda e: e[0][1] + e[0][3])
+            for n in range(0, len(column), self.node_size):
+                children = column[n:n + self.node_size]
+                nodes.append((self._union(children), children, False))
+        return nodes
+
+    @staticmethod
+    def _union(entries):
+        return (min(e[0][0] for e in entries), min(e[0][1] for e in entries),
+                max(e[0][2] for e in entries), max(e[0][3] for e in entries))
+
+    def query_point(self, x, y):
+        """Values whose bounding box contains (x, y)"""
+        if self.root is None:
+            return []
+        found = []
+        stack = [self.root]
+        while stack:
+            box, payload, leaf = stack.pop()
+            if not (box[0] <= x <= box[2] and box[1] <= y <= box[3]):
+                continue
+            if leaf:
+                found.append(payload)
+            else:
+                stack.extend(payload)
+        return found
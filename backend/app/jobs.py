@@ -0,0 +1,169 @@
+import os
+import json
+import time
+import asyncio
+import hashlib
+import threading
+from app.ee_executor import Overloaded
+
+# Job records and results; a finished job's result is served again for identical submissions
+JOB_DIR = os.getenv('JOB_DIR', '/tmp/ndvi-jobs')
+JOB_WORKERS = int(os.getenv('JOB_WORKERS', 2))
+JOB_MAX_QUEUE = int(os.getenv('JOB_MAX_QUEUE', 100))
+
+QUEUED, RUNNING, DONE, FAILED, CANCELLED = 'queued', 'running', 'done', 'failed', 'cancelled'
+
+
+class JobKind:
+    """How to run one kind of job.
+
+    normalize(params) validates the submitted parameters and fills in
+    defaults, raising ValueError, so identical work always gets the same job
+    ID. run(params, progress) is a coroutine returning the JSON-able result
+    and may call progress(fraction, message).
+    """
+
+    def __init__(self, normalize, run):
+        self.normalize = normalize
+        self.run = run
+
+
+class JobQueue:
+    """Bounded pool of asyncio workers running long computations in the background.
+
+    A job's ID is a hash of its kind and normalized parameters. Submitting
+    work that is queued, running or done returns the existing job; failed
+    and cancelled jobs run again. Records and results are kept under
+    ``JOB_DIR/<id>/`` so finished results survive restarts.
+    """
+
+    def __init__(self, directory=JOB_DIR, workers=JOB_WORKERS, max_queue=JOB_MAX_QUEUE):
+        self.directory = directory
+        self.workers = workers
+        self.max_queue = max_queue
+        self._kinds = {}
+        self._jobs = {}
+        self._queue = None
+        self._tasks = []
+        self._running = {}
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+        self._load()
+
+    def register(self, kind, normalize, run):
+        self._kinds[kind] = JobKind(normalize, run)
+
+    def _load(self):
+        for job_id in os.listdir(self.directory):
+            path = os.path.join(self.directory, job_id, 'job.json')
+            try:
+                with open(path) as f:
+                    job = json.load(f)
+            except (OSError, ValueError):
+                continue
+            if job['status'] in (QUEUED, RUNNING):
+                # The process that owned it is gone; a new submission runs it again
+                job.update(status=FAILED, error="interrupted by a restart", finished_at=time.time())
+            self._jobs[job_id] = job
+
+    def _save(self, job):
+        job_dir = os.path.join(self.directory, job['id'])
+        os.makedirs(job_dir, exist_ok=True)
+        tmp = os.path.join(job_dir, 'job.json.tmp')
+        with open(tmp, 'w') as f:
+            json.dump(job, f)
+        os.replace(tmp, os.path.join(job_dir, 'job.json'))
+
+    def result_path(self, job_id):
+        return os.path.join(self.directory, job_id, 'result.json')
+
+    def _start_workers(self):
+        # Created on first use so the queue and workers belong to the serving event loop
+        if self._queue is None:
+            self._queue = asyncio.Queue()
+            self._tasks = [asyncio.ensure_future(self._worker()) for _ in range(self.workers)]
+
+    def submit(self, kind, params):
+        """Queue a job, or return the existing one for identical work; raises ValueError or Overloaded"""
+        if kind not in self._kinds:
+            raise ValueError(f"Unknown job kind '{kind}'. Available: {sorted(self._kinds)}")
+        params = self._kinds[kind].normalize(params or {})
+        job_id = hashlib.sha256(json.dumps([kind, params], sort_keys=True).encode()).hexdigest()[:20]
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is not None and job['status'] in (QUEUED, RUNNING, DONE):
+                if job['status'] != DONE or os.path.exists(self.result_path(job_id)):
+                    return job, False
+            if self._queue is not None and self._queue.qsize() >= self.max_queue:
+                raise Overloaded(f"job queue is full ({self.max_queue} queued)")
+            job = {
+                "id": job_id, "kind": kind, "params": params, "status": QUEUED,
+                "progress": 0.0, "message": None, "error": None,
+                "submitted_at": time.time(), "started_at": None, "finished_at": None
+            }
+            self._jobs[job_id] = job
+        self._save(job)
+        self._start_workers()
+        self._queue.put_nowait(job_id)
+        return job, True
+
+    def get(self, job_id):
+        return self._jobs.get(job_id)
+
+    def list(self, limit=100):
+        return sorted(self._jobs.values(), key=lambda j: j['submitted_at'], reverse=True)[:limit]
+
+    def cancel(self, job_id):
+        """Cancel a queued or running job; returns the job, or None if unknown"""
+        job = self._jobs.get(job_id)
+        if job is None:
+            return None
+        if job['status'] == QUEUED:
+            job.update(status=CANCELLED, finished_at=time.time())
+            self._save(job)
+        elif job['status'] == RUNNING and job_id in self._running:
+            self._running[job_id].cancel()
+        return job
+
+    async def _worker(self):
+        while True:
+            job_id = await self._queue.get()
+            job = self._jobs.get(job_id)
+            if job is None or job['status'] != QUEUED:
+                continue
+            await self._execute(job)
+
+    async def _execute(self, job):
+        def progress(fraction, message=None):
+            job['progress'] = round(min(max(fraction, 0.0), 1.0), 4)
+            if message is not None:
+                job['message'] = message
+
+        job.update(status=RUNNING, started_at=time.time())
+        self._save(job)
+        task = self._running[job['id']] = asyncio.ensure_future(self._kinds[job['kind']].run(job['params'], progress))
+        try:
+            result = await task
+            if isinstance(result, dict) and 'error' in result:
+                raise Exception(result['error'])
+            with open(self.result_path(job['id']), 'w') as f:
+                json.dump(result, f)
+            job.update(status=DONE, progress=1.0)
+        except asyncio.CancelledError:
+            job.update(status=CANCELLED)
+        except Exception as e:
+            print(f"Job {job['id']} ({job['kind']}) failed: {e}")
+            job.update(status=FAILED, error=str(e))
+        finally:
+            self._running.pop(job['id'], None)
+            job['finished_at'] = time.time()
+            self._save(job)
+
+    def status(self):
+        counts = {}
+        for job in list(self._jobs.values()):
+            counts[job['status']] = counts.get(job['status'], 0) + 1
+        return {"workers": self.workers, "queued": self._queue.qsize() if self._queue else 0, "by_status": counts}
+
+
+job_queue = JobQueue()
@@ -0,0 +1,300 @@
+import os
+import json
+import zlib
+import struct
+import shutil
+import threading
+import warnings
+import numpy as np
+from app.aois import NDVI_VIS
+
+# Downloaded Sentinel-2 stacks, one directory per AOI
+LOCAL_CUBE_DIR = os.getenv('LOCAL_CUBE_DIR', '/tmp/ndvi-cubes')
+# Largest slice (height x width) fetched in one computePixels request
+LOCAL_CUBE_MAX_PIXELS = int(os.getenv('LOCAL_CUBE_MAX_PIXELS', 2048 * 2048))
+
+BANDS = ['B4', 'B8', 'QA60']
+CLOUD_BIT = 1 << 10
+CIRRUS_BIT = 1 << 11
+
+PALETTE_RGB = {
+    'red': (255, 0, 0),
+    'orange': (255, 165, 0),
+    'yellow': (255, 255, 0),
+    'lightgreen': (144, 238, 144),
+    'green': (0, 128, 0),
+    'darkgreen': (0, 100, 0),
+}
+
+
+class DataCube:
+    """Memory-mapped time x y x x stacks of B4, B8 and QA60 on a regular lat/lng grid.
+
+    ``meta.json`` holds the bounds, shape and the acquisition date of every
+    time slice; each band is a raw uint16 file opened with ``np.memmap`` so
+    only the pixels a query touches are read from disk.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with open(os.path.join(path, 'meta.json')) as f:
+            self.meta = json.load(f)
+        self.bounds = self.meta['bounds']
+        self.dates = np.array(self.meta['dates'])
+        self.shape = tuple(self.meta['shape'])
+        self.bands = {
+            band: np.memmap(os.path.join(path, f'{band}.u16'), dtype=np.uint16, mode='r', shape=self.shape)
+            for band in BANDS
+        }
+
+    @classmethod
+    def create(cls, path, bounds, height, width, dates):
+        """Allocate an empty cube on disk and return it opened for writing"""
+        os.makedirs(path, exist_ok=True)
+        shape = (len(dates), height, width)
+        for band in BANDS:
+            np.memmap(os.path.join(path, f'{band}.u16'), dtype=np.uint16, mode='w+', shape=shape).flush()
+        with open(os.path.join(path, 'meta.json'), 'w') as f:
+            json.dump({'bounds': list(bounds), 'shape': list(shape), 'dates': list(dates)}, f)
+        cube = cls(path)
+        cube.bands = {
+            band: np.memmap(os.path.join(path, f'{band}.u16'), dtype=np.uint16, mode='r+', shape=shape)
+            for band in BANDS
+        }
+        return cube
+
+    def contains(self, lat, lng):
+        west, south, east, north = self.bounds
+        return west <= lng < east and south < lat <= north
+
+    def pixel_of(self, lat, lng):
+        west, south, east, north = self.bounds
+        _, height, width = self.shape
+        row = int((north - lat) / (north - south) * height)
+        col = int((lng - west) / (east - west) * width)
+        return min(max(row, 0), height - 1), min(max(col, 0), width - 1)
+
+    def cell_of(self, lat, lng):
+        """[west, south, east, north] of the grid cell holding a point"""
+        west, south, east, north = self.bounds
+        _, height, width = self.shape
+        row, col = self.pixel_of(lat, lng)
+        dx, dy = (east - west) / width, (north - south) / height
+        return [west + col * dx, north - (row + 1) * dy, west + (col + 1) * dx, north - row * dy]
+
+    def time_slice(self, start, end):
+        """Index range of slices acquired in [start, end); dates are stored sorted"""
+        return slice(int(np.searchsorted(self.dates, start, 'left')),
+                     int(np.searchsorted(self.dates, end, 'left')))
+
+    def ndvi(self, t, rows=slice(None), cols=slice(None)):
+        """Cloud-masked NDVI for a block, NaN where masked; mirrors maskS2clouds + normalizedDifference"""
+        qa = np.asarray(self.bands['QA60'][t, rows, cols])
+        b4 = np.asarray(self.bands['B4'][t, rows, cols], dtype=np.float32) / 10000
+        b8 = np.asarray(self.bands['B8'][t, rows, cols], dtype=np.float32) / 10000
+        clear = ((qa & CLOUD_BIT) == 0) & ((qa & CIRRUS_BIT) == 0)
+        total = b8 + b4
+        with np.errstate(divide='ignore', invalid='ignore'):
+            ndvi = (b8 - b4) / total
+        ndvi[~clear | (total == 0)] = np.nan
+        return ndvi
+
+
+def cube_path(aoi_name):
+    return os.path.join(LOCAL_CUBE_DIR, aoi_name)
+
+_cubes = {}
+_cubes_lock = threading.Lock()
+
+def open_cube(aoi_name):
+    """Return the cached DataCube for an AOI, or None if it has not been ingested"""
+    if aoi_name.endswith(('.ingest', '.old')):
+        # Half-written or about to be deleted
+        return None
+    meta_path = os.path.join(cube_path(aoi_name), 'meta.json')
+    try:
+        mtime = os.stat(meta_path).st_mtime
+    except FileNotFoundError:
+        return None
+    with _cubes_lock:
+        cached = _cubes.get(aoi_name)
+        if cached is None or cached[1] != mtime:
+            cached = _cubes[aoi_name] = (DataCube(cube_path(aoi_name)), mtime)
+        return cached[0]
+
+def cube_version(aoi_name):
+    """Modification time of an AOI's ingested cube, or None; changes whenever it is re-ingested"""
+    try:
+        return os.stat(os.path.join(cube_path(aoi_name), 'meta.json')).st_mtime
+    except FileNotFoundError:
+        return None
+
+def find_cube(lat, lng):
+    """Return (aoi_name, cube) for the first ingested cube covering a point"""
+    if not os.path.isdir(LOCAL_CUBE_DIR):
+        return None, None
+    for aoi_name in sorted(os.listdir(LOCAL_CUBE_DIR)):
+        cube = open_cube(aoi_name)
+        if cube is not None and cube.contains(lat, lng):
+            return aoi_name, cube
+    return None, None
+
+
+def point_series(cube, lat, lng, start, end):
+    """List of (date, ndvi) for unmasked acquisitions at a point"""
+    row, col = cube.pixel_of(lat, lng)
+    t = cube.time_slice(start, end)
+    values = cube.ndvi(t, row, col)
+    dates = cube.dates[t]
+    valid = ~np.isnan(values)
+    return list(zip(dates[valid].tolist(), values[valid].astype(float).tolist()))
+
+def point_stats(cube, lat, lng, start, end):
+    """Mean, population stdDev, min and max of a point's NDVI series, like the EE reducers"""
+    row, col = cube.pixel_of(lat, lng)
+    t = cube.time_slice(start, end)
+    values = cube.ndvi(t, row, col)
+    values = values[~np.isnan(values)]
+    image_count = t.stop - t.start
+    if values.size == 0:
+        return {"mean": None, "std_dev": None, "min": None, "max": None}, image_count
+    return {
+        "mean": float(values.mean()),
+        "std_dev": float(values.std()),
+        "min": float(values.min()),
+        "max": float(values.max())
+    }, image_count
+
+def composite(cube, start, end, reducer='median'):
+    """Per-pixel NDVI composite over [start, end) for the whole cube.
+
+    Reduced in bands of rows sized like compositing's chunks, so only one
+    band's float32 stack is in memory instead of all time x y x x of it.
+    """
+    from app.compositing import chunk_size
+    reducers = {'median': np.nanmedian, 'mean': np.nanmean, 'stdDev': np.nanstd}
+    if reducer not in reducers:
+        raise ValueError(f"Unknown reducer: {reducer}")
+    t = cube.time_slice(start, end)
+    _, height, width = cube.shape
+    band_rows = max(1, chunk_size(t.stop - t.start) ** 2 // width)
+    values = np.full((height, width), np.nan, dtype=np.float32)
+    if t.stop == t.start:
+        return values
+    # All-NaN pixels (never clear) legitimately reduce to NaN
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore', RuntimeWarning)
+        for r0 in range(0, height, band_rows):
+            rows = slice(r0, min(r0 + band_rows, height))
+            values[rows] = reducers[reducer](cube.ndvi(t, rows), axis=0)
+    return values
+
+
+def _colorize(values, vis):
+    colors = np.array([PALETTE_RGB[name] for name in vis['palette']], dtype=np.float32)
+    scaled = np.clip((values - vis['min']) / (vis['max'] - vis['min']), 0, 1) * (len(colors) - 1)
+    scaled = np.nan_to_num(scaled)
+    low = np.floor(scaled).astype(int)
+    high = np.minimum(low + 1, len(colors) - 1)
+    frac = (scaled - low)[..., None]
+    rgb = colors[low] * (1 - frac) + colors[high] * frac
+    alpha = np.where(np.isnan(values), 0, 255)[..., None]
+    return np.concatenate([rgb, alpha], axis=-1).astype(np.uint8)
+
+def render_png(values, vis=NDVI_VIS, block_rows=256):
+    """Render a 2-D NDVI array to an RGBA PNG with the dashboard palette; NaN is transparent"""
+    height, width = values.shape
+    # Colorized a block of rows at a time to keep the float temporaries small
+    raw = b''.join(b'\x00' + row.tobytes()
+                   for r0 in range(0, height, block_rows)
+                   for row in _colorize(values[r0:r0 + block_rows], vis))
+
+    def chunk(kind, data):
+        return struct.pack('>I', len(data)) + kind + data + struct.pack('>I', zlib.crc32(kind + data) & 0xffffffff)
+
+    return (b'\x89PNG\r\n\x1a\n'
+            + chunk(b'IHDR', struct.pack('>IIBBBBB', width, height, 8, 6, 0, 0, 0))
+            + chunk(b'IDAT', zlib.compress(raw, 6))
+            + chunk(b'IEND', b''))
+
+
+_ingesting = set()
+_ingesting_lock = threading.Lock()
+
+
+class CubeIngest:
+    """Download of B4/B8/QA60 for every image of an EE pipeline into a new cube for an AOI.
+
+    Slices are written into ``<aoi>.ingest`` with one ``computePixels``
+    request each, so a caller can fetch them one EE call at a time, and
+    finish() swaps the result in place of the AOI's cube. Only one ingest
+    per AOI runs at once; a second one raises ValueError.
+    """
+
+    def __init__(self, aoi_name, pipeline, bounds, width, height):
+        import ee
+        if width * height > LOCAL_CUBE_MAX_PIXELS:
+            raise ValueError(f"Cube slice {width}x{height} exceeds LOCAL_CUBE_MAX_PIXELS ({LOCAL_CUBE_MAX_PIXELS})")
+        with _ingesting_lock:
+            if aoi_name in _ingesting:
+                raise ValueError(f"A datacube for AOI '{aoi_name}' is already being ingested")
+            _ingesting.add(aoi_name)
+        self.aoi_name = aoi_name
+        self.path = cube_path(aoi_name)
+        self.tmp_path = self.path + '.ingest'
+        try:
+            # Left behind by an ingest that died with its process
+            shutil.rmtree(self.tmp_path, ignore_errors=True)
+            self._s2 = pipeline.s2.sort('system:time_start')
+            listing = ee.Dictionary({
+                'ids': self._s2.aggregate_array('system:index'),
+                'times': self._s2.aggregate_array('system:time_start')
+            }).getInfo()
+            self.ids = listing['ids']
+            dates = [np.datetime64(int(ms), 'ms').astype('datetime64[D]').astype(str) for ms in listing['times']]
+            west, south, east, north = bounds
+            self._grid = {
+                'dimensions': {'width': width, 'height': height},
+                'affineTransform': {
+                    'scaleX': (east - west) / width, 'shearX': 0, 'translateX': west,
+                    'shearY': 0, 'scaleY': -(north - south) / height, 'translateY': north
+                },
+                'crsCode': 'EPSG:4326'
+            }
+            self.cube = DataCube.create(self.tmp_path, bounds, height, width, dates)
+        except BaseException:
+            self.abort()
+            raise
+
+    def fetch(self, t):
+        """Download slice t"""
+        import ee
+        image = self._s2.filter(ee.Filter.eq('system:index', self.ids[t])).first().select(BANDS).unmask(0).toUint16()
+        pixels = ee.data.computePixels({'expression': image, 'fileFormat': 'NUMPY_NDARRAY', 'grid': self._grid})
+        for band in BANDS:
+            self.cube.bands[band][t] = pixels[band]
+
+    def finish(self):
+        """Swap the finished cube in place of the previous one; returns the number of slices"""
+        try:
+            for band in BANDS:
+                self.cube.bands[band].flush()
+            if os.path.exists(self.path):
+                old_path = self.path + '.old'
+                shutil.rmtree(old_path, ignore_errors=True)
+                os.rename(self.path, old_path)
+                os.rename(self.tmp_path, self.path)
+                shutil.rmtree(old_path)
+            else:
+                os.rename(self.tmp_path, self.path)
+            return len(self.ids)
+        finally:
+            self._release()
+
+    def abort(self):
+        shutil.rmtree(self.tmp_path, ignore_errors=True)
+        self._release()
+
+    def _release(self):
+        with _ingesting_lock:
+            _ingesting.discard(self.aoi_name)
@@ -1,19 +1,79 @@
-from fastapi import FastAPI
-from fastapi.responses import JSONResponse
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, Response, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
-import ee
+from contextlib import asynccontextmanager
 import os
 import json
-from datetime import datetime, timedelta
-import google.oauth2.service_account as service_account
-from google.auth.transport.requests import Request
+import math
+import asyncio
+from datetime import date, timedelta
+from app.gee import init_ee_once, is_initialized, init_error, get_access_token, date_window, month_windows, project_id, CLOUD_THRESHOLD
+from app.pipeline import get_pipeline, point_spec
+from app.mapid_cache import mapid_cache, make_key
+from app.ee_executor import run_ee, lanes, Overloaded
+from app.tile_cache import tile_cache, fetch_tile, etag_for, UpstreamError, TILE_CACHE_MAX_AGE
+from app.tile_warmer import tile_warmer
+from app.token_manager import token_manager
+from app.pixel_grid import snap
+from app.series_store import series_store
+from app.result_cache import result_cache
+from app.single_flight import single_flight, BlockingSingleFlight
+from app.jobs import job_queue
+from app.scene_index import scene_index, image_count
+from app.catalog import catalog, catalog_scheduler, CATALOG_ENABLED, parse_period, build_entry, refresh_mapid, mapid_expired
+from app.aois import aoi_registry, BUILTIN_AOIS, NDVI_VIS
+from app import encoding, metrics
+from app.startup import readiness, WARMUP_MODE
+from app.api import ndvi, aois, jobs
 
-# Read configuration from environment variables
-project_id = os.getenv('EE_PROJECT_ID') or os.getenv('GCP_PROJECT') or 'gee-assignment-469904'
-service_account_key_file = os.getenv('GOOGLE_APPLICATION_CREDENTIALS') or os.getenv('SERVICE_ACCOUNT_FILE') or 'E:\\gee_assignment_key.json'
-service_account_key_json = os.getenv('GOOGLE_APPLICATION_CREDENTIALS_JSON')
+# Tile host for map IDs; overridable to point at a local stand-in
+EE_TILE_BASE_URL = os.getenv('EE_TILE_BASE_URL', 'https://earthengine.googleapis.com').rstrip('/')
+# Direct EE tile URLs carry the service account's access token, so they are only returned on request
+EXPOSE_EE_TILE_URLS = os.getenv('EXPOSE_EE_TILE_URLS', 'false').lower() == 'true'
 
-app = FastAPI()
+# Calendar months per EE request for streamed time series, and how many of those run at once
+TIMESERIES_SHARD_MONTHS = int(os.getenv('TIMESERIES_SHARD_MONTHS', 1))
+TIMESERIES_SHARD_CONCURRENCY = int(os.getenv('TIMESERIES_SHARD_CONCURRENCY', 6))
+# Sentinel-2 L2A coverage starts in 2017
+TIMESERIES_EARLIEST = os.getenv('TIMESERIES_EARLIEST', '2017-03-28')
+# Days before synced_through fetched again when a series is extended, since scenes are ingested
+# into EE several days after acquisition
+TIMESERIES_OVERLAP_DAYS = int(os.getenv('TIMESERIES_OVERLAP_DAYS', 5))
+
+# AOIs whose map IDs are built during startup warm-up (default: all)
+WARMUP_AOIS = [a for a in os.getenv('WARMUP_AOIS', ','.join(BUILTIN_AOIS)).split(',') if a]
+
+
+@asynccontextmanager
+async def lifespan(app):
+    """Initialize EE, the access token and AOI map IDs at startup instead of on the first request"""
+    steps = _warmup_steps()
+    if WARMUP_MODE == 'block':
+        if not await asyncio.get_running_loop().run_in_executor(None, readiness.run_once, steps):
+            readiness.run_in_background(steps)
+    elif WARMUP_MODE == 'background':
+        readiness.run_in_background(steps)
+    else:
+        readiness.skip()
+    if CATALOG_ENABLED:
+        catalog_scheduler.start()
+    yield
+    catalog_scheduler.stop()
+    token_manager.stop()
+
+def _warmup_steps():
+    def earth_engine():
+        init_ee_once()
+        if not is_initialized():
+            raise Exception(init_error() or "Earth Engine initialization failed")
+    steps = [("earth_engine", earth_engine, True), ("token", get_access_token, True)]
+    for aoi_name in WARMUP_AOIS:
+        if aoi_name in aoi_registry:
+            steps.append((f"aoi:{aoi_name}", lambda aoi_name=aoi_name: _aoi_layer(aoi_name), False))
+    return steps
+
+app = FastAPI(lifespan=lifespan, default_response_class=encoding.TimedJSONResponse)
+app.add_middleware(metrics.MetricsMiddleware)
 
 # Add CORS middleware to allow all origins for development
 app.add_middleware(
@@ -24,45 +84,101 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Lazy EE initialization
-_credentials = None
-_ee_initialized = False
+@app.exception_handler(Overloaded)
+async def overloaded_handler(request, exc):
+    print(f"Rejected {request.url.path}: {exc}")
+    return JSONResponse(content={"error": str(exc)}, status_code=503, headers={"Retry-After": "5"})
+
+@app.exception_handler(encoding.NotAcceptable)
+async def not_acceptable_handler(request, exc):
+    return JSONResponse(content={"error": str(exc)}, status_code=406)
+
+# Batch endpoints
+app.include_router(ndvi.router, prefix="/ndvi")
+app.include_router(aois.router, prefix="/aois")
+app.include_router(jobs.router, prefix="/jobs")
+
+def _tile_url(mapid):
+    access_token = get_access_token()
+    return f"{EE_TILE_BASE_URL}/v1alpha/projects/{project_id}/maps/{mapid}/tiles/{{z}}/{{x}}/{{y}}?token={access_token}"
+
+def _tile_urls(mapid, proxy_tile_url=None):
+    """Tile URL fields for a response; the token-bearing EE URL only when EXPOSE_EE_TILE_URLS is set"""
+    urls = {"proxy_tile_url": proxy_tile_url} if proxy_tile_url else {}
+    if EXPOSE_EE_TILE_URLS:
+        urls["tile_url"] = _tile_url(mapid)
+    return urls
+
+def _aoi_layer_key(aoi_name):
+    # Calculate date range: last 12 months, snapped to the day so the map ID can be reused
+    today, start_date = date_window(365)
+    version = aoi_registry[aoi_name]["version"]
+    return make_key(aoi_name, start_date, today, CLOUD_THRESHOLD, NDVI_VIS, geometry=version), start_date, today
+
+def _unknown_aoi(aoi_name):
+    return {"error": f"AOI '{aoi_name}' not found. List AOIs with GET /aois"}
+
+def _tile_key(layer_key, z, x, y):
+    return f"{'|'.join(map(str, layer_key))}|{z}/{x}/{y}"
 
-def init_ee_once():
-    global _credentials, _ee_initialized
-    if _ee_initialized:
+def _warm_aoi_tiles(key, layer):
+    """Pre-fetch the tile pyramid whenever an AOI layer's map ID is built or refreshed"""
+    aoi_name = key[0]
+    if aoi_name not in aoi_registry or key != _aoi_layer_key(aoi_name)[0]:
         return
-    try:
-        # Prefer JSON from env if provided (Cloud Run secret as env)
-        if service_account_key_json and service_account_key_json.strip().startswith('{'):
-            info = json.loads(service_account_key_json)
-            _credentials = service_account.Credentials.from_service_account_info(
-                info,
-                scopes=['https://www.googleapis.com/auth/cloud-platform', 'https://www.googleapis.com/auth/earthengine']
-            )
-        # Otherwise try file path
-        elif service_account_key_file and os.path.exists(service_account_key_file):
-            _credentials = service_account.Credentials.from_service_account_file(
-                service_account_key_file,
-                scopes=['https://www.googleapis.com/auth/cloud-platform', 'https://www.googleapis.com/auth/earthengine']
-            )
-        # Else rely on default ADC (Cloud Run service account)
-        if _credentials is not None:
-            ee.Initialize(_credentials, project=project_id)
-        else:
-            ee.Initialize(project=project_id)
-        _ee_initialized = True
-        print("EE initialized (lazy)")
-    except Exception as e:
-        print(f"EE init failed (lazy): {e}")
-        # Do not crash; endpoints will report errors
+    tile_warmer.schedule(
+        aoi_name,
+        aoi_registry[aoi_name]["bounds"],
+        lambda z, x, y: _tile_key(key, z, x, y),
+        lambda: _tile_url(layer["mapid"])
+    )
+
+mapid_cache.add_listener(_warm_aoi_tiles)
+
+def _aoi_layer_build(aoi_name, start_date, today):
+    aoi = aoi_registry[aoi_name]
+    return lambda: _build_ndvi_layer(aoi["spec"], start_date, today, aoi_label=aoi["name"])
+
+def _aoi_layer(aoi_name):
+    """Return (cache key, layer) for an AOI's current 12-month NDVI median"""
+    key, start_date, today = _aoi_layer_key(aoi_name)
+    return key, mapid_cache.get(key, _aoi_layer_build(aoi_name, start_date, today))
+
+def _build_ndvi_layer(spec, start_date, end_date, fallback_days=None, aoi_label=None):
+    """Build the median NDVI composite for a geometry spec and return its map ID and metadata"""
+    # Both counts come from the local scene index when it covers the geometry
+    pipeline = get_pipeline(spec, start_date, end_date)
+    count = image_count(pipeline)
+    if count == 0 and fallback_days:
+        start_date = end_date - timedelta(days=fallback_days)
+        pipeline = get_pipeline(spec, start_date, end_date)
+        count = image_count(pipeline)
+    if count == 0:
+        period = "2 years" if fallback_days else "12 months"
+        raise Exception(f"No Sentinel-2 images found for {aoi_label} in the last {period}")
+    ndviMedian = pipeline.ndvi.median().clip(pipeline.geometry)
+    map_id = ndviMedian.getMapId(NDVI_VIS)
+    if not map_id:
+        raise Exception("Failed to get map ID from Earth Engine.")
+    return {
+        "mapid": map_id['mapid'],
+        "image_count": count,
+        "date_range": {
+            "start": start_date.strftime('%Y-%m-%d'),
+            "end": end_date.strftime('%Y-%m-%d')
+        }
+    }
 
 @app.get("/")
-def root():
+async def root():
     return {"status": "Backend is running"}
 
 @app.get("/test")
 async def test():
+    return await run_ee("interactive", _test)
+
+def _test():
+    import ee
     init_ee_once()
     try:
         aoi = ee.Geometry.Point([-74.006, 40.7128]).buffer(20000)
@@ -80,17 +196,8 @@ async def test():
         map_id = ndvi.getMapId(vis_params)
         if not map_id:
             raise Exception("Failed to get map ID from Earth Engine.")
-        access_token = None
-        if _credentials is not None:
-            access_token = _credentials.token
-            if not access_token or (hasattr(_credentials, 'expired') and _credentials.expired):
-                _credentials.refresh(Request())
-                access_token = _credentials.token
-        if not access_token:
-            raise Exception("Failed to obtain a valid access token.")
-        tile_url = f"https://earthengine.googleapis.com/v1alpha/projects/{project_id}/maps/{map_id['mapid']}/tiles/{{z}}/{{x}}/{{y}}?token={access_token}"
         return JSONResponse(content={
-            "tile_url": tile_url,
+            **_tile_urls(map_id['mapid']),
             "image_count": collection.size().getInfo(),
             "date_range": {"start": "2024-09-01", "end": "2025-08-01"}
         })
@@ -99,231 +206,277 @@ async def test():
         return JSONResponse(content={"error": str(e)}, status_code=500)
 
 @app.get("/ndvi-tiles")
-def get_ndvi_tiles():
+async def get_ndvi_tiles():
+    return await run_ee("heavy", _get_ndvi_tiles)
+
+def _get_ndvi_tiles():
     init_ee_once()
     try:
-        nyc = ee.Geometry.Rectangle([-74.25909, 40.477399, -73.700272, 40.917577])
-        today = datetime.now()
-        start_date = today - timedelta(days=365)
-        s2 = ee.ImageCollection('COPERNICUS/S2_SR_HARMONIZED')
-        s2 = s2.filterBounds(nyc)\
-               .filterDate(start_date.strftime('%Y-%m-%d'), today.strftime('%Y-%m-%d'))\
-               .filter(ee.Filter.lt('CLOUDY_PIXEL_PERCENTAGE', 20))
-        image_count = s2.size().getInfo()
-        if image_count == 0:
-            start_date = today - timedelta(days=730)
-            s2 = ee.ImageCollection('COPERNICUS/S2_SR_HARMONIZED')\
-                   .filterBounds(nyc)\
-                   .filterDate(start_date.strftime('%Y-%m-%d'), today.strftime('%Y-%m-%d'))\
-                   .filter(ee.Filter.lt('CLOUDY_PIXEL_PERCENTAGE', 20))
-            image_count = s2.size().getInfo()
-        if image_count == 0:
-            return {"error": f"No Sentinel-2 images found for NYC in the last 2 years"}
-        def maskS2clouds(image):
-            qa = image.select('QA60')
-            cloudBitMask = 1 << 10
-            cirrusBitMask = 1 << 11
-            mask = qa.bitwiseAnd(cloudBitMask).eq(0).And(
-                qa.bitwiseAnd(cirrusBitMask).eq(0))
-            return image.updateMask(mask).divide(10000)
-        s2Masked = s2.map(maskS2clouds)
-        ndviCollection = s2Masked.map(lambda img: 
-            img.normalizedDifference(['B8', 'B4']).rename('NDVI')\
-               .copyProperties(img, ['system:time_start'])
-        )
-        ndviMedian = ndviCollection.median().clip(nyc)
-        ndviVis = {'min': -0.2, 'max': 0.8, 'palette': ['red', 'orange', 'yellow', 'lightgreen', 'green', 'darkgreen']}
-        map_id = ndviMedian.getMapId(ndviVis)
-        if not map_id:
-            raise Exception("Failed to get map ID from Earth Engine.")
-        access_token = None
-        if _credentials is not None:
-            access_token = _credentials.token
-            if not access_token or (hasattr(_credentials, 'expired') and _credentials.expired):
-                _credentials.refresh(Request())
-                access_token = _credentials.token
-        if not access_token:
-            raise Exception("Failed to obtain a valid access token.")
-        tile_url = f"https://earthengine.googleapis.com/v1alpha/projects/{project_id}/maps/{map_id['mapid']}/tiles/{{z}}/{{x}}/{{y}}?token={access_token}"
-        return {"tile_url": tile_url, "image_count": image_count, "date_range": {"start": start_date.strftime('%Y-%m-%d'), "end": today.strftime('%Y-%m-%d')}, "auth_method": "service_account_token"}
+        today, start_date = date_window(365)
+        key = make_key("nyc", start_date, today, CLOUD_THRESHOLD, NDVI_VIS, fallback_days=730)
+        layer = mapid_cache.get(key, lambda: _build_ndvi_layer(aoi_registry["nyc"]["spec"], start_date, today, fallback_days=730, aoi_label="NYC"))
+        # The proxy serves the 12-month NYC layer, which is this one unless the 730-day fallback was used
+        proxy_tile_url = "/tiles/nyc/{z}/{x}/{y}.png" if layer["date_range"]["start"] == start_date.strftime('%Y-%m-%d') else None
+        return {**_tile_urls(layer["mapid"], proxy_tile_url), "image_count": layer["image_count"], "date_range": layer["date_range"], "auth_method": "service_account_token"}
     except Exception as e:
         print(f"Error in get_ndvi_tiles: {e}")
         return {"error": str(e)}
 
 @app.get("/health")
-def health_check():
-    return {"status": "ok", "gee_initialized": _ee_initialized}
+async def health_check():
+    return {
+        "status": "ok",
+        "ready": readiness.ready,
+        "gee_initialized": is_initialized(),
+        "ee_lanes": {name: lane.status() for name, lane in lanes.items()},
+        "tile_cache": tile_cache.status(),
+        "tiles_warmed": tile_warmer.warmed,
+        "token": token_manager.status(),
+        "result_cache": await result_cache.astatus(),
+        "mapid_cache": await mapid_cache.astatus(),
+        "single_flight": single_flight.status(),
+        "jobs": job_queue.status(),
+        "scene_index": scene_index.status(),
+        "catalog": catalog_scheduler.status(),
+        "warmup": readiness.status()
+    }
+
+@app.get("/ready")
+async def ready_check():
+    """Readiness probe: 200 once startup warm-up has finished, 503 before"""
+    status = readiness.status()
+    return JSONResponse(content=status, status_code=200 if readiness.ready else 503)
+
+@app.get("/metrics")
+async def get_metrics():
+    """Per-stage latency histograms and EE round trips per request, in Prometheus text format"""
+    return Response(content=metrics.render(), media_type="text/plain; version=0.0.4")
+
+def _point_cache_key(kind, lat, lng):
+    # Calculate date range: last 12 months
+    today, start_date = date_window(365)
+    # Nearby clicks on the same pixel share one cached result
+    pixel = snap(lat, lng)
+    key = (kind, pixel.key, start_date.strftime('%Y-%m-%d'), today.strftime('%Y-%m-%d'), CLOUD_THRESHOLD)
+    return pixel, key, start_date, today
+
+def _point_response(lat, lng, pixel, result):
+    return {
+        "point": {"lat": lat, "lng": lng},
+        "pixel": {"id": pixel.key, "lat": pixel.lat, "lng": pixel.lng},
+        **result
+    }
+
+async def _peek_point_result(kind, lat, lng):
+    """Return a cached point response without touching the EE executor, or None"""
+    pixel, key, _, _ = _point_cache_key(kind, lat, lng)
+    # A miss here is counted once the request reaches _cached_point_result
+    result = await result_cache.aget(key, count_miss=False)
+    return _point_response(lat, lng, pixel, result) if result is not None else None
+
+def _cached_point_result(kind, lat, lng, compute):
+    """Snap a point to its 10 m pixel and return compute(pixel, start, end) through the result cache"""
+    pixel, key, start_date, today = _point_cache_key(kind, lat, lng)
+    result = result_cache.get(key)
+    if result is None:
+        result = compute(pixel, start_date, today)
+        result_cache.put(key, result)
+    return _point_response(lat, lng, pixel, result)
+
+async def _point_flight(kind, lat, lng, fn):
+    """Run fn(lat, lng) on the interactive lane, shared by concurrent requests for the same pixel and window"""
+    _, key, _, _ = _point_cache_key(kind, lat, lng)
+    result = await single_flight.run(key, lambda: run_ee("interactive", fn, lat, lng))
+    if "point" in result:
+        # Coalesced requests share the pixel result but each reports its own click
+        result = {**result, "point": {"lat": lat, "lng": lng}}
+    return result
+
+def _fetch_point_series(pixel, start, end):
+    """Fetch (date, ndvi) observations at a pixel centre for acquisitions in [start, end)"""
+    import ee
+    pipeline = get_pipeline(point_spec(pixel.lat, pixel.lng), start, end)
+    point = pipeline.geometry
+    
+    # Sample the point
+    time_series = pipeline.ndvi.map(lambda img: 
+        img.reduceRegions(
+            collection=ee.FeatureCollection([ee.Feature(point)]),
+            reducer=ee.Reducer.mean().setOutputs(['NDVI']),
+            scale=10
+        ).first().set('date', img.date().format('YYYY-MM-dd'))
+    )
+    
+    # Get the time series data
+    time_series_data = time_series.getInfo()
+    
+    # Extract NDVI values and dates
+    observations = []
+    for feature in time_series_data.get('features', []):
+        properties = feature.get('properties', {})
+        ndvi_value = properties.get('NDVI')
+        date = properties.get('date')
+        if ndvi_value is not None and date:
+            observations.append((date, ndvi_value))
+    return observations
 
 @app.get("/time-series/{lat}/{lng}")
-def get_time_series(lat: float, lng: float):
-    """Get NDVI time series for a specific point"""
+async def get_time_series(lat: float, lng: float, request: Request):
+    """Get NDVI time series for a specific point, as JSON, Arrow IPC or MessagePack per the Accept header"""
+    media = encoding.negotiate(request.headers.get("accept"))
+    result = await _peek_point_result("time-series", lat, lng)
+    if result is None:
+        result = await _point_flight("time-series", lat, lng, _get_time_series)
+    return encoding.respond(media, result, _time_series_table)
+
+def _time_series_table(result):
+    points = result["time_series"]
+    columns = {"date": ([p["date"] for p in points], "date"), "ndvi": ([p["ndvi"] for p in points], "float32")}
+    return columns, {k: v for k, v in result.items() if k != "time_series"}
+
+def _get_time_series(lat, lng):
     init_ee_once()
     try:
-        # Create point geometry
-        point = ee.Geometry.Point([lng, lat])
-        
-        # Calculate date range: last 12 months
-        today = datetime.now()
-        start_date = today - timedelta(days=365)
-        
-        # Load Sentinel-2 Image Collection
-        s2 = ee.ImageCollection('COPERNICUS/S2_SR_HARMONIZED')
-        
-        # Filter to point and date window
-        s2 = s2.filterBounds(point)\
-               .filterDate(start_date.strftime('%Y-%m-%d'), today.strftime('%Y-%m-%d'))\
-               .filter(ee.Filter.lt('CLOUDY_PIXEL_PERCENTAGE', 20))
-        
-        # Function to mask clouds
-        def maskS2clouds(image):
-            qa = image.select('QA60')
-            cloudBitMask = 1 << 10
-            cirrusBitMask = 1 << 11
-            mask = qa.bitwiseAnd(cloudBitMask).eq(0).And(
-                qa.bitwiseAnd(cirrusBitMask).eq(0))
-            return image.updateMask(mask).divide(10000)
-        
-        # Process images and compute NDVI
-        s2Masked = s2.map(maskS2clouds)
-        ndviCollection = s2Masked.map(lambda img: 
-            img.normalizedDifference(['B8', 'B4']).rename('NDVI')\
-               .copyProperties(img, ['system:time_start'])
-        )
-        
-        # Sample the point
-        time_series = ndviCollection.map(lambda img: 
-            img.reduceRegions(
-                collection=ee.FeatureCollection([ee.Feature(point)]),
-                reducer=ee.Reducer.mean(),
-                scale=10
-            ).first().set('date', img.date().format('YYYY-MM-dd'))
-        )
-        
-        # Get the time series data
-        time_series_data = time_series.getInfo()
-        
-        # Extract NDVI values and dates
-        features = time_series_data.get('features', [])
-        time_series_points = []
-        
-        for feature in features:
-            properties = feature.get('properties', {})
-            ndvi_value = properties.get('NDVI')
-            date = properties.get('date')
-            if ndvi_value is not None and date:
-                time_series_points.append({
-                    'date': date,
-                    'ndvi': round(ndvi_value, 3)
-                })
-        
-        # Sort by date
-        time_series_points.sort(key=lambda x: x['date'])
-        
-        return {
-            "point": {"lat": lat, "lng": lng},
-            "time_series": time_series_points,
-            "count": len(time_series_points)
-        }
-        
+        return _cached_point_result("time-series", lat, lng, _compute_time_series)
     except Exception as e:
         print(f"Error in get_time_series: {e}")
         return {"error": str(e)}
 
+def _series_id(pixel):
+    return f"{pixel.key}|{CLOUD_THRESHOLD}"
+
+def _series_gaps(series, start, end):
+    """Ranges to fetch from EE so a stored series covers [start, end).
+
+    Gaps always extend up to the synced range so it stays one contiguous span.
+    Extending the end re-fetches the last TIMESERIES_OVERLAP_DAYS before
+    synced_through too, picking up scenes ingested after the previous sync.
+    """
+    synced = series_store.synced_range(series)
+    if synced is None:
+        return [(start, end)]
+    synced_from, synced_through = synced
+    gaps = []
+    if start < synced_from:
+        gaps.append((start, synced_from))
+    if synced_through < end:
+        overlap = (date.fromisoformat(synced_through) - timedelta(days=TIMESERIES_OVERLAP_DAYS)).isoformat()
+        gaps.append((max(overlap, synced_from), end))
+    return gaps
+
+def _compute_time_series(pixel, start_date, today):
+    start, end = start_date.strftime('%Y-%m-%d'), today.strftime('%Y-%m-%d')
+    
+    # Observations are stored per snapped 10 m pixel, so only missing dates go to EE
+    series = _series_id(pixel)
+    for gap_start, gap_end in _series_gaps(series, start, end):
+        observations = _fetch_point_series(pixel, gap_start, gap_end)
+        series_store.append(series, observations, gap_start, gap_end)
+    
+    time_series_points = [
+        {'date': date, 'ndvi': round(ndvi_value, 3)}
+        for date, ndvi_value in series_store.get_series(series, start, end)
+    ]
+    
+    return {
+        "time_series": time_series_points,
+        "count": len(time_series_points)
+    }
+
+@app.get("/time-series/{lat}/{lng}/stream")
+async def stream_time_series(lat: float, lng: float, start: date = None, end: date = None):
+    """Stream an NDVI time series over any date range as NDJSON, fetched in concurrent monthly shards"""
+    today, start_date = date_window(365)
+    start = (start or start_date.date()).strftime('%Y-%m-%d')
+    # Acquisitions after today don't exist yet, and fetching them would mark the future as synced
+    end = min((end or today.date()).strftime('%Y-%m-%d'), today.strftime('%Y-%m-%d'))
+    start = max(start, TIMESERIES_EARLIEST)
+    if start >= end:
+        return JSONResponse(content={"error": f"Empty date range {start} to {end}"}, status_code=400)
+    pixel = snap(lat, lng)
+    return StreamingResponse(_time_series_lines(pixel, start, end), media_type="application/x-ndjson",
+                             headers={"X-Pixel-Id": pixel.key})
+
+def _fetch_series_shard(pixel, start, end):
+    init_ee_once()
+    return _fetch_point_series(pixel, start, end)
+
+async def _time_series_lines(pixel, start, end, lane="heavy"):
+    """Yield NDJSON points oldest first as each shard completes.
+
+    Stored observations are read locally; each missing range is split into
+    month shards that are all fetched concurrently. Points are emitted in
+    date order, so a shard is written out once every earlier one has been.
+    A gap is stored only after all of its shards succeed, keeping the stored
+    series contiguous.
+    """
+    series = _series_id(pixel)
+    gaps = _series_gaps(series, start, end)
+    semaphore = asyncio.Semaphore(TIMESERIES_SHARD_CONCURRENCY)
+
+    async def fetch(shard_start, shard_end):
+        async with semaphore:
+            return await run_ee(lane, _fetch_series_shard, pixel, shard_start, shard_end)
+
+    # (start, end, task) in date order; task is None for ranges already in the store
+    parts = []
+    cursor = start
+    for gap_start, gap_end in gaps:
+        if cursor < gap_start:
+            parts.append((cursor, min(gap_start, end), None))
+        for shard_start, shard_end in month_windows(gap_start, gap_end, TIMESERIES_SHARD_MONTHS):
+            parts.append((shard_start, shard_end, asyncio.ensure_future(fetch(shard_start, shard_end))))
+        cursor = max(cursor, gap_end)
+    if cursor < end:
+        parts.append((cursor, end, None))
+
+    try:
+        fetched = {}
+        for part_start, part_end, task in parts:
+            if task is None:
+                observations = series_store.get_series(series, part_start, part_end)
+            else:
+                observations = await task
+                fetched[(part_start, part_end)] = observations
+            for obs_date, ndvi_value in sorted(observations):
+                if start <= obs_date < end:
+                    yield json.dumps({"date": obs_date, "ndvi": round(ndvi_value, 3)}) + "\n"
+        for gap_start, gap_end in gaps:
+            observations = [obs for (s, e), shard in fetched.items() if gap_start <= s and e <= gap_end for obs in shard]
+            series_store.append(series, observations, gap_start, gap_end)
+    except Exception as e:
+        print(f"Error in stream_time_series: {e}")
+        yield json.dumps({"error": str(e)}) + "\n"
+    finally:
+        for _, _, task in parts:
+            if task is not None:
+                task.cancel()
+
 @app.get("/aoi/{aoi_name}")
-def get_aoi_data(aoi_name: str):
+async def get_aoi_data(aoi_name: str):
     """Get NDVI data for different Areas of Interest"""
+    if aoi_name not in aoi_registry:
+        return _unknown_aoi(aoi_name)
+    # Everyone opening the same AOI layer at once shares one map ID build
+    key = ("aoi", _aoi_layer_key(aoi_name)[0])
+    return await single_flight.run(key, lambda: run_ee("heavy", _get_aoi_data, aoi_name))
+
+def _get_aoi_data(aoi_name):
     init_ee_once()
     try:
-        # Define different AOIs
-        aois = {
-            "nyc": {
-                "name": "New York City",
-                "geometry": ee.Geometry.Rectangle([-74.25909, 40.477399, -73.700272, 40.917577])
-            },
-            "amazon": {
-                "name": "Amazon Rainforest",
-                "geometry": ee.Geometry.Rectangle([-70.0, -10.0, -50.0, 5.0])
-            },
-            "sahara": {
-                "name": "Sahara Desert",
-                "geometry": ee.Geometry.Rectangle([-10.0, 15.0, 30.0, 35.0])
-            }
-        }
-        
-        if aoi_name not in aois:
-            return {"error": f"AOI '{aoi_name}' not found. Available: {list(aois.keys())}"}
-        
-        aoi = aois[aoi_name]
-        
-        # Calculate date range: last 12 months
-        today = datetime.now()
-        start_date = today - timedelta(days=365)
-        
-        # Load Sentinel-2 Image Collection
-        s2 = ee.ImageCollection('COPERNICUS/S2_SR_HARMONIZED')
-        
-        # Filter to AOI and date window
-        s2 = s2.filterBounds(aoi["geometry"])\
-               .filterDate(start_date.strftime('%Y-%m-%d'), today.strftime('%Y-%m-%d'))\
-               .filter(ee.Filter.lt('CLOUDY_PIXEL_PERCENTAGE', 20))
-        
-        # Check if we have images
-        image_count = s2.size().getInfo()
-        if image_count == 0:
-            return {"error": f"No Sentinel-2 images found for {aoi['name']} in the last 12 months"}
-        
-        # Function to mask clouds
-        def maskS2clouds(image):
-            qa = image.select('QA60')
-            cloudBitMask = 1 << 10
-            cirrusBitMask = 1 << 11
-            mask = qa.bitwiseAnd(cloudBitMask).eq(0).And(
-                qa.bitwiseAnd(cirrusBitMask).eq(0))
-            return image.updateMask(mask).divide(10000)
-        
-        # Process images
-        s2Masked = s2.map(maskS2clouds)
-        ndviCollection = s2Masked.map(lambda img: 
-            img.normalizedDifference(['B8', 'B4']).rename('NDVI')\
-               .copyProperties(img, ['system:time_start'])
-        )
-        
-        # Take median NDVI over the collection and clip to AOI
-        ndviMedian = ndviCollection.median().clip(aoi["geometry"])
-        
-        # Visualization parameters
-        ndviVis = {
-            'min': -0.2,
-            'max': 0.8,
-            'palette': ['red', 'orange', 'yellow', 'lightgreen', 'green', 'darkgreen']
-        }
-        
-        # Generate Map ID
-        map_id = ndviMedian.getMapId(ndviVis)
-        
-        if not map_id:
-            raise Exception("Failed to get map ID from Earth Engine.")
-        
-        # Get the access token
-        access_token = _credentials.token
-        if not access_token or _credentials.expired:
-            _credentials.refresh(Request())
-            access_token = _credentials.token
+        if aoi_name not in aoi_registry:
+            return _unknown_aoi(aoi_name)
         
-        if not access_token:
-            raise Exception("Failed to obtain a valid access token.")
+        aoi = aoi_registry[aoi_name]
         
-        # Construct tile URL
-        tile_url = f"https://earthengine.googleapis.com/v1alpha/projects/{project_id}/maps/{map_id['mapid']}/tiles/{{z}}/{{x}}/{{y}}?token={access_token}"
+        # Reuse a cached map ID; stale entries are rebuilt in the background
+        key, layer = _aoi_layer(aoi_name)
         
         return {
             "aoi_name": aoi["name"],
-            "tile_url": tile_url,
-            "image_count": image_count,
-            "date_range": {
-                "start": start_date.strftime('%Y-%m-%d'),
-                "end": today.strftime('%Y-%m-%d')
-            }
+            **_tile_urls(layer["mapid"], f"/tiles/{aoi_name}/{{z}}/{{x}}/{{y}}.png"),
+            "image_count": layer["image_count"],
+            "date_range": layer["date_range"]
         }
 
     except Exception as e:
@@ -331,67 +484,516 @@ def get_aoi_data(aoi_name: str):
         return {"error": str(e)}
 
 @app.get("/stats/{lat}/{lng}")
-def get_pixel_stats(lat: float, lng: float):
-    """Get pixel statistics for a specific point"""
+async def get_pixel_stats(lat: float, lng: float, request: Request, engine: str = "ee"):
+    """Get pixel statistics for a specific point, as JSON, Arrow IPC or MessagePack per the Accept header"""
+    media = encoding.negotiate(request.headers.get("accept"))
+    if engine == "local":
+        result = await run_ee("interactive", _local_pixel_stats, lat, lng)
+    else:
+        result = await _peek_point_result("stats", lat, lng)
+        if result is None:
+            result = await _point_flight("stats", lat, lng, _get_pixel_stats)
+    return encoding.respond(media, result, _pixel_stats_table)
+
+def _pixel_stats_table(result):
+    # A single row of float32 statistics
+    columns = {name: ([value], "float32") for name, value in result["statistics"].items()}
+    return columns, {k: v for k, v in result.items() if k != "statistics"}
+
+def _get_pixel_stats(lat, lng):
     init_ee_once()
     try:
-        # Create point geometry
-        point = ee.Geometry.Point([lng, lat])
-        
-        # Calculate date range: last 12 months
-        today = datetime.now()
-        start_date = today - timedelta(days=365)
-        
-        # Load Sentinel-2 Image Collection
-        s2 = ee.ImageCollection('COPERNICUS/S2_SR_HARMONIZED')
-        
-        # Filter to point and date window
-        s2 = s2.filterBounds(point)\
-               .filterDate(start_date.strftime('%Y-%m-%d'), today.strftime('%Y-%m-%d'))\
-               .filter(ee.Filter.lt('CLOUDY_PIXEL_PERCENTAGE', 20))
-        
-        # Function to mask clouds
-        def maskS2clouds(image):
-            qa = image.select('QA60')
-            cloudBitMask = 1 << 10
-            cirrusBitMask = 1 << 11
-            mask = qa.bitwiseAnd(cloudBitMask).eq(0).And(
-                qa.bitwiseAnd(cirrusBitMask).eq(0))
-            return image.updateMask(mask).divide(10000)
-        
-        # Process images and compute NDVI
-        s2Masked = s2.map(maskS2clouds)
-        ndviCollection = s2Masked.map(lambda img: 
-            img.normalizedDifference(['B8', 'B4']).rename('NDVI')\
-               .copyProperties(img, ['system:time_start'])
-        )
-        
-        # Calculate statistics
-        stats = ndviCollection.reduce(ee.Reducer.mean().combine(
-            ee.Reducer.stdDev(), '', True).combine(
-            ee.Reducer.minMax(), '', True)
-        )
-        
-        # Sample the point
-        point_stats = stats.reduceRegions(
-            collection=ee.FeatureCollection([ee.Feature(point)]),
-            reducer=ee.Reducer.first(),
-            scale=10
-        ).first().getInfo()
-        
-        properties = point_stats.get('properties', {})
-        
-        return {
+        return _cached_point_result("stats", lat, lng, _compute_pixel_stats)
+    except Exception as e:
+        print(f"Error in get_pixel_stats: {e}")
+        return {"error": str(e)}
+
+def _compute_pixel_stats(pixel, start_date, today):
+    import ee
+    # Shared filtered, cloud-masked NDVI collection and its per-pixel statistics
+    pipeline = get_pipeline(point_spec(pixel.lat, pixel.lng), start_date, today)
+    point = pipeline.geometry
+    
+    # Sample the point
+    point_stats = pipeline.stats.reduceRegions(
+        collection=ee.FeatureCollection([ee.Feature(point)]),
+        reducer=ee.Reducer.first(),
+        scale=10
+    ).first().getInfo()
+    
+    properties = point_stats.get('properties', {})
+    
+    return {
+        "statistics": {
+            "mean": round(properties.get('NDVI_mean', 0), 3),
+            "std_dev": round(properties.get('NDVI_stdDev', 0), 3),
+            "min": round(properties.get('NDVI_min', 0), 3),
+            "max": round(properties.get('NDVI_max', 0), 3)
+        },
+        "image_count": image_count(pipeline)
+    }
+
+@app.get("/point/{lat}/{lng}")
+async def get_point_analysis(lat: float, lng: float, engine: str = "ee"):
+    """Get NDVI time series, pixel statistics and image count for a point in one EE call"""
+    if engine == "local":
+        return await run_ee("interactive", _local_point_analysis, lat, lng)
+    cached = await _peek_point_result("point", lat, lng)
+    if cached is not None:
+        return cached
+    return await _point_flight("point", lat, lng, _get_point_analysis)
+
+def _get_point_analysis(lat, lng):
+    init_ee_once()
+    try:
+        return _cached_point_result("point", lat, lng, _compute_point_analysis)
+    except Exception as e:
+        print(f"Error in get_point_analysis: {e}")
+        return {"error": str(e)}
+
+def _compute_point_analysis(pixel, start_date, today):
+    import ee
+    # Shared filtered, cloud-masked NDVI collection for this pixel and window
+    pipeline = get_pipeline(point_spec(pixel.lat, pixel.lng), start_date, today)
+    point = pipeline.geometry
+    
+    # Per-image value at the point; masked acquisitions are dropped server-side
+    def sample(img):
+        value = img.reduceRegion(reducer=ee.Reducer.mean(), geometry=point, scale=10).get('NDVI')
+        return ee.Feature(None, {'date': img.date().format('YYYY-MM-dd'), 'NDVI': value})
+    series = pipeline.ndvi.map(sample).filter(ee.Filter.notNull(['NDVI']))
+    
+    # Per-pixel statistics over the collection, sampled at the point
+    stats = pipeline.stats.reduceRegion(reducer=ee.Reducer.first(), geometry=point, scale=10)
+    
+    # Fetch everything in a single round trip; the image count is local unless the scene index can't answer
+    count = scene_index.count(pipeline.spec, pipeline.start, pipeline.end, pipeline.cloud_threshold)
+    result = ee.Dictionary({
+        'dates': series.aggregate_array('date'),
+        'values': series.aggregate_array('NDVI'),
+        'stats': stats,
+        'image_count': pipeline.s2.size() if count is None else count
+    }).getInfo()
+    
+    time_series_points = [
+        {'date': date, 'ndvi': round(value, 3)}
+        for date, value in zip(result.get('dates', []), result.get('values', []))
+        if value is not None and date
+    ]
+    time_series_points.sort(key=lambda x: x['date'])
+    
+    properties = result.get('stats') or {}
+    
+    return {
+        "statistics": {
+            "mean": round(properties.get('NDVI_mean') or 0, 3),
+            "std_dev": round(properties.get('NDVI_stdDev') or 0, 3),
+            "min": round(properties.get('NDVI_min') or 0, 3),
+            "max": round(properties.get('NDVI_max') or 0, 3)
+        },
+        "image_count": result.get('image_count', 0),
+        "time_series": time_series_points,
+        "count": len(time_series_points)
+    }
+
+@app.get("/tiles/{aoi_name}/{z}/{x}/{y}.png")
+async def get_tile(aoi_name: str, z: int, x: int, y: int, request: Request, period: str = None):
+    """Serve an AOI's NDVI tile from the local tile cache, fetching it upstream on a miss.
+
+    With ?period= the tile comes from that catalog composite instead of the rolling 12-month layer.
+    """
+    if aoi_name not in aoi_registry:
+        return JSONResponse(content=_unknown_aoi(aoi_name), status_code=404)
+    entry = None
+    try:
+        if period:
+            entry = catalog.get(aoi_registry[aoi_name], period)
+            if entry is None or entry["mapid"] is None:
+                return JSONResponse(content={"error": f"No catalog composite for {aoi_name} {period}"}, status_code=404)
+            # Recomputing an unsettled period changes its pixels, so its tiles are keyed by computed_at too
+            layer_key = ("catalog", aoi_name, entry["version"], period, entry["computed_at"])
+        else:
+            layer_key, _, _ = _aoi_layer_key(aoi_name)
+        tile_key = _tile_key(layer_key, z, x, y)
+        data = tile_cache.get(tile_key)
+        if data is None:
+            mapid = await _tile_mapid(aoi_name, period, entry)
+            data = await run_ee("tiles", _fetch_and_store_tile, tile_key, mapid, z, x, y)
+    except UpstreamError as e:
+        return JSONResponse(content={"error": str(e)}, status_code=e.status_code)
+    except Overloaded:
+        raise
+    except Exception as e:
+        print(f"Error in get_tile: {e}")
+        return JSONResponse(content={"error": str(e)}, status_code=502)
+    etag = etag_for(data)
+    headers = {"ETag": etag, "Cache-Control": f"public, max-age={TILE_CACHE_MAX_AGE}"}
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers=headers)
+    return Response(content=data, media_type="image/png", headers=headers)
+
+async def _tile_mapid(aoi_name, period, entry):
+    """Map ID behind a proxied tile.
+
+    A cold or expired layer is built once, on the heavy lane, for every tile request waiting on it,
+    so the waiters hold no tile slots and the build is not cut off by the tiles lane's timeout.
+    """
+    if period:
+        if not mapid_expired(entry):
+            return entry["mapid"]
+        # Same key as /aoi/{aoi_name}/catalog/{period}, which computes the same entry
+        key = ("catalog", aoi_name, entry["version"], period)
+        entry = await single_flight.run(key, lambda: run_ee("heavy", _catalog_entry, aoi_name, period))
+        return entry["mapid"]
+    key, start_date, today = _aoi_layer_key(aoi_name)
+    layer = await mapid_cache.apeek(key, _aoi_layer_build(aoi_name, start_date, today))
+    if layer is None:
+        layer = await single_flight.run(("mapid",) + key, lambda: run_ee("heavy", _tile_layer, aoi_name))
+    return layer["mapid"]
+
+def _tile_layer(aoi_name):
+    init_ee_once()
+    return _aoi_layer(aoi_name)[1]
+
+def _fetch_and_store_tile(tile_key, mapid, z, x, y):
+    init_ee_once()
+    data = fetch_tile(_tile_url(mapid).format(z=z, x=x, y=y))
+    tile_cache.put(tile_key, data)
+    return data
+
+def _local_point_result(lat, lng, with_series):
+    """Answer /stats or /point from a locally ingested datacube covering the point"""
+    from app import local_engine
+    try:
+        aoi_name, cube = local_engine.find_cube(lat, lng)
+        if cube is None:
+            return {"error": "No local datacube covers this point. Ingest one with POST /aoi/{aoi_name}/cube"}
+        today, start_date = date_window(365)
+        start, end = start_date.strftime('%Y-%m-%d'), today.strftime('%Y-%m-%d')
+        stats, image_count = local_engine.point_stats(cube, lat, lng, start, end)
+        west, south, east, north = cell = cube.cell_of(lat, lng)
+        result = {
             "point": {"lat": lat, "lng": lng},
-            "statistics": {
-                "mean": round(properties.get('NDVI_mean', 0), 3),
-                "std_dev": round(properties.get('NDVI_stdDev', 0), 3),
-                "min": round(properties.get('NDVI_min', 0), 3),
-                "max": round(properties.get('NDVI_max', 0), 3)
+            "statistics": {k: round(v, 3) if v is not None else 0 for k, v in stats.items()},
+            "image_count": image_count,
+            "engine": "local",
+            "cube": aoi_name,
+            # The cube is a coarse lat/lng grid over the whole AOI, so this is not the EE engine's 10 m pixel
+            "cell": {
+                "bounds": cell,
+                "size_m": [round((east - west) * 111320 * math.cos(math.radians(lat))), round((north - south) * 110574)]
             },
-            "image_count": s2.size().getInfo()
+            "resolution_note": "Values come from the local datacube cell containing the point, not a 10 m Sentinel-2 pixel"
         }
-        
+        if with_series:
+            time_series_points = [
+                {'date': date, 'ndvi': round(value, 3)}
+                for date, value in local_engine.point_series(cube, lat, lng, start, end)
+            ]
+            result["time_series"] = time_series_points
+            result["count"] = len(time_series_points)
+        return result
     except Exception as e:
-        print(f"Error in get_pixel_stats: {e}")
+        print(f"Error in local point analysis: {e}")
         return {"error": str(e)}
+
+def _local_pixel_stats(lat, lng):
+    return _local_point_result(lat, lng, with_series=False)
+
+def _local_point_analysis(lat, lng):
+    return _local_point_result(lat, lng, with_series=True)
+
+@app.post("/aoi/{aoi_name}/cube")
+async def ingest_aoi_cube(aoi_name: str, width: int = 1024, height: int = 1024):
+    """Queue a download of the AOI's last 12 months of B4/B8/QA60 into a local datacube.
+
+    Ingesting takes one EE request per scene, so it runs as a "cube" job; poll the returned job.
+    """
+    try:
+        job, created = job_queue.submit("cube", {"aoi": aoi_name, "width": width, "height": height})
+    except ValueError as e:
+        return {"error": str(e)}
+    return {**jobs.job_view(job), "created": created}
+
+@app.get("/aoi/{aoi_name}/composite.png")
+async def get_local_composite(aoi_name: str, reducer: str = "median"):
+    """Render the AOI's 12-month NDVI composite from its local datacube"""
+    result = await run_ee("heavy", _local_composite, aoi_name, reducer)
+    if isinstance(result, dict):
+        return JSONResponse(content=result, status_code=result.pop("status_code", 500))
+    return Response(content=result, media_type="image/png")
+
+def _local_composite(aoi_name, reducer):
+    from app import local_engine
+    try:
+        cube = local_engine.open_cube(aoi_name)
+        if cube is None:
+            return {"error": f"No local datacube for AOI '{aoi_name}'. Ingest one with POST /aoi/{aoi_name}/cube", "status_code": 404}
+        today, start_date = date_window(365)
+        values = local_engine.composite(cube, start_date.strftime('%Y-%m-%d'), today.strftime('%Y-%m-%d'), reducer)
+        return local_engine.render_png(values)
+    except ValueError as e:
+        return {"error": str(e), "status_code": 400}
+    except Exception as e:
+        print(f"Error in local composite: {e}")
+        return {"error": str(e)}
+
+@app.post("/aoi/{aoi_name}/composites")
+async def build_aoi_composite(aoi_name: str, start: str = None, end: str = None, percentiles: str = "50"):
+    """Queue per-pixel NDVI percentiles over the AOI's local datacube, computed with a process pool.
+
+    A continental composite outlasts any lane timeout, so it runs as a "composite" job; poll the returned job.
+    """
+    try:
+        job, created = job_queue.submit("composite", {"aoi": aoi_name, "start": start, "end": end,
+                                                      "percentiles": percentiles})
+    except ValueError as e:
+        return {"error": str(e)}
+    return {**jobs.job_view(job), "created": created}
+
+@app.get("/aoi/{aoi_name}/summary")
+async def get_aoi_summary(aoi_name: str, refine: bool = False, budget: float = None):
+    """AOI-wide NDVI mean, percentiles and histogram at a scale sized to a latency budget"""
+    if aoi_name not in aoi_registry:
+        return _unknown_aoi(aoi_name)
+    key = _aoi_summary_key(aoi_name, refine, budget)
+    cached = await result_cache.aget(key, count_miss=False)
+    if cached is not None:
+        return cached
+    return await single_flight.run(key, lambda: run_ee("heavy", _get_aoi_summary, aoi_name, key))
+
+def _aoi_summary_key(aoi_name, refine, budget):
+    from app import aoi_summary
+    plan = aoi_summary.plan(aoi_registry[aoi_name]["bounds"], budget or aoi_summary.SUMMARY_LATENCY_BUDGET, refine)
+    today, start_date = date_window(365)
+    return ("summary", aoi_name, aoi_registry[aoi_name]["version"], start_date.strftime('%Y-%m-%d'), today.strftime('%Y-%m-%d'), plan["scale"], plan["grid"])
+
+def _get_aoi_summary(aoi_name, key):
+    from app import aoi_summary
+    init_ee_once()
+    try:
+        cached = result_cache.get(key)
+        if cached is not None:
+            return cached
+        _, _, _, start, end, scale, grid = key
+        aoi = aoi_registry[aoi_name]
+        pipeline = get_pipeline(aoi["spec"], start, end)
+        # Reduction tiles cover the bounding box; clipping keeps polygon AOIs to their own pixels
+        summary = aoi_summary.summarize(pipeline.ndvi.median().clip(pipeline.geometry), aoi["bounds"], scale, grid)
+        result = {
+            "aoi_name": aoi_registry[aoi_name]["name"],
+            **summary,
+            "scale": scale,
+            "tiles": grid * grid,
+            # Coarser than the native 10 m grid: a refine=true request trades latency for detail
+            "approximate": scale > aoi_summary.NATIVE_SCALE,
+            "date_range": {"start": start, "end": end}
+        }
+        result_cache.put(key, result)
+        return result
+    except Exception as e:
+        print(f"Error in get_aoi_summary: {e}")
+        return {"error": str(e)}
+
+@app.get("/aoi/{aoi_name}/scenes")
+async def get_aoi_scenes(aoi_name: str, start: str = None, end: str = None, max_cloud: float = CLOUD_THRESHOLD):
+    """Sentinel-2 scenes over an AOI, oldest first, answered from the local scene index"""
+    if aoi_name not in aoi_registry:
+        return _unknown_aoi(aoi_name)
+    try:
+        start, end = _window_params({"start": start, "end": end})
+    except ValueError as e:
+        return {"error": str(e)}
+    return await run_ee("heavy", _get_aoi_scenes, aoi_name, start, end, max_cloud)
+
+def _get_aoi_scenes(aoi_name, start, end, max_cloud):
+    init_ee_once()
+    aoi = aoi_registry[aoi_name]
+    scenes = scene_index.scenes(aoi["spec"], start, end, max_cloud)
+    if scenes is None:
+        # Too many cells to sync inline: index them on a thread of their own instead of holding a heavy slot
+        pending = scene_index.sync_in_background(aoi["spec"], start, end)
+        if pending:
+            return {"error": f"Indexing {pending} grid cells for {aoi['name']} in the background; retry shortly",
+                    "pending_cells": pending}
+        return {"error": "Scene index is unavailable; see scene_index in /health"}
+    return {
+        "aoi_name": aoi["name"],
+        "count": len(scenes),
+        "scenes": scenes,
+        "date_range": {"start": start, "end": end}
+    }
+
+
+@app.get("/aoi/{aoi_name}/catalog")
+async def list_catalog(aoi_name: str):
+    """Monthly and seasonal composites precomputed for an AOI, newest first"""
+    if aoi_name not in aoi_registry:
+        return _unknown_aoi(aoi_name)
+    periods = [{
+        "period": entry["period"],
+        "kind": entry["kind"],
+        "date_range": {"start": entry["start"], "end": entry["end"]},
+        "image_count": entry["image_count"],
+        "mean": (entry["summary"] or {}).get("mean")
+    } for entry in catalog.list(aoi_registry[aoi_name])]
+    return {"aoi_name": aoi_registry[aoi_name]["name"], "periods": periods}
+
+@app.get("/aoi/{aoi_name}/catalog/{period}")
+async def get_catalog_composite(aoi_name: str, period: str):
+    """Median NDVI layer and summary for one month (YYYY-MM) or season (YYYY-DJF|MAM|JJA|SON).
+
+    Served from the catalog; a period the scheduler has not reached yet is computed once and stored.
+    """
+    if aoi_name not in aoi_registry:
+        return _unknown_aoi(aoi_name)
+    try:
+        parse_period(period)
+    except ValueError as e:
+        return {"error": str(e)}
+    entry = catalog.get(aoi_registry[aoi_name], period)
+    if entry is None or mapid_expired(entry):
+        key = ("catalog", aoi_name, aoi_registry[aoi_name]["version"], period)
+        entry = await single_flight.run(key, lambda: run_ee("heavy", _catalog_entry, aoi_name, period))
+    return _catalog_response(aoi_name, entry)
+
+# Tile requests for a cold or expired catalog period share one build or map ID refresh
+_catalog_builds = BlockingSingleFlight()
+
+def _catalog_entry(aoi_name, period):
+    """Return the catalog entry for a period, computing it or refreshing its map ID as needed"""
+    aoi = aoi_registry[aoi_name]
+    entry = catalog.get(aoi, period)
+    if entry is None or mapid_expired(entry):
+        entry = _catalog_builds.run((aoi_name, aoi["version"], period), lambda: _update_catalog_entry(aoi, period))
+    return entry
+
+def _update_catalog_entry(aoi, period):
+    # Re-read, since the build this call waited its turn behind may have stored the entry already
+    entry = catalog.get(aoi, period)
+    if entry is None:
+        entry = build_entry(aoi, period)
+        catalog.put(entry)
+        entry = catalog.get(aoi, period)
+    elif mapid_expired(entry):
+        entry = refresh_mapid(aoi, entry)
+        catalog.put(entry, entry["computed_at"])
+    return entry
+
+def _catalog_response(aoi_name, entry):
+    response = {
+        "aoi_name": aoi_registry[aoi_name]["name"],
+        "period": entry["period"],
+        "kind": entry["kind"],
+        "date_range": {"start": entry["start"], "end": entry["end"]},
+        "image_count": entry["image_count"],
+        "summary": entry["summary"]
+    }
+    if entry["mapid"] is not None:
+        response.update(_tile_urls(entry["mapid"], f"/tiles/{aoi_name}/{{z}}/{{x}}/{{y}}.png?period={entry['period']}"))
+    return response
+
+def _window_params(params):
+    today, start_date = date_window(365)
+    start = str(params.get("start") or start_date.strftime('%Y-%m-%d'))
+    end = str(params.get("end") or today.strftime('%Y-%m-%d'))
+    if start >= end:
+        raise ValueError(f"Empty date range {start} to {end}")
+    return start, end
+
+def _normalize_composite_job(params):
+    from app import local_engine
+    aoi_name = params.get("aoi")
+    if aoi_name not in aoi_registry:
+        raise ValueError(f"AOI '{aoi_name}' not found. List AOIs with GET /aois")
+    start, end = _window_params(params)
+    percentiles = params.get("percentiles") or [50]
+    if isinstance(percentiles, str):
+        percentiles = percentiles.split(',')
+    try:
+        percentiles = sorted(float(p) for p in percentiles)
+    except (TypeError, ValueError):
+        raise ValueError("percentiles must be numbers between 0 and 100")
+    if not all(0 <= p <= 100 for p in percentiles):
+        raise ValueError("percentiles must be numbers between 0 and 100")
+    # Part of the job ID, so re-ingesting the cube computes the composite again instead of reusing the old result
+    cube = local_engine.cube_version(aoi_name)
+    if cube is None:
+        raise ValueError(f"No local datacube for AOI '{aoi_name}'. Ingest one with POST /aoi/{aoi_name}/cube")
+    return {"aoi": aoi_name, "start": start, "end": end, "percentiles": percentiles, "cube": cube}
+
+async def _run_composite_job(params, progress):
+    from app import compositing, local_engine
+    if local_engine.open_cube(params["aoi"]) is None:
+        raise Exception(f"No local datacube for AOI '{params['aoi']}'. Ingest one with POST /aoi/{params['aoi']}/cube")
+    return await asyncio.to_thread(
+        compositing.build_composite, params["aoi"], params["start"], params["end"], params["percentiles"],
+        progress=lambda done, total: progress(done / total, f"{done}/{total} chunks"))
+
+def _normalize_cube_job(params):
+    from app import local_engine
+    aoi_name = params.get("aoi")
+    if aoi_name not in aoi_registry:
+        raise ValueError(f"AOI '{aoi_name}' not found. List AOIs with GET /aois")
+    try:
+        width, height = int(params.get("width", 1024)), int(params.get("height", 1024))
+    except (TypeError, ValueError):
+        raise ValueError("width and height must be integers")
+    if width <= 0 or height <= 0 or width * height > local_engine.LOCAL_CUBE_MAX_PIXELS:
+        raise ValueError(f"Cube slice {width}x{height} must be positive and at most "
+                         f"LOCAL_CUBE_MAX_PIXELS ({local_engine.LOCAL_CUBE_MAX_PIXELS}) pixels")
+    today, start_date = date_window(365)
+    # The window is part of the job ID, so a day later the same request ingests fresh scenes
+    return {"aoi": aoi_name, "width": width, "height": height,
+            "start": start_date.strftime('%Y-%m-%d'), "end": today.strftime('%Y-%m-%d')}
+
+def _start_cube_ingest(params):
+    from app import local_engine
+    init_ee_once()
+    aoi = aoi_registry[params["aoi"]]
+    pipeline = get_pipeline(aoi["spec"], params["start"], params["end"])
+    return local_engine.CubeIngest(params["aoi"], pipeline, aoi["bounds"], params["width"], params["height"])
+
+async def _run_cube_job(params, progress):
+    # Each scene is its own call on the jobs lane, so no single call approaches the lane timeout
+    ingest = await run_ee("jobs", _start_cube_ingest, params)
+    try:
+        for t in range(len(ingest.ids)):
+            await run_ee("jobs", ingest.fetch, t)
+            progress((t + 1) / len(ingest.ids), f"{t + 1}/{len(ingest.ids)} scenes")
+    except BaseException:
+        ingest.abort()
+        raise
+    slices = await asyncio.to_thread(ingest.finish)
+    return {"aoi_name": aoi_registry[params["aoi"]]["name"], "slices": slices,
+            "shape": [slices, params["height"], params["width"]], "date_range": {"start": params["start"], "end": params["end"]}}
+
+def _normalize_time_series_job(params):
+    try:
+        pixel = snap(float(params["lat"]), float(params["lng"]))
+    except (KeyError, TypeError, ValueError):
+        raise ValueError("lat and lng are required numbers")
+    start, end = _window_params(params)
+    start, end = max(start, TIMESERIES_EARLIEST), min(end, date.today().isoformat())
+    if start >= end:
+        raise ValueError(f"Empty date range {start} to {end}")
+    # Keyed by pixel so clicks within the same 10 m pixel share one job
+    return {"lat": pixel.lat, "lng": pixel.lng, "start": start, "end": end}
+
+async def _run_time_series_job(params, progress):
+    pixel = snap(params["lat"], params["lng"])
+    start, end = date.fromisoformat(params["start"]), date.fromisoformat(params["end"])
+    points = []
+    async for line in _time_series_lines(pixel, params["start"], params["end"], lane="jobs"):
+        point = json.loads(line)
+        if "error" in point:
+            # A failed shard ends the stream with an error line; keep EE's message as the job error
+            raise Exception(point["error"])
+        points.append(point)
+        progress((date.fromisoformat(point["date"]) - start) / (end - start), point["date"])
+    return {"pixel": {"id": pixel.key, "lat": pixel.lat, "lng": pixel.lng}, "time_series": points,
+            "count": len(points), "date_range": {"start": params["start"], "end": params["end"]}}
+
+job_queue.register("composite", _normalize_composite_job, _run_composite_job)
+job_queue.register("time-series", _normalize_time_series_job, _run_time_series_job)
+job_queue.register("cube", _normalize_cube_job, _run_cube_job)
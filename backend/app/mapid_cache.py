@@ -0,0 +1,128 @@
+import os
+import json
+import time
+import asyncio
+import threading
+from app.cache import Cache
+from app.ee_executor import submit_ee
+from app.single_flight import BlockingSingleFlight
+
+# Map IDs are valid for several hours; refresh them in the background well before that
+MAPID_CACHE_TTL = float(os.getenv('MAPID_CACHE_TTL', 4 * 3600))
+MAPID_CACHE_REFRESH_AHEAD = float(os.getenv('MAPID_CACHE_REFRESH_AHEAD', 0.75))
+
+
+def make_key(aoi_name, start_date, end_date, cloud_threshold, vis_params, **extra):
+    """Build a hashable cache key from an AOI, a day-snapped date window and render settings"""
+    return (
+        aoi_name,
+        start_date.strftime('%Y-%m-%d'),
+        end_date.strftime('%Y-%m-%d'),
+        cloud_threshold,
+        json.dumps(vis_params, sort_keys=True),
+        json.dumps(extra, sort_keys=True),
+    )
+
+
+class MapIdCache:
+    """TTL cache of Earth Engine map IDs with stale-while-revalidate refresh.
+
+    Fresh entries are returned directly. Entries older than
+    ``ttl * refresh_ahead`` are still returned, but a rebuild is started in a
+    background thread so the next caller gets a new map ID. Expired entries are
+    rebuilt on the request path. Concurrent builds of one key are coalesced, so
+    a cold layer costs one getMapId and listeners hear about it once.
+    """
+
+    def __init__(self, ttl=MAPID_CACHE_TTL, refresh_ahead=MAPID_CACHE_REFRESH_AHEAD):
+        self.ttl = ttl
+        self.refresh_ahead = refresh_ahead
+        # Entries live in the shared cache backend so other workers reuse the same map IDs
+        self._entries = Cache("mapid", ttl=ttl)
+        self._refreshing = set()
+        self._builds = BlockingSingleFlight()
+        self._listeners = []
+        self._lock = threading.Lock()
+
+    def add_listener(self, callback):
+        """Call callback(key, value) whenever a map ID is built or refreshed"""
+        self._listeners.append(callback)
+
+    def get(self, key, build):
+        """Return the cached value for key, calling build() on a miss or expiry"""
+        entry = self._entries.get(key)
+        if entry is not None:
+            age = time.time() - entry['created_at']
+            if age < self.ttl:
+                if age >= self.ttl * self.refresh_ahead:
+                    self._refresh_async(key, build)
+                return entry['value']
+        return self._build(key, build)
+
+    def peek(self, key, build=None):
+        """Return the cached value for key, or None, without building it; given build, a stale entry is still refreshed"""
+        entry = self._entries.get(key, count_miss=False)
+        if entry is None:
+            return None
+        age = time.time() - entry['created_at']
+        if age >= self.ttl:
+            return None
+        if build is not None and age >= self.ttl * self.refresh_ahead:
+            self._refresh_async(key, build)
+        return entry['value']
+
+    async def apeek(self, key, build=None):
+        """peek() for async handlers; SQLite and Redis lookups run off the event loop"""
+        if self._entries.backend.name == 'memory':
+            return self.peek(key, build)
+        return await asyncio.to_thread(self.peek, key, build)
+
+    def clear(self):
+        self._entries.clear()
+
+    def status(self):
+        return {**self._entries.status(), "builds": self._builds.status()}
+
+    async def astatus(self):
+        return {**await self._entries.astatus(), "builds": self._builds.status()}
+
+    def _build(self, key, build):
+        def run():
+            # A build that finished just before this one started has already stored a fresh entry
+            entry = self._entries.get(key, count_miss=False)
+            if entry is not None and time.time() - entry['created_at'] < self.ttl:
+                return entry['value']
+            return self._store(key, build())
+        return self._builds.run(key, run)
+
+    def _store(self, key, value):
+        self._entries.put(key, {'value': value, 'created_at': time.time()})
+        for callback in self._listeners:
+            try:
+                callback(key, value)
+            except Exception as e:
+                print(f"Map ID listener failed for {key[0]}: {e}")
+        return value
+
+    def _refresh_async(self, key, build):
+        with self._lock:
+            if key in self._refreshing:
+                return
+            self._refreshing.add(key)
+
+        def done(future):
+            try:
+                future.result()
+                print(f"Map ID refreshed for {key[0]}")
+            except Exception as e:
+                # Keep serving the stale entry until it expires
+                print(f"Map ID refresh failed for {key[0]}: {e}")
+            finally:
+                with self._lock:
+                    self._refreshing.discard(key)
+
+        # Background refreshes take a slot on the jobs lane like any other background EE work
+        submit_ee("jobs", self._builds.run, key, lambda: self._store(key, build())).add_done_callback(done)
+
+
+mapid_cache = MapIdCache()
@@ -0,0 +1,173 @@
+import os
+import time
+import threading
+import contextvars
+from contextlib import contextmanager
+
+# Upper bounds in seconds of the latency histogram buckets
+METRICS_BUCKETS = [float(b) for b in os.getenv(
+    'METRICS_BUCKETS', '0.001,0.005,0.01,0.025,0.05,0.1,0.25,0.5,1,2.5,5,10,30').split(',')]
+ROUND_TRIP_BUCKETS = [0, 1, 2, 3, 5, 10, 20, 50]
+
+# Label for work done outside any request: tile warming, map ID refresh, the token thread
+BACKGROUND = "background"
+
+
+class Histogram:
+    """Cumulative-bucket histogram keyed by label values, rendered in Prometheus text format"""
+
+    def __init__(self, name, help, labels, buckets=METRICS_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.buckets = buckets
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, *label_values):
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None:
+                series = self._series[label_values] = {"buckets": [0] * len(self.buckets), "sum": 0.0, "count": 0}
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series["buckets"][i] += 1
+            series["sum"] += value
+            series["count"] += 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for label_values, series in sorted(self._series.items()):
+                labels = ",".join(f'{k}="{_escape(v)}"' for k, v in zip(self.labels, label_values))
+                for bound, count in zip(self.buckets, series["buckets"]):
+                    lines.append(f'{self.name}_bucket{{{labels},le="{bound:g}"}} {count}')
+                lines.append(f'{self.name}_bucket{{{labels},le="+Inf"}} {series["count"]}')
+                lines.append(f'{self.name}_sum{{{labels}}} {series["sum"]:.6f}')
+                lines.append(f'{self.name}_count{{{labels}}} {series["count"]}')
+        return lines
+
+
+class Counter:
+    def __init__(self, name, help, labels):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *label_values):
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for label_values, value in sorted(self._values.items()):
+                labels = ",".join(f'{k}="{_escape(v)}"' for k, v in zip(self.labels, label_values))
+                lines.append(f"{self.name}{{{labels}}} {value}")
+        return lines
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+stage_seconds = Histogram("ndvi_stage_seconds", "Time spent per processing stage", ["stage", "endpoint"])
+request_seconds = Histogram("ndvi_request_seconds", "End-to-end request latency", ["endpoint"])
+ee_round_trips = Histogram("ndvi_ee_round_trips", "Earth Engine calls made per request", ["endpoint"],
+                           buckets=ROUND_TRIP_BUCKETS)
+requests_total = Counter("ndvi_requests_total", "Requests served", ["endpoint", "status"])
+REGISTRY = [request_seconds, stage_seconds, ee_round_trips, requests_total]
+
+
+class RequestContext:
+    """Per-request stage timings, labelled with the route once routing has resolved it"""
+
+    def __init__(self):
+        self.stages = []
+        self.round_trips = 0
+
+
+_current = contextvars.ContextVar('ndvi_request', default=None)
+
+
+def observe(stage, seconds):
+    context = _current.get()
+    if context is None:
+        stage_seconds.observe(seconds, stage, BACKGROUND)
+    else:
+        context.stages.append((stage, seconds))
+
+@contextmanager
+def timer(stage):
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe(stage, time.perf_counter() - started)
+
+def timed(stage, fn, round_trip=False):
+    """Wrap fn so each call is timed as stage and optionally counted as an EE round trip"""
+    def wrapper(*args, **kwargs):
+        if round_trip:
+            context = _current.get()
+            if context is not None:
+                context.round_trips += 1
+        with timer(stage):
+            return fn(*args, **kwargs)
+    wrapper.__wrapped__ = fn
+    return wrapper
+
+
+_ee_instrumented = False
+
+def instrument_ee():
+    """Time and count the ee.data calls that go over the network; getInfo() goes through computeValue"""
+    global _ee_instrumented
+    if _ee_instrumented:
+        return
+    import ee
+    for name, stage in (("computeValue", "getInfo"), ("getMapId", "getMapId"), ("computePixels", "computePixels")):
+        setattr(ee.data, name, timed(stage, getattr(ee.data, name), round_trip=True))
+    _ee_instrumented = True
+
+
+class MetricsMiddleware:
+    """ASGI middleware recording request latency, EE round trips and stage timings per route template"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        context = RequestContext()
+        token = _current.set(context)
+        status = {"code": 500}
+
+        async def send_with_status(message):
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+            await send(message)
+
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            _current.reset(token)
+            route = scope.get("route")
+            # Unmatched paths share one label so scanners cannot blow up cardinality
+            endpoint = getattr(route, "path", "unmatched")
+            request_seconds.observe(time.perf_counter() - started, endpoint)
+            ee_round_trips.observe(context.round_trips, endpoint)
+            requests_total.inc(endpoint, status["code"])
+            for stage, seconds in context.stages:
+                stage_seconds.observe(seconds, stage, endpoint)
+
+
+def render():
+    lines = []
+    for metric in REGISTRY:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
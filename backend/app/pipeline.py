@@ -0,0 +1,118 @@
+import os
+import json
+import threading
+from collections import OrderedDict
+from app.gee import CLOUD_THRESHOLD
+from app import metrics
+
+S2_COLLECTION = 'COPERNICUS/S2_SR_HARMONIZED'
+
+# Number of (geometry, window, cloud threshold) pipelines kept alive
+PIPELINE_CACHE_SIZE = int(os.getenv('PIPELINE_CACHE_SIZE', 256))
+
+
+def maskS2clouds(image):
+    qa = image.select('QA60')
+    cloudBitMask = 1 << 10
+    cirrusBitMask = 1 << 11
+    mask = qa.bitwiseAnd(cloudBitMask).eq(0).And(
+        qa.bitwiseAnd(cirrusBitMask).eq(0))
+    return image.updateMask(mask).divide(10000)
+
+def to_ndvi(img):
+    return img.normalizedDifference(['B8', 'B4']).rename('NDVI')\
+              .copyProperties(img, ['system:time_start'])
+
+def ndvi_collection(s2):
+    """Cloud-mask a filtered Sentinel-2 collection and map it to single-band NDVI images"""
+    return s2.map(maskS2clouds).map(to_ndvi)
+
+
+def point_spec(lat, lng):
+    return ('point', lng, lat)
+
+def rect_spec(bounds):
+    return ('rect',) + tuple(bounds)
+
+def points_spec(coords):
+    """Spec for a multi-point geometry from (lng, lat) pairs"""
+    return ('points',) + tuple((lng, lat) for lng, lat in coords)
+
+def polygon_spec(geometry):
+    """Spec for a GeoJSON Polygon or MultiPolygon"""
+    return ('polygon', json.dumps(geometry, sort_keys=True))
+
+def make_geometry(spec):
+    import ee
+    kind = spec[0]
+    if kind == 'point':
+        return ee.Geometry.Point([spec[1], spec[2]])
+    if kind == 'rect':
+        return ee.Geometry.Rectangle(list(spec[1:]))
+    if kind == 'points':
+        return ee.Geometry.MultiPoint([list(c) for c in spec[1:]])
+    if kind == 'polygon':
+        geometry = json.loads(spec[1])
+        if geometry['type'] == 'MultiPolygon':
+            return ee.Geometry.MultiPolygon(geometry['coordinates'], None, False)
+        return ee.Geometry.Polygon(geometry['coordinates'], None, False)
+    raise ValueError(f"Unknown geometry spec: {kind}")
+
+
+def _date_str(value):
+    return value if isinstance(value, str) else value.strftime('%Y-%m-%d')
+
+
+class NdviPipeline:
+    """Filtered Sentinel-2 collection and its cloud-masked NDVI collection for one request shape.
+
+    Handlers only add their final reducer on top of ``ndvi`` (or the shared
+    per-pixel ``stats`` image), so the expression graph, including the traced
+    mask and NDVI functions, is built once per key and reused.
+    """
+
+    def __init__(self, spec, start, end, cloud_threshold):
+        import ee
+        self.spec = spec
+        self.start = start
+        self.end = end
+        self.cloud_threshold = cloud_threshold
+        self.geometry = make_geometry(spec)
+        self.s2 = ee.ImageCollection(S2_COLLECTION)\
+                    .filterBounds(self.geometry)\
+                    .filterDate(start, end)\
+                    .filter(ee.Filter.lt('CLOUDY_PIXEL_PERCENTAGE', cloud_threshold))
+        self.ndvi = ndvi_collection(self.s2)
+        self._stats = None
+
+    @property
+    def stats(self):
+        """Per-pixel NDVI mean, stdDev, min and max over the collection"""
+        import ee
+        if self._stats is None:
+            self._stats = self.ndvi.reduce(ee.Reducer.mean().combine(
+                ee.Reducer.stdDev(), '', True).combine(
+                ee.Reducer.minMax(), '', True)
+            )
+        return self._stats
+
+
+_pipelines = OrderedDict()
+_lock = threading.Lock()
+
+def get_pipeline(spec, start, end, cloud_threshold=CLOUD_THRESHOLD):
+    """Return the memoized pipeline for a geometry spec and date window, building it on a miss"""
+    key = (spec, _date_str(start), _date_str(end), cloud_threshold)
+    with _lock:
+        pipeline = _pipelines.get(key)
+        if pipeline is not None:
+            _pipelines.move_to_end(key)
+            return pipeline
+    with metrics.timer("graph_build"):
+        pipeline = NdviPipeline(spec, key[1], key[2], cloud_threshold)
+    with _lock:
+        _pipelines[key] = pipeline
+        _pipelines.move_to_end(key)
+        while len(_pipelines) > PIPELINE_CACHE_SIZE:
+            _pipelines.popitem(last=False)
+    return pipeline
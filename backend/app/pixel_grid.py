@@ -0,0 +1,79 @@
+import math
+from collections import namedtuple
+
+# Sentinel-2 10 m bands are delivered on a 10 m grid in the UTM zone of each tile
+PIXEL_SIZE = 10
+
+_A = 6378137.0
+_F = 1 / 298.257223563
+_E2 = _F * (2 - _F)
+_EP2 = _E2 / (1 - _E2)
+_K0 = 0.9996
+
+Pixel = namedtuple('Pixel', ['key', 'epsg', 'col', 'row', 'lat', 'lng'])
+
+
+def utm_zone(lat, lng):
+    """Return (zone number, northern hemisphere) for a WGS84 coordinate"""
+    zone = int((lng + 180) // 6) + 1
+    return min(max(zone, 1), 60), lat >= 0
+
+def to_utm(lat, lng, zone, north):
+    """Project WGS84 lat/lng to UTM easting/northing in the given zone"""
+    lat_r = math.radians(lat)
+    lng0 = math.radians((zone - 1) * 6 - 180 + 3)
+    n = _A / math.sqrt(1 - _E2 * math.sin(lat_r) ** 2)
+    t = math.tan(lat_r) ** 2
+    c = _EP2 * math.cos(lat_r) ** 2
+    a = math.cos(lat_r) * (math.radians(lng) - lng0)
+    m = _meridian_arc(lat_r)
+    easting = _K0 * n * (a + (1 - t + c) * a ** 3 / 6
+                         + (5 - 18 * t + t ** 2 + 72 * c - 58 * _EP2) * a ** 5 / 120) + 500000.0
+    northing = _K0 * (m + n * math.tan(lat_r) * (a ** 2 / 2 + (5 - t + 9 * c + 4 * c ** 2) * a ** 4 / 24
+                                                 + (61 - 58 * t + t ** 2 + 600 * c - 330 * _EP2) * a ** 6 / 720))
+    if not north:
+        northing += 10000000.0
+    return easting, northing
+
+def from_utm(easting, northing, zone, north):
+    """Inverse of to_utm: UTM easting/northing back to WGS84 lat/lng"""
+    x = easting - 500000.0
+    y = northing if north else northing - 10000000.0
+    m = y / _K0
+    mu = m / (_A * (1 - _E2 / 4 - 3 * _E2 ** 2 / 64 - 5 * _E2 ** 3 / 256))
+    e1 = (1 - math.sqrt(1 - _E2)) / (1 + math.sqrt(1 - _E2))
+    phi1 = (mu + (3 * e1 / 2 - 27 * e1 ** 3 / 32) * math.sin(2 * mu)
+            + (21 * e1 ** 2 / 16 - 55 * e1 ** 4 / 32) * math.sin(4 * mu)
+            + (151 * e1 ** 3 / 96) * math.sin(6 * mu))
+    n1 = _A / math.sqrt(1 - _E2 * math.sin(phi1) ** 2)
+    t1 = math.tan(phi1) ** 2
+    c1 = _EP2 * math.cos(phi1) ** 2
+    r1 = _A * (1 - _E2) / (1 - _E2 * math.sin(phi1) ** 2) ** 1.5
+    d = x / (n1 * _K0)
+    lat = phi1 - (n1 * math.tan(phi1) / r1) * (d ** 2 / 2 - (5 + 3 * t1 + 10 * c1 - 4 * c1 ** 2 - 9 * _EP2) * d ** 4 / 24
+                                               + (61 + 90 * t1 + 298 * c1 + 45 * t1 ** 2 - 252 * _EP2 - 3 * c1 ** 2) * d ** 6 / 720)
+    lng = (d - (1 + 2 * t1 + c1) * d ** 3 / 6
+           + (5 - 2 * c1 + 28 * t1 - 3 * c1 ** 2 + 8 * _EP2 + 24 * t1 ** 2) * d ** 5 / 120) / math.cos(phi1)
+    return math.degrees(lat), math.degrees(lng) + (zone - 1) * 6 - 180 + 3
+
+def _meridian_arc(lat_r):
+    return _A * ((1 - _E2 / 4 - 3 * _E2 ** 2 / 64 - 5 * _E2 ** 3 / 256) * lat_r
+                 - (3 * _E2 / 8 + 3 * _E2 ** 2 / 32 + 45 * _E2 ** 3 / 1024) * math.sin(2 * lat_r)
+                 + (15 * _E2 ** 2 / 256 + 45 * _E2 ** 3 / 1024) * math.sin(4 * lat_r)
+                 - (35 * _E2 ** 3 / 3072) * math.sin(6 * lat_r))
+
+
+def snap(lat, lng, size=PIXEL_SIZE):
+    """Snap a coordinate to the Sentinel-2 pixel containing it.
+
+    Uses the point's own UTM zone, which matches the tile projection except in
+    the narrow overlap strips where a neighbouring zone's tile also covers it.
+    The returned lat/lng is the pixel centre.
+    """
+    zone, north = utm_zone(lat, lng)
+    easting, northing = to_utm(lat, lng, zone, north)
+    col = int(math.floor(easting / size))
+    row = int(math.floor(northing / size))
+    center_lat, center_lng = from_utm((col + 0.5) * size, (row + 0.5) * size, zone, north)
+    epsg = (32600 if north else 32700) + zone
+    return Pixel(f"{epsg}/{col}/{row}", epsg, col, row, center_lat, center_lng)
@@ -0,0 +1,8 @@
+import os
+from app.cache import Cache
+
+# Computed point and AOI summary results, keyed by snapped pixel or AOI plus the date window.
+# Keys roll over with the window every day; the TTL only bounds how long a result outlives it
+RESULT_CACHE_TTL = float(os.getenv('RESULT_CACHE_TTL', 24 * 3600))
+
+result_cache = Cache("result", ttl=RESULT_CACHE_TTL)
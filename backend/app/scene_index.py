@@ -0,0 +1,284 @@
+import os
+import json
+import math
+import time
+import calendar
+import sqlite3
+import threading
+from collections import OrderedDict
+from datetime import date, datetime, timedelta, timezone
+from app import geometry, metrics
+from app.gee import CLOUD_THRESHOLD
+from app.pipeline import S2_COLLECTION
+
+# Local index of Sentinel-2 scene metadata used for image counts instead of EE round trips
+SCENE_INDEX_ENABLED = os.getenv('SCENE_INDEX_ENABLED', 'true').lower() == 'true'
+SCENE_INDEX_PATH = os.getenv('SCENE_INDEX_PATH', '/tmp/ndvi-scenes.sqlite')
+# Scenes are synced per grid cell of this many degrees
+SCENE_INDEX_CELL_DEG = float(os.getenv('SCENE_INDEX_CELL_DEG', 1.0))
+# Days of history fetched when a cell is first synced; covers the 730-day fallback window
+SCENE_INDEX_DAYS = int(os.getenv('SCENE_INDEX_DAYS', 800))
+# Seconds before a cell is synced again for windows reaching the present, and the days re-fetched
+# then, since scenes are ingested a few days after acquisition
+SCENE_INDEX_REFRESH = float(os.getenv('SCENE_INDEX_REFRESH', 3600))
+SCENE_INDEX_OVERLAP_DAYS = int(os.getenv('SCENE_INDEX_OVERLAP_DAYS', 5))
+# Cells a request may sync inline; larger regions fall back to counting on EE
+SCENE_INDEX_MAX_SYNC_CELLS = int(os.getenv('SCENE_INDEX_MAX_SYNC_CELLS', 4))
+# Parsed scene footprints kept in memory for point-in-footprint and overlap tests
+SCENE_INDEX_FOOTPRINT_CACHE = int(os.getenv('SCENE_INDEX_FOOTPRINT_CACHE', 20000))
+
+
+def _iso(value):
+    return value if isinstance(value, str) else value.strftime('%Y-%m-%d')
+
+def _ms(day):
+    return calendar.timegm(date.fromisoformat(day).timetuple()) * 1000
+
+def _day(ms):
+    return datetime.fromtimestamp(ms / 1000, timezone.utc).strftime('%Y-%m-%d')
+
+def _spec_bounds(spec):
+    """Query bounds of a pipeline geometry spec, or None for specs the index does not answer"""
+    if spec[0] == 'point':
+        return [spec[1], spec[2], spec[1], spec[2]]
+    if spec[0] == 'rect':
+        return list(spec[1:])
+    if spec[0] == 'polygon':
+        return geometry.bbox(json.loads(spec[1]))
+    return None
+
+def _cells(bounds):
+    west, south, east, north = bounds
+    size = SCENE_INDEX_CELL_DEG
+    return [(i, j) for i in range(math.floor(west / size), math.floor(east / size) + 1)
+                   for j in range(math.floor(south / size), math.floor(north / size) + 1)]
+
+
+class SceneIndex:
+    """SQLite index of scene IDs, acquisition times, footprints and cloud cover.
+
+    Each grid cell records the acquisition dates it covers. A query first
+    syncs the cells under it that are missing or stale, fetching only
+    metadata in one getInfo per cell, then counts and lists scenes locally.
+    Queries that would need more than ``max_sync`` cells synced, or whose
+    sync fails, return None so the caller can ask EE instead.
+    """
+
+    def __init__(self, path=SCENE_INDEX_PATH):
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._lock = threading.Lock()
+        self._cell_locks = {}
+        self._footprints = OrderedDict()
+        self._footprints_lock = threading.Lock()
+        self._background = set()
+        self.hits = 0
+        self.fallbacks = 0
+        self.syncs = 0
+        self.sync_errors = 0
+        with self._lock, self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS scenes (
+                    id TEXT PRIMARY KEY,
+                    time_start INTEGER NOT NULL,
+                    cloud REAL NOT NULL,
+                    west REAL NOT NULL, south REAL NOT NULL, east REAL NOT NULL, north REAL NOT NULL,
+                    footprint TEXT NOT NULL
+                )""")
+            self._conn.execute("CREATE INDEX IF NOT EXISTS scenes_time ON scenes (time_start)")
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS cells (
+                    cell TEXT PRIMARY KEY,
+                    start TEXT NOT NULL,
+                    until TEXT NOT NULL,
+                    synced_at REAL NOT NULL
+                )""")
+            # Kept for status() so /health does not count the table on every call
+            self._totals = self._count_rows()
+
+    def _count_rows(self):
+        return (self._conn.execute("SELECT COUNT(*) FROM scenes").fetchone()[0],
+                self._conn.execute("SELECT COUNT(*) FROM cells").fetchone()[0])
+
+    def _cell_key(self, cell):
+        return f"{SCENE_INDEX_CELL_DEG:g}:{cell[0]}:{cell[1]}"
+
+    def _cell_lock(self, key):
+        with self._lock:
+            return self._cell_locks.setdefault(key, threading.Lock())
+
+    def _cell_row(self, key):
+        with self._lock:
+            return self._conn.execute("SELECT start, until, synced_at FROM cells WHERE cell = ?", (key,)).fetchone()
+
+    def _pending(self, key, start, end):
+        """Date ranges a cell still needs fetched to answer [start, end)"""
+        today = date.today()
+        horizon = (today + timedelta(days=1)).isoformat()
+        row = self._cell_row(key)
+        if row is None:
+            return [(min(start, (today - timedelta(days=SCENE_INDEX_DAYS)).isoformat()), horizon)]
+        covered_start, until, synced_at = row
+        pending = []
+        if start < covered_start:
+            pending.append((start, covered_start))
+        settled = (date.fromisoformat(until) - timedelta(days=SCENE_INDEX_OVERLAP_DAYS)).isoformat()
+        if end > settled and time.time() - synced_at >= SCENE_INDEX_REFRESH:
+            pending.append((settled, horizon))
+        return pending
+
+    def _fetch(self, cell, start, end):
+        import ee
+        size = SCENE_INDEX_CELL_DEG
+        region = ee.Geometry.Rectangle([cell[0] * size, cell[1] * size, (cell[0] + 1) * size, (cell[1] + 1) * size])
+        s2 = ee.ImageCollection(S2_COLLECTION).filterBounds(region).filterDate(start, end)\
+               .filter(ee.Filter.notNull(['CLOUDY_PIXEL_PERCENTAGE']))
+        return ee.Dictionary({
+            'id': s2.aggregate_array('system:index'),
+            'time': s2.aggregate_array('system:time_start'),
+            'cloud': s2.aggregate_array('CLOUDY_PIXEL_PERCENTAGE'),
+            'footprint': s2.aggregate_array('system:footprint')
+        }).getInfo()
+
+    def _sync(self, cell, ranges):
+        key = self._cell_key(cell)
+        rows = []
+        for start, end in ranges:
+            result = self._fetch(cell, start, end)
+            for scene_id, time_start, cloud, footprint in zip(result['id'], result['time'], result['cloud'],
+                                                              result['footprint']):
+                ring = footprint['coordinates'][0] if footprint['type'] == 'Polygon' else footprint['coordinates']
+                shape = {"type": "Polygon", "coordinates": [ring]}
+                rows.append((scene_id, time_start, cloud, *geometry.bbox(shape), json.dumps(ring)))
+        row = self._cell_row(key)
+        covered_start = min([start for start, _ in ranges] + ([row[0]] if row else []))
+        until = max([end for _, end in ranges] + ([row[1]] if row else []))
+        with self._lock, self._conn:
+            self._conn.executemany("INSERT OR REPLACE INTO scenes VALUES (?, ?, ?, ?, ?, ?, ?, ?)", rows)
+            self._conn.execute("INSERT OR REPLACE INTO cells VALUES (?, ?, ?, ?)",
+                               (key, covered_start, until, time.time()))
+            self._totals = self._count_rows()
+        self.syncs += 1
+
+    def ensure(self, bounds, start, end, max_sync=SCENE_INDEX_MAX_SYNC_CELLS):
+        """Sync the cells under bounds for [start, end); False if that needs more than max_sync cells"""
+        pending = self._pending_cells(bounds, start, end)
+        if max_sync is not None and len(pending) > max_sync:
+            return False
+        for cell, _ in pending:
+            key = self._cell_key(cell)
+            with self._cell_lock(key):
+                # Another request may have synced the cell while this one waited
+                ranges = self._pending(key, start, end)
+                if ranges:
+                    self._sync(cell, ranges)
+        return True
+
+    def _pending_cells(self, bounds, start, end):
+        pending = [(cell, self._pending(self._cell_key(cell), start, end)) for cell in _cells(bounds)]
+        return [(cell, ranges) for cell, ranges in pending if ranges]
+
+    def sync_in_background(self, spec, start, end):
+        """Start syncing every cell under a spec on a thread of its own; returns the cells left to sync"""
+        bounds = _spec_bounds(spec)
+        if not SCENE_INDEX_ENABLED or bounds is None:
+            return 0
+        start, end = _iso(start), _iso(end)
+        pending = len(self._pending_cells(bounds, start, end))
+        key = (tuple(bounds), start, end)
+        with self._lock:
+            if not pending or key in self._background:
+                return pending
+            self._background.add(key)
+
+        def run():
+            try:
+                self.ensure(bounds, start, end, max_sync=None)
+            except Exception as e:
+                print(f"Scene index background sync failed: {e}")
+                self.sync_errors += 1
+            finally:
+                with self._lock:
+                    self._background.discard(key)
+
+        threading.Thread(target=run, name='scene-sync', daemon=True).start()
+        return pending
+
+    def _footprint(self, scene_id, coordinates):
+        with self._footprints_lock:
+            shape = self._footprints.get(scene_id)
+            if shape is not None:
+                self._footprints.move_to_end(scene_id)
+                return shape
+        shape = {"type": "Polygon", "coordinates": [json.loads(coordinates)]}
+        with self._footprints_lock:
+            self._footprints[scene_id] = shape
+            while len(self._footprints) > SCENE_INDEX_FOOTPRINT_CACHE:
+                self._footprints.popitem(last=False)
+        return shape
+
+    def _query(self, spec, bounds, start, end, cloud_threshold):
+        west, south, east, north = bounds
+        shape = json.loads(spec[1]) if spec[0] == 'polygon' else None
+        with metrics.timer("scene_index_lookup"):
+            with self._lock:
+                rows = self._conn.execute(
+                    "SELECT id, time_start, cloud, west, south, east, north, footprint FROM scenes"
+                    " WHERE time_start >= ? AND time_start < ?"
+                    " AND cloud < ? AND west <= ? AND east >= ? AND south <= ? AND north >= ? ORDER BY time_start",
+                    (_ms(start), _ms(end), cloud_threshold, east, west, north, south)).fetchall()
+
+            def match(scene_id, box, footprint):
+                if spec[0] == 'point':
+                    return geometry.contains(self._footprint(scene_id, footprint), spec[1], spec[2])
+                if shape is not None:
+                    # The composite only uses scenes that overlap the polygon itself, not just its bounding box
+                    return geometry.intersects(self._footprint(scene_id, footprint), shape)
+                # A footprint whose bounding box lies inside the query overlaps it without parsing the shape
+                if west <= box[0] and box[2] <= east and south <= box[1] and box[3] <= north:
+                    return True
+                return geometry.intersects_bbox(self._footprint(scene_id, footprint), bounds)
+
+            return [{"id": scene_id, "date": _day(time_start), "cloud": round(cloud, 2)}
+                    for scene_id, time_start, cloud, *box, footprint in rows if match(scene_id, box, footprint)]
+
+    def scenes(self, spec, start, end, cloud_threshold=CLOUD_THRESHOLD, max_sync=SCENE_INDEX_MAX_SYNC_CELLS):
+        """Scenes a pipeline with this spec and window would filter to, oldest first, or None"""
+        bounds = _spec_bounds(spec)
+        if not SCENE_INDEX_ENABLED or bounds is None:
+            return None
+        start, end = _iso(start), _iso(end)
+        try:
+            if not self.ensure(bounds, start, end, max_sync):
+                self.fallbacks += 1
+                return None
+        except Exception as e:
+            print(f"Scene index sync failed: {e}")
+            self.sync_errors += 1
+            self.fallbacks += 1
+            return None
+        self.hits += 1
+        return self._query(spec, bounds, start, end, cloud_threshold)
+
+    def count(self, spec, start, end, cloud_threshold=CLOUD_THRESHOLD, max_sync=SCENE_INDEX_MAX_SYNC_CELLS):
+        scenes = self.scenes(spec, start, end, cloud_threshold, max_sync)
+        return None if scenes is None else len(scenes)
+
+    def status(self):
+        scenes, cells = self._totals
+        return {"enabled": SCENE_INDEX_ENABLED, "scenes": scenes, "cells": cells, "hits": self.hits,
+                "fallbacks": self.fallbacks, "syncs": self.syncs, "sync_errors": self.sync_errors,
+                "footprints_cached": len(self._footprints), "background_syncs": len(self._background)}
+
+
+scene_index = SceneIndex()
+
+
+def image_count(pipeline, max_sync=SCENE_INDEX_MAX_SYNC_CELLS):
+    """Scenes in a pipeline's filtered collection, from the index when it can answer, else from EE"""
+    count = scene_index.count(pipeline.spec, pipeline.start, pipeline.end, pipeline.cloud_threshold, max_sync)
+    if count is None:
+        count = pipeline.s2.size().getInfo()
+    return count
@@ -0,0 +1,72 @@
+import os
+import time
+from datetime import date
+import sqlite3
+import threading
+
+# Local store of per-pixel NDVI observations, appended to incrementally
+SERIES_STORE_PATH = os.getenv('SERIES_STORE_PATH', '/tmp/ndvi-series.sqlite')
+
+
+class SeriesStore:
+    """SQLite store of NDVI observations keyed by snapped Sentinel-2 pixel.
+
+    Each series records ``synced_through``, the exclusive end date up to which
+    EE has already been queried, so a repeat query only fetches acquisitions
+    from that date on.
+    """
+
+    def __init__(self, path=SERIES_STORE_PATH):
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._lock = threading.Lock()
+        with self._lock, self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS observations (
+                    series TEXT NOT NULL,
+                    date TEXT NOT NULL,
+                    ndvi REAL NOT NULL,
+                    PRIMARY KEY (series, date)
+                )""")
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS series (
+                    series TEXT PRIMARY KEY,
+                    synced_from TEXT NOT NULL,
+                    synced_through TEXT NOT NULL,
+                    updated_at REAL NOT NULL
+                )""")
+
+    def synced_range(self, series):
+        """Return (synced_from, synced_through) for a series, or None if it was never fetched"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT synced_from, synced_through FROM series WHERE series = ?", (series,)).fetchone()
+        # Nothing after today has been fetched, whatever an older row claims
+        return (row[0], min(row[1], date.today().isoformat())) if row else None
+
+    def append(self, series, observations, synced_from, synced_through):
+        """Store (date, ndvi) observations and mark [synced_from, synced_through) as fetched"""
+        synced_through = min(synced_through, date.today().isoformat())
+        with self._lock, self._conn:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO observations (series, date, ndvi) VALUES (?, ?, ?)",
+                [(series, date, ndvi) for date, ndvi in observations])
+            self._conn.execute(
+                """INSERT INTO series (series, synced_from, synced_through, updated_at) VALUES (?, ?, ?, ?)
+                   ON CONFLICT(series) DO UPDATE SET
+                       synced_from = MIN(series.synced_from, excluded.synced_from),
+                       synced_through = MAX(series.synced_through, excluded.synced_through),
+                       updated_at = excluded.updated_at""",
+                (series, synced_from, synced_through, time.time()))
+
+    def get_series(self, series, start, end):
+        """Return (date, ndvi) observations with start <= date < end, oldest first"""
+        with self._lock:
+            return self._conn.execute(
+                "SELECT date, ndvi FROM observations WHERE series = ? AND date >= ? AND date < ? ORDER BY date",
+                (series, start, end)).fetchall()
+
+
+series_store = SeriesStore()
@@ -0,0 +1,101 @@
+import os
+import asyncio
+import threading
+from concurrent.futures import Future, TimeoutError as FutureTimeout
+from app.ee_executor import Overloaded
+
+# Longest a request waits on a computation started by another identical request
+SINGLE_FLIGHT_WAIT = float(os.getenv('SINGLE_FLIGHT_WAIT', 60))
+
+
+class SingleFlight:
+    """Coalesces concurrent identical computations into one in-flight task.
+
+    The first caller for a key starts the computation; callers arriving while
+    it runs await the same task and get the same result or exception. The key
+    is forgotten as soon as the task finishes, so nothing is cached here and a
+    failure is only shared with the requests that were already waiting on it.
+    """
+
+    def __init__(self, wait=SINGLE_FLIGHT_WAIT):
+        self.wait = wait
+        self.leaders = 0
+        self.followers = 0
+        self.timeouts = 0
+        self._tasks = {}
+
+    async def run(self, key, start):
+        """Return the result of start() for key, joining a running computation when there is one"""
+        task = self._tasks.get(key)
+        if task is None:
+            self.leaders += 1
+            # A task of its own so a disconnecting first caller does not cancel it for the rest
+            task = self._tasks[key] = asyncio.ensure_future(start())
+            task.add_done_callback(lambda _: self._forget(key, task))
+        else:
+            self.followers += 1
+        try:
+            return await asyncio.wait_for(asyncio.shield(task), self.wait)
+        except asyncio.TimeoutError:
+            self.timeouts += 1
+            raise Overloaded(f"identical request still running after {self.wait:.0f}s")
+
+    def _forget(self, key, task):
+        if self._tasks.get(key) is task:
+            del self._tasks[key]
+        if not task.cancelled():
+            # Mark the exception retrieved when every waiter has already given up
+            task.exception()
+
+    def status(self):
+        return {"in_flight": len(self._tasks), "leaders": self.leaders,
+                "followers": self.followers, "timeouts": self.timeouts}
+
+
+class BlockingSingleFlight:
+    """SingleFlight for code that already runs on a worker thread.
+
+    The first thread to ask for a key runs fn(); threads asking while it runs
+    block until it finishes and get the same result or exception.
+    """
+
+    def __init__(self, wait=SINGLE_FLIGHT_WAIT):
+        self.wait = wait
+        self.leaders = 0
+        self.followers = 0
+        self.timeouts = 0
+        self._futures = {}
+        self._lock = threading.Lock()
+
+    def run(self, key, fn):
+        """Return fn() for key, waiting on the thread already computing it when there is one"""
+        with self._lock:
+            future = self._futures.get(key)
+            leader = future is None
+            if leader:
+                self.leaders += 1
+                future = self._futures[key] = Future()
+            else:
+                self.followers += 1
+        if leader:
+            try:
+                future.set_result(fn())
+            except BaseException as e:
+                future.set_exception(e)
+            finally:
+                with self._lock:
+                    del self._futures[key]
+        try:
+            return future.result(self.wait)
+        except FutureTimeout:
+            self.timeouts += 1
+            raise Overloaded(f"identical computation still running after {self.wait:.0f}s")
+
+    def status(self):
+        with self._lock:
+            in_flight = len(self._futures)
+        return {"in_flight": in_flight, "leaders": self.leaders,
+                "followers": self.followers, "timeouts": self.timeouts}
+
+
+single_flight = SingleFlight()
@@ -0,0 +1,83 @@
+import os
+import time
+import threading
+
+# 'block' finishes warm-up before the server accepts requests, 'background' serves
+# /health and /ready right away and warms up on a thread, 'off' leaves everything lazy
+WARMUP_MODE = os.getenv('WARMUP_MODE', 'background').lower()
+# Seconds between retries while a required warm-up step keeps failing
+WARMUP_RETRY_DELAY = float(os.getenv('WARMUP_RETRY_DELAY', 15))
+
+
+class Readiness:
+    """Runs the warm-up steps and reports their progress.
+
+    Steps are (name, fn, required) and run in order. The app is ready once
+    every required step has succeeded. Failed required steps are retried
+    until they succeed, and a failed optional step is recorded without
+    blocking readiness.
+    """
+
+    def __init__(self):
+        self.ready = False
+        self.started_at = None
+        self.finished_at = None
+        self.attempts = 0
+        self._steps = {}
+        self._lock = threading.Lock()
+
+    def _record(self, name, **state):
+        with self._lock:
+            self._steps[name] = {**self._steps.get(name, {}), **state}
+
+    def run_once(self, steps):
+        """Run every step not yet done; return True when all required steps have succeeded"""
+        self.attempts += 1
+        if self.started_at is None:
+            self.started_at = time.time()
+        required_ok = True
+        for name, fn, required in steps:
+            if self._steps.get(name, {}).get("status") == "ok":
+                continue
+            self._record(name, status="running", required=required)
+            started = time.perf_counter()
+            try:
+                fn()
+                self._record(name, status="ok", seconds=round(time.perf_counter() - started, 3), error=None)
+            except Exception as e:
+                print(f"Warm-up step {name} failed: {e}")
+                self._record(name, status="failed", seconds=round(time.perf_counter() - started, 3), error=str(e))
+                if required:
+                    required_ok = False
+                    # Later steps depend on the required ones
+                    break
+        if required_ok:
+            self.ready = True
+            self.finished_at = time.time()
+            print(f"Warm-up finished in {self.finished_at - self.started_at:.1f}s")
+        return required_ok
+
+    def run(self, steps, retry_delay=WARMUP_RETRY_DELAY):
+        while not self.run_once(steps):
+            time.sleep(retry_delay)
+
+    def run_in_background(self, steps):
+        threading.Thread(target=self.run, args=(steps,), name='warmup', daemon=True).start()
+
+    def skip(self):
+        """Warm-up disabled: report ready and let requests initialize lazily"""
+        self.ready = True
+
+    def status(self):
+        with self._lock:
+            steps = {name: dict(state) for name, state in self._steps.items()}
+        return {
+            "ready": self.ready,
+            "mode": WARMUP_MODE,
+            "attempts": self.attempts,
+            "seconds": round((self.finished_at or time.time()) - self.started_at, 3) if self.started_at else None,
+            "steps": steps
+        }
+
+
+readiness = Readiness()
@@ -0,0 +1,131 @@
+import os
+import hashlib
+import threading
+from collections import OrderedDict
+import requests
+from app import metrics
+from requests.adapters import HTTPAdapter
+
+# On-disk tile store, bounded by total size and evicted least-recently-used first
+TILE_CACHE_DIR = os.getenv('TILE_CACHE_DIR', '/tmp/ndvi-tile-cache')
+TILE_CACHE_MAX_BYTES = int(os.getenv('TILE_CACHE_MAX_BYTES', 512 * 1024 * 1024))
+TILE_CACHE_MAX_AGE = int(os.getenv('TILE_CACHE_MAX_AGE', 3600))
+TILE_UPSTREAM_POOL_SIZE = int(os.getenv('TILE_UPSTREAM_POOL_SIZE', 32))
+TILE_UPSTREAM_TIMEOUT = float(os.getenv('TILE_UPSTREAM_TIMEOUT', 15))
+
+
+class UpstreamError(Exception):
+    def __init__(self, status_code, message):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+class TileCache:
+    """Size-bounded LRU of tile bytes stored as files under a cache directory.
+
+    The LRU order lives in memory and is rebuilt from file modification times
+    on startup, so a restarted process keeps its warm tiles.
+    """
+
+    def __init__(self, root=TILE_CACHE_DIR, max_bytes=TILE_CACHE_MAX_BYTES):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self._index = OrderedDict()
+        self._lock = threading.Lock()
+        self._load_index()
+
+    def _load_index(self):
+        os.makedirs(self.root, exist_ok=True)
+        entries = []
+        for dirpath, _, filenames in os.walk(self.root):
+            for name in filenames:
+                if name.endswith('.tmp'):
+                    continue
+                path = os.path.join(dirpath, name)
+                stat = os.stat(path)
+                entries.append((stat.st_mtime, name, stat.st_size))
+        for _, name, size in sorted(entries):
+            self._index[name] = size
+            self.total_bytes += size
+
+    def _path(self, name):
+        return os.path.join(self.root, name[:2], name)
+
+    @staticmethod
+    def _name(key):
+        return hashlib.sha1(key.encode()).hexdigest()
+
+    def get(self, key):
+        with metrics.timer("tile_cache_lookup"):
+            return self._read(key)
+
+    def _read(self, key):
+        name = self._name(key)
+        with self._lock:
+            if name not in self._index:
+                self.misses += 1
+                return None
+            self._index.move_to_end(name)
+            self.hits += 1
+        path = self._path(name)
+        try:
+            with open(path, 'rb') as f:
+                data = f.read()
+            os.utime(path)
+            return data
+        except FileNotFoundError:
+            with self._lock:
+                self.total_bytes -= self._index.pop(name, 0)
+            return None
+
+    def put(self, key, data):
+        name = self._name(key)
+        path = self._path(name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp, 'wb') as f:
+            f.write(data)
+        os.replace(tmp, path)
+        evicted = []
+        with self._lock:
+            self.total_bytes += len(data) - self._index.pop(name, 0)
+            self._index[name] = len(data)
+            while self.total_bytes > self.max_bytes and len(self._index) > 1:
+                old, size = self._index.popitem(last=False)
+                self.total_bytes -= size
+                evicted.append(old)
+        for old in evicted:
+            try:
+                os.remove(self._path(old))
+            except FileNotFoundError:
+                pass
+
+    def __contains__(self, key):
+        with self._lock:
+            return self._name(key) in self._index
+
+    def status(self):
+        return {"tiles": len(self._index), "bytes": self.total_bytes,
+                "hits": self.hits, "misses": self.misses}
+
+
+_session = requests.Session()
+_adapter = HTTPAdapter(pool_connections=4, pool_maxsize=TILE_UPSTREAM_POOL_SIZE, max_retries=2)
+_session.mount('https://', _adapter)
+_session.mount('http://', _adapter)
+
+def fetch_tile(url):
+    """Fetch one tile from the upstream tile host over the pooled session"""
+    response = _session.get(url, timeout=TILE_UPSTREAM_TIMEOUT)
+    if response.status_code != 200:
+        raise UpstreamError(response.status_code, f"Upstream tile request failed with {response.status_code}")
+    return response.content
+
+def etag_for(data):
+    return '"' + hashlib.sha1(data).hexdigest()[:20] + '"'
+
+
+tile_cache = TileCache()
@@ -0,0 +1,131 @@
+import os
+import math
+import time
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from app.tile_cache import tile_cache, fetch_tile
+from app.ee_executor import lanes
+
+# Zoom range, tile budget, request rate and concurrency used to pre-fetch AOI tiles
+TILE_WARM_ENABLED = os.getenv('TILE_WARM_ENABLED', 'true').lower() == 'true'
+TILE_WARM_MIN_ZOOM = int(os.getenv('TILE_WARM_MIN_ZOOM', 4))
+TILE_WARM_MAX_ZOOM = int(os.getenv('TILE_WARM_MAX_ZOOM', 10))
+TILE_WARM_MAX_TILES = int(os.getenv('TILE_WARM_MAX_TILES', 1000))
+TILE_WARM_RATE = float(os.getenv('TILE_WARM_RATE', 20))
+TILE_WARM_CONCURRENCY = int(os.getenv('TILE_WARM_CONCURRENCY', 4))
+
+
+def tile_range(bounds, z):
+    """Return the (x0, x1, y0, y1) web-mercator tile range covering [west, south, east, north] at zoom z"""
+    west, south, east, north = bounds
+    n = 2 ** z
+
+    def x_of(lng):
+        return min(max(int((lng + 180.0) / 360.0 * n), 0), n - 1)
+
+    def y_of(lat):
+        lat = max(min(lat, 85.0511), -85.0511)
+        rad = math.radians(lat)
+        return min(max(int((1.0 - math.asinh(math.tan(rad)) / math.pi) / 2.0 * n), 0), n - 1)
+
+    return x_of(west), x_of(east), y_of(north), y_of(south)
+
+def pyramid(bounds, min_zoom=TILE_WARM_MIN_ZOOM, max_zoom=TILE_WARM_MAX_ZOOM, max_tiles=TILE_WARM_MAX_TILES):
+    """List (z, x, y) tiles covering bounds, coarsest zoom first, capped at max_tiles"""
+    tiles = []
+    for z in range(min_zoom, max_zoom + 1):
+        x0, x1, y0, y1 = tile_range(bounds, z)
+        for x in range(x0, x1 + 1):
+            for y in range(y0, y1 + 1):
+                if len(tiles) >= max_tiles:
+                    return tiles
+                tiles.append((z, x, y))
+    return tiles
+
+
+class TileWarmer:
+    """Pre-fetches AOI tile pyramids into the tile cache in the background.
+
+    Warm-ups are queued and run one AOI at a time on a single thread; a newer
+    request for the same AOI supersedes a queued or running one. Fetches share
+    one pool of ``concurrency`` threads, are spaced to at most ``rate`` per
+    second, and pause while live tile requests are waiting on the tiles lane.
+    """
+
+    def __init__(self, rate=TILE_WARM_RATE, concurrency=TILE_WARM_CONCURRENCY):
+        self.interval = 1.0 / rate if rate > 0 else 0.0
+        self.concurrency = concurrency
+        self._generation = {}
+        self._next_slot = 0.0
+        self._lock = threading.Lock()
+        self._queue = queue.Queue()
+        self._thread = None
+        self._pool = ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix='tile-warm')
+        self.warmed = 0
+
+    def schedule(self, aoi_name, bounds, tile_key, tile_url):
+        """Warm the pyramid for an AOI; tile_key(z, x, y) names cache entries, tile_url() gives the URL template"""
+        if not TILE_WARM_ENABLED:
+            return
+        with self._lock:
+            generation = self._generation.get(aoi_name, 0) + 1
+            self._generation[aoi_name] = generation
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._loop, name='tile-warmer', daemon=True)
+                self._thread.start()
+        self._queue.put((aoi_name, generation, bounds, tile_key, tile_url))
+
+    def _loop(self):
+        while True:
+            try:
+                self._run(*self._queue.get())
+            except Exception as e:
+                print(f"Tile warm failed: {e}")
+
+    def _wait_for_slot(self):
+        with self._lock:
+            now = time.monotonic()
+            slot = max(self._next_slot, now)
+            self._next_slot = slot + self.interval
+        if slot > now:
+            time.sleep(slot - now)
+
+    def _yield_to_requests(self):
+        # Upstream capacity goes to tile requests queued on the lane first
+        while lanes["tiles"].waiting > 0:
+            time.sleep(0.1)
+
+    def _run(self, aoi_name, generation, bounds, tile_key, tile_url):
+        if self._generation.get(aoi_name) != generation:
+            return
+        todo = [t for t in pyramid(bounds) if tile_key(*t) not in tile_cache]
+        if not todo:
+            return
+        try:
+            template = tile_url()
+        except Exception as e:
+            print(f"Tile warm skipped for {aoi_name}: {e}")
+            return
+        started = time.time()
+
+        def warm(tile):
+            """Fetch one tile; returns 1 when it was stored"""
+            if self._generation.get(aoi_name) != generation:
+                return 0
+            self._yield_to_requests()
+            self._wait_for_slot()
+            z, x, y = tile
+            try:
+                tile_cache.put(tile_key(z, x, y), fetch_tile(template.format(z=z, x=x, y=y)))
+                return 1
+            except Exception as e:
+                print(f"Tile warm failed for {aoi_name} {z}/{x}/{y}: {e}")
+                return 0
+
+        fetched = sum(self._pool.map(warm, todo))
+        self.warmed += fetched
+        print(f"Warmed {fetched}/{len(todo)} tiles for {aoi_name} in {time.time() - started:.1f}s")
+
+
+tile_warmer = TileWarmer()
@@ -0,0 +1,94 @@
+import os
+import time
+import calendar
+import threading
+import google.auth
+from google.auth.transport.requests import Request
+from app import metrics
+
+SCOPES = ['https://www.googleapis.com/auth/cloud-platform', 'https://www.googleapis.com/auth/earthengine']
+
+# Refresh this many seconds before the token expires
+TOKEN_REFRESH_MARGIN = float(os.getenv('TOKEN_REFRESH_MARGIN', 300))
+# Used when the credentials do not report an expiry
+TOKEN_DEFAULT_LIFETIME = float(os.getenv('TOKEN_DEFAULT_LIFETIME', 2700))
+TOKEN_RETRY_DELAY = float(os.getenv('TOKEN_RETRY_DELAY', 15))
+
+
+class TokenManager:
+    """Keeps an OAuth access token fresh on a background thread.
+
+    ``get_token()`` only reads the current token. A synchronous refresh happens
+    on the request path only when there is no valid token at all, e.g. right
+    after startup or after repeated background failures. All refreshes go
+    through one lock, so two refreshes never run at the same time.
+    """
+
+    def __init__(self):
+        self._credentials = None
+        self._token = None
+        self._expires_at = 0.0
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self.refreshes = 0
+
+    def start(self, credentials=None):
+        """Use credentials (or ADC when None), fetch a first token and start the refresh thread"""
+        if credentials is None:
+            credentials, _ = google.auth.default(scopes=SCOPES)
+        self._credentials = credentials
+        self._refresh()
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._loop, name='token-refresh', daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def get_token(self):
+        token = self._token
+        if token and time.time() < self._expires_at:
+            return token
+        if self._credentials is None:
+            raise Exception("Failed to obtain a valid access token.")
+        return self._refresh(only_if_stale=True)
+
+    def _refresh(self, only_if_stale=False):
+        with self._lock:
+            if only_if_stale and self._token and time.time() < self._expires_at:
+                return self._token
+            with metrics.timer("token_refresh"):
+                self._credentials.refresh(Request())
+            token = self._credentials.token
+            if not token:
+                raise Exception("Failed to obtain a valid access token.")
+            expiry = getattr(self._credentials, 'expiry', None)
+            if expiry is not None:
+                # google-auth reports expiry as a naive UTC datetime
+                self._expires_at = calendar.timegm(expiry.timetuple())
+            else:
+                self._expires_at = time.time() + TOKEN_DEFAULT_LIFETIME
+            self._token = token
+            self.refreshes += 1
+            return token
+
+    def _loop(self):
+        while not self._stop.is_set():
+            wait = max(self._expires_at - TOKEN_REFRESH_MARGIN - time.time(), 0)
+            if self._stop.wait(wait):
+                return
+            try:
+                self._refresh()
+                print("Access token refreshed")
+            except Exception as e:
+                print(f"Access token refresh failed: {e}")
+                self._stop.wait(TOKEN_RETRY_DELAY)
+
+    def status(self):
+        return {"valid": bool(self._token) and time.time() < self._expires_at,
+                "expires_in": max(int(self._expires_at - time.time()), 0),
+                "refreshes": self.refreshes}
+
+
+token_manager = TokenManager()
@@ -0,0 +1,143 @@
+import os
+import asyncio
+from app import geometry
+from app.gee import init_ee_once
+from app.pipeline import get_pipeline, rect_spec
+from app.ee_executor import run_ee
+
+# Chunk limits that keep one reduceRegions request well inside EE's payload and memory limits
+ZONAL_CHUNK_FEATURES = int(os.getenv('ZONAL_CHUNK_FEATURES', 250))
+ZONAL_CHUNK_VERTICES = int(os.getenv('ZONAL_CHUNK_VERTICES', 50000))
+ZONAL_MAX_FEATURES = int(os.getenv('ZONAL_MAX_FEATURES', 20000))
+ZONAL_MAX_CONCURRENCY = int(os.getenv('ZONAL_MAX_CONCURRENCY', 4))
+# Attempts per chunk; a failing multi-feature chunk is split in half before it is retried
+ZONAL_RETRIES = int(os.getenv('ZONAL_RETRIES', 3))
+ZONAL_RETRY_DELAY = float(os.getenv('ZONAL_RETRY_DELAY', 2))
+
+STATS = ['mean', 'median', 'stdDev', 'count']
+# Placeholder for parcels without unmasked pixels, since aggregate_array skips nulls
+MISSING = -9999
+
+
+def parse_features(collection, id_property=None):
+    """Validate a GeoJSON FeatureCollection into [(id, geometry)]; raises ValueError"""
+    if not isinstance(collection, dict) or collection.get("type") != "FeatureCollection":
+        raise ValueError("features must be a GeoJSON FeatureCollection")
+    features = collection.get("features") or []
+    if not features:
+        raise ValueError("FeatureCollection has no features")
+    if len(features) > ZONAL_MAX_FEATURES:
+        raise ValueError(f"Too many features: {len(features)} (max {ZONAL_MAX_FEATURES})")
+    parsed = []
+    for i, feature in enumerate(features):
+        properties = (feature or {}).get("properties") or {}
+        feature_id = properties.get(id_property) if id_property else (feature or {}).get("id")
+        try:
+            parsed.append((feature_id if feature_id is not None else i, geometry.validate(feature)))
+        except ValueError as e:
+            raise ValueError(f"feature {i}: {e}")
+    return parsed
+
+def _morton(x, y):
+    # Interleave 16-bit grid coordinates so nearby parcels land in the same chunk
+    key = 0
+    for bit in range(16):
+        key |= ((x >> bit) & 1) << (2 * bit) | ((y >> bit) & 1) << (2 * bit + 1)
+    return key
+
+def chunk(features, max_features=ZONAL_CHUNK_FEATURES, max_vertices=ZONAL_CHUNK_VERTICES):
+    """Group [(row, geometry)] into chunks bounded by feature and vertex count.
+
+    Features are ordered along a Z-order curve first, so each chunk covers a
+    compact area and its image collection is filtered to few scenes. A single
+    feature over the vertex limit gets a chunk of its own.
+    """
+    def order(item):
+        west, south, east, north = geometry.bbox(item[1])
+        x = int(((west + east) / 2 + 180) / 360 * 65535)
+        y = int(((south + north) / 2 + 90) / 180 * 65535)
+        return _morton(x, y)
+
+    chunks, current, vertices = [], [], 0
+    for row, shape in sorted(features, key=order):
+        count = geometry.vertex_count(shape)
+        if current and (len(current) >= max_features or vertices + count > max_vertices):
+            chunks.append(current)
+            current, vertices = [], 0
+        current.append((row, shape))
+        vertices += count
+    if current:
+        chunks.append(current)
+    return chunks
+
+
+def _bounds(features):
+    boxes = [geometry.bbox(shape) for _, shape in features]
+    return [min(b[0] for b in boxes), min(b[1] for b in boxes), max(b[2] for b in boxes), max(b[3] for b in boxes)]
+
+def reduce_chunk(features, start, end, scale=10):
+    """Reduce the period's median NDVI over every parcel of one chunk in a single EE request"""
+    import ee
+    init_ee_once()
+    fc = ee.FeatureCollection([
+        ee.Feature(ee.Geometry.MultiPolygon(shape["coordinates"], None, False) if shape["type"] == "MultiPolygon"
+                   else ee.Geometry.Polygon(shape["coordinates"], None, False), {'row': row})
+        for row, shape in features
+    ])
+    composite = get_pipeline(rect_spec(_bounds(features)), start, end).ndvi.median()
+    reducer = ee.Reducer.mean().combine(ee.Reducer.median(), '', True)\
+                .combine(ee.Reducer.stdDev(), '', True).combine(ee.Reducer.count(), '', True)
+    reduced = composite.reduceRegions(collection=fc, reducer=reducer, scale=scale, tileScale=4)
+    missing = ee.Dictionary.fromLists(STATS, [MISSING] * len(STATS))
+    reduced = reduced.map(lambda f: f.set(missing.combine(f.toDictionary())))
+    columns = ['row'] + STATS
+    return ee.Dictionary.fromLists(columns, [reduced.aggregate_array(c) for c in columns]).getInfo()
+
+
+async def run_chunks(chunks, start, end, scale=10, on_chunk=None, lane="heavy"):
+    """Reduce all chunks on an EE lane, ZONAL_MAX_CONCURRENCY at a time.
+
+    Returns (results, failures): results are reduce_chunk outputs, failures
+    are (rows, error) for parcels still failing after ZONAL_RETRIES attempts.
+    on_chunk(done_features) is called as parcels finish.
+    """
+    semaphore = asyncio.Semaphore(ZONAL_MAX_CONCURRENCY)
+    results, failures = [], []
+
+    async def attempt(features, tries):
+        try:
+            async with semaphore:
+                results.append(await run_ee(lane, reduce_chunk, features, start, end, scale))
+            if on_chunk:
+                on_chunk(len(features))
+        except Exception as e:
+            if tries + 1 >= ZONAL_RETRIES:
+                print(f"Zonal chunk of {len(features)} failed: {e}")
+                failures.append(([row for row, _ in features], str(e)))
+                if on_chunk:
+                    on_chunk(len(features))
+                return
+            await asyncio.sleep(ZONAL_RETRY_DELAY * 2 ** tries)
+            if len(features) > 1:
+                # Memory and timeout errors usually go away with fewer parcels per request
+                half = len(features) // 2
+                await asyncio.gather(attempt(features[:half], tries + 1), attempt(features[half:], tries + 1))
+            else:
+                await attempt(features, tries + 1)
+
+    await asyncio.gather(*[attempt(c, 0) for c in chunks])
+    return results, failures
+
+def merge(ids, results, failures):
+    """One row per input feature, in input order; parcels without pixels or that failed have null stats"""
+    n = len(ids)
+    columns = {"mean": [None] * n, "median": [None] * n, "std_dev": [None] * n, "pixels": [0] * n}
+    names = {"mean": "mean", "median": "median", "std_dev": "stdDev", "pixels": "count"}
+    for result in results:
+        for i, row in enumerate(result.get('row', [])):
+            for column, name in names.items():
+                value = result[name][i]
+                if value != MISSING and value is not None:
+                    columns[column][row] = round(value) if column == "pixels" else round(value, 4)
+    failed = [{"id": ids[row], "error": error} for rows, error in failures for row in rows]
+    return {"id": list(ids), **columns}, failed
@@ -0,0 +1,537 @@
+"""Local stand-in for the ``ee`` module used by the benchmark harness.
+
+It covers the subset of the Earth Engine client API the backend uses.
+Objects build a lazy graph exactly like the real client. Network calls are
+``ee.data.computeValue`` (behind ``getInfo``), ``getMapId`` and
+``computePixels``. They sleep for a configurable latency and then evaluate
+the graph locally into payloads with the same shape EE returns.
+Sentinel-2 acquisitions are simulated every FAKE_EE_REVISIT_DAYS days.
+
+Install it before anything imports the app:
+
+    import sys
+    from bench import fake_ee
+    sys.modules['ee'] = fake_ee
+"""
+import os
+import math
+import time
+import random
+import types
+import hashlib
+from datetime import datetime, timedelta, timezone
+import numpy as np
+
+# Seconds per getInfo/computeValue call, plus a random +/- jitter fraction
+FAKE_EE_LATENCY = float(os.getenv('FAKE_EE_LATENCY', 0.2))
+FAKE_EE_JITTER = float(os.getenv('FAKE_EE_JITTER', 0.2))
+FAKE_EE_MAPID_LATENCY = float(os.getenv('FAKE_EE_MAPID_LATENCY', 0.5))
+FAKE_EE_PIXELS_LATENCY = float(os.getenv('FAKE_EE_PIXELS_LATENCY', 0.3))
+# Extra seconds per element in the returned payload (features, list items)
+FAKE_EE_LATENCY_PER_ITEM = float(os.getenv('FAKE_EE_LATENCY_PER_ITEM', 0.00002))
+# Days between simulated acquisitions; drives time-series payload sizes
+FAKE_EE_REVISIT_DAYS = float(os.getenv('FAKE_EE_REVISIT_DAYS', 5))
+# Fraction of samples that come back masked (cloud)
+FAKE_EE_MASKED = float(os.getenv('FAKE_EE_MASKED', 0.2))
+
+_random = random.Random(42)
+# Simulated scenes start with Sentinel-2A and cover the whole globe
+_FIRST_ACQUISITION = datetime(2015, 6, 23)
+_FOOTPRINT = [[-180, -90], [180, -90], [180, 90], [-180, 90], [-180, -90]]
+calls = {'computeValue': 0, 'getMapId': 0, 'computePixels': 0}
+
+
+def _sleep(base, items=0):
+    jitter = 1 + _random.uniform(-FAKE_EE_JITTER, FAKE_EE_JITTER)
+    time.sleep(max(base * jitter + items * FAKE_EE_LATENCY_PER_ITEM, 0))
+
+def _size(value):
+    if isinstance(value, dict):
+        return sum(_size(v) for v in value.values()) or 1
+    if isinstance(value, list):
+        return len(value)
+    return 1
+
+def _eval(value):
+    """Evaluate a lazy object, or a structure containing them, into plain Python values"""
+    if isinstance(value, ComputedObject):
+        return value._eval()
+    if isinstance(value, dict):
+        return {k: _eval(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_eval(v) for v in value]
+    return value
+
+def _ndvi():
+    if _random.random() < FAKE_EE_MASKED:
+        return None
+    return round(_random.uniform(-0.2, 0.9), 6)
+
+def _parse_date(value):
+    if isinstance(value, datetime):
+        return value.replace(tzinfo=None)
+    if isinstance(value, ComputedObject):
+        value = value._eval()
+    return datetime.strptime(str(value)[:10], '%Y-%m-%d')
+
+
+class ComputedObject:
+    def _eval(self):
+        raise NotImplementedError
+
+    def getInfo(self):
+        return data.computeValue(self)
+
+
+_UNSET = object()
+
+
+class _Value(ComputedObject):
+    """Lazy scalar, list or dict produced by a function of other lazy values.
+
+    Evaluated once, so every aggregate over the same element sees the same sample.
+    """
+
+    def __init__(self, fn):
+        self._fn = fn
+        self._value = _UNSET
+
+    def _eval(self):
+        if self._value is _UNSET:
+            self._value = self._fn()
+        return self._value
+
+    def format(self, fmt=None):
+        return _Value(lambda: self._eval().strftime('%Y-%m-%d'))
+
+    def get(self, key):
+        return _Value(lambda: (self._eval() or {}).get(key))
+
+
+class Number(_Value):
+    pass
+
+
+class Date(_Value):
+    pass
+
+
+class Dictionary(_Value):
+    def __init__(self, mapping=None):
+        super().__init__(lambda: {k: v for k, v in _eval(mapping or {}).items()})
+
+    @staticmethod
+    def fromLists(keys, values):
+        return Dictionary(dict(zip(keys, values)))
+
+    def combine(self, other):
+        return _Value(lambda: {**self._eval(), **_eval(other)})
+
+
+class Geometry(ComputedObject):
+    def __init__(self, kind, coords):
+        self.kind = kind
+        self.coords = coords
+
+    def _eval(self):
+        return {'type': self.kind, 'coordinates': self.coords}
+
+    @staticmethod
+    def Point(coords, *args, **kwargs):
+        return Geometry('Point', coords)
+
+    @staticmethod
+    def Rectangle(coords, *args, **kwargs):
+        return Geometry('Rectangle', coords)
+
+    @staticmethod
+    def MultiPoint(coords, *args, **kwargs):
+        return Geometry('MultiPoint', coords)
+
+    @staticmethod
+    def Polygon(coords, *args, **kwargs):
+        return Geometry('Polygon', coords)
+
+    @staticmethod
+    def MultiPolygon(coords, *args, **kwargs):
+        return Geometry('MultiPolygon', coords)
+
+    def buffer(self, distance, *args, **kwargs):
+        return self
+
+
+class Filter:
+    def __init__(self, kind, *args):
+        self.kind = kind
+        self.args = args
+
+    @staticmethod
+    def lt(name, value):
+        return Filter('lt', name, value)
+
+    @staticmethod
+    def eq(name, value):
+        return Filter('eq', name, value)
+
+    @staticmethod
+    def notNull(names):
+        return Filter('notNull', names)
+
+
+class Reducer:
+    def __init__(self, outputs, named=False):
+        self.outputs = outputs
+        # setOutputs names override band prefixes, like EE
+        self.named = named
+
+    @staticmethod
+    def mean():
+        return Reducer(['mean'])
+
+    @staticmethod
+    def stdDev():
+        return Reducer(['stdDev'])
+
+    @staticmethod
+    def minMax():
+        return Reducer(['min', 'max'])
+
+    @staticmethod
+    def count():
+        return Reducer(['count'])
+
+    @staticmethod
+    def first():
+        return Reducer(['first'])
+
+    @staticmethod
+    def median():
+        return Reducer(['median'])
+
+    @staticmethod
+    def fixedHistogram(min, max, steps):
+        reducer = Reducer(['histogram'])
+        reducer.histogram = (min, max, steps)
+        return reducer
+
+    def combine(self, reducer2, outputPrefix='', sharedInputs=False):
+        combined = Reducer(self.outputs + reducer2.outputs)
+        combined.histogram = getattr(self, 'histogram', None) or getattr(reducer2, 'histogram', None)
+        return combined
+
+    def setOutputs(self, outputs):
+        return Reducer(list(outputs), named=True)
+
+    def names(self, bands, per_region):
+        """Output property names for an image with these bands, following EE's naming rules"""
+        if self.named:
+            return self.outputs
+        if self.outputs == ['first'] or (len(self.outputs) == 1 and not per_region):
+            return list(bands)
+        if per_region and len(bands) == 1:
+            return self.outputs
+        if len(self.outputs) == 1:
+            return list(bands)
+        return [f"{b}_{o}" for b in bands for o in self.outputs]
+
+    def value(self, name):
+        if name.endswith('count'):
+            return _random.randint(0, 60)
+        if name.endswith('histogram'):
+            low, high, steps = self.histogram
+            width = (high - low) / steps
+            return [[low + i * width, float(_random.randint(0, 500))] for i in range(steps)]
+        return _ndvi()
+
+
+class Image(ComputedObject):
+    def __init__(self, bands=('B4', 'B8', 'QA60'), properties=None):
+        self.bands = list(bands)
+        self.properties = properties or {}
+
+    def _eval(self):
+        return {'type': 'Image', 'bands': [{'id': b} for b in self.bands], 'properties': self.properties}
+
+    def _with(self, bands=None):
+        return Image(self.bands if bands is None else bands, self.properties)
+
+    def __getattr__(self, name):
+        # Pixel-wise operators (bitwiseAnd, eq, And, updateMask, divide, clip, ...) keep the bands
+        if name.startswith('_'):
+            raise AttributeError(name)
+        return lambda *args, **kwargs: self._with()
+
+    def select(self, bands, *args):
+        return self._with(bands if isinstance(bands, list) else [bands])
+
+    def normalizedDifference(self, bands=None):
+        return self._with(['nd'])
+
+    def rename(self, *names):
+        return self._with(list(names[0]) if isinstance(names[0], list) else list(names))
+
+    def copyProperties(self, source, properties=None, exclude=None):
+        return Image(self.bands, {**self.properties, **source.properties})
+
+    def set(self, *args):
+        return Image(self.bands, {**self.properties, **_props(args)})
+
+    def date(self):
+        return Date(lambda: datetime.fromtimestamp(self.properties['system:time_start'] / 1000, timezone.utc))
+
+    def get(self, name):
+        return _Value(lambda: self.properties.get(name))
+
+    def reduceRegion(self, reducer, geometry=None, scale=None, **kwargs):
+        names = reducer.names(self.bands, per_region=False)
+        return Dictionary({name: _Value(lambda name=name: reducer.value(name)) for name in names})
+
+    def reduceRegions(self, collection, reducer, scale=None, **kwargs):
+        names = reducer.names(self.bands, per_region=True)
+        return collection.map(lambda f: f.set({name: _Value(lambda name=name: reducer.value(name)) for name in names}))
+
+    def getMapId(self, vis_params=None):
+        return data.getMapId({'image': self, 'vis_params': vis_params})
+
+
+def _props(args):
+    if len(args) == 1 and isinstance(args[0], (dict, Dictionary, _Value)):
+        return args[0] if isinstance(args[0], dict) else {'__merge__': args[0]}
+    return dict(zip(args[::2], args[1::2]))
+
+
+class Feature(ComputedObject):
+    def __init__(self, geometry=None, properties=None):
+        self.geometry = geometry
+        self.properties = dict(properties or {})
+
+    def _eval_properties(self):
+        properties = {}
+        for key, value in self.properties.items():
+            if key == '__merge__':
+                properties.update(_eval(value))
+            else:
+                properties[key] = _eval(value)
+        return properties
+
+    def _eval(self):
+        # EE leaves out properties whose value is null, e.g. reducer outputs over masked pixels
+        properties = {k: v for k, v in self._eval_properties().items() if v is not None}
+        return {'type': 'Feature', 'geometry': None, 'properties': properties}
+
+    def set(self, *args):
+        props = _props(args)
+        if '__merge__' in props:
+            # set(dict) replaces what the merged dictionary defines
+            merged = props['__merge__']
+            return Feature(self.geometry, {'__merge__': _Value(lambda: {**self._eval_properties(), **_eval(merged)})})
+        return Feature(self.geometry, {**self.properties, **props})
+
+    def get(self, name):
+        return _Value(lambda: self._eval_properties().get(name))
+
+    def toDictionary(self, properties=None):
+        return _Value(lambda: {k: v for k, v in self._eval_properties().items() if v is not None})
+
+
+def _resolve(element):
+    while isinstance(element, _Deferred):
+        element = element._target()
+    return element
+
+def _properties(element):
+    element = _resolve(element)
+    return element._eval_properties() if isinstance(element, Feature) else element.properties
+
+
+class Collection(ComputedObject):
+    """Lazy collection: elements() builds the element objects once, when the graph is evaluated"""
+
+    def __init__(self, elements):
+        self._elements = elements
+        self._cache = None
+
+    def elements(self):
+        if self._cache is None:
+            self._cache = [_resolve(e) for e in self._elements()]
+        return self._cache
+
+    def map(self, fn):
+        return type(self)(lambda: [fn(e) for e in self.elements()])
+
+    def filter(self, flt):
+        def keep(e):
+            if flt.kind == 'notNull':
+                return all(_properties(e).get(n) is not None for n in flt.args[0])
+            if flt.kind == 'eq':
+                return _properties(e).get(flt.args[0]) == flt.args[1]
+            return True
+        return type(self)(lambda: [e for e in self.elements() if keep(e)])
+
+    def flatten(self):
+        return FeatureCollection(lambda: [f for c in self.elements() for f in c.elements()])
+
+    def first(self):
+        return _Deferred(lambda: (self.elements() or [Feature()])[0])
+
+    def size(self):
+        return Number(lambda: len(self.elements()))
+
+    def sort(self, *args, **kwargs):
+        return self
+
+    def aggregate_array(self, name):
+        def values():
+            out = []
+            for e in self.elements():
+                props = _properties(e)
+                if props.get(name) is not None:
+                    out.append(props[name])
+            return out
+        return _Value(values)
+
+    def _eval(self):
+        return {'type': 'FeatureCollection', 'features': [_eval(e) for e in self.elements()]}
+
+
+class _Deferred(ComputedObject):
+    """Object known only at evaluation time, e.g. collection.first(); method calls are deferred too"""
+
+    def __init__(self, target):
+        self._make = target
+        self._made = None
+
+    def _target(self):
+        if self._made is None:
+            self._made = self._make()
+        return self._made
+
+    def _eval(self):
+        return _eval(self._target())
+
+    def getMapId(self, vis_params=None):
+        return data.getMapId({'image': self, 'vis_params': vis_params})
+
+    def __getattr__(self, name):
+        if name.startswith('_'):
+            raise AttributeError(name)
+        return lambda *args, **kwargs: _Deferred(lambda: getattr(_resolve(self), name)(*args, **kwargs))
+
+
+class FeatureCollection(Collection):
+    def __init__(self, features):
+        if callable(features):
+            super().__init__(features)
+        else:
+            features = features if isinstance(features, list) else [features]
+            super().__init__(lambda: list(features))
+
+
+class ImageCollection(Collection):
+    def __init__(self, source):
+        if callable(source):
+            super().__init__(source)
+        else:
+            self.collection_id = source
+            self._start = datetime.now() - timedelta(days=365)
+            self._end = datetime.now()
+            super().__init__(self._acquisitions)
+
+    def _acquisitions(self):
+        # Acquisitions fall on a fixed revisit grid, so overlapping windows share scene IDs
+        revisit = timedelta(days=FAKE_EE_REVISIT_DAYS)
+        index = max(math.ceil((self._start - _FIRST_ACQUISITION) / revisit), 0)
+        images = []
+        current = _FIRST_ACQUISITION + index * revisit
+        while current < self._end:
+            ms = int(current.replace(tzinfo=timezone.utc).timestamp() * 1000)
+            images.append(Image(properties={
+                'system:index': f"{current:%Y%m%dT%H%M%S}_fake_{index}",
+                'system:time_start': ms,
+                'system:footprint': {'type': 'LinearRing', 'coordinates': _FOOTPRINT},
+                'CLOUDY_PIXEL_PERCENTAGE': _random.uniform(0, 20)
+            }))
+            current += revisit
+            index += 1
+        return images
+
+    def filterBounds(self, geometry):
+        return self
+
+    def filterDate(self, start, end=None):
+        collection = ImageCollection(getattr(self, 'collection_id', 'fake'))
+        collection._start = _parse_date(start)
+        collection._end = _parse_date(end) if end is not None else collection._start + timedelta(days=1)
+        return collection
+
+    def map(self, fn):
+        # Like the real client, trace the function once while building the graph
+        fn(Image(properties={'system:time_start': 0}))
+        return super().map(fn)
+
+    def median(self):
+        return Image(['NDVI'])
+
+    def mean(self):
+        return Image(['NDVI'])
+
+    def mosaic(self):
+        return Image(['NDVI'])
+
+    def reduce(self, reducer):
+        return Image([f"NDVI_{o}" for o in reducer.outputs])
+
+
+def _map_id():
+    return hashlib.sha1(str(_random.random()).encode()).hexdigest()[:32]
+
+
+def _compute_value(obj):
+    calls['computeValue'] += 1
+    value = _eval(obj)
+    _sleep(FAKE_EE_LATENCY, _size(value))
+    return value
+
+def _get_map_id(request):
+    calls['getMapId'] += 1
+    _sleep(FAKE_EE_MAPID_LATENCY)
+    mapid = _map_id()
+    return {'mapid': mapid, 'token': '', 'tile_fetcher': None, 'image': request.get('image')}
+
+def _compute_pixels(request):
+    calls['computePixels'] += 1
+    dims = request['grid']['dimensions']
+    height, width = dims['height'], dims['width']
+    _sleep(FAKE_EE_PIXELS_LATENCY, height * width / 1e4)
+    rng = np.random.default_rng(_random.randint(0, 2 ** 31))
+    pixels = np.zeros((height, width), dtype=[('B4', '<u2'), ('B8', '<u2'), ('QA60', '<u2')])
+    pixels['B4'] = rng.integers(200, 2000, (height, width))
+    pixels['B8'] = rng.integers(1000, 5000, (height, width))
+    pixels['QA60'] = np.where(rng.random((height, width)) < FAKE_EE_MASKED, 1 << 10, 0)
+    return pixels
+
+
+data = types.SimpleNamespace(computeValue=_compute_value, getMapId=_get_map_id, computePixels=_compute_pixels)
+
+
+def Initialize(credentials=None, project=None, **kwargs):
+    return None
+
+def ServiceAccountCredentials(*args, **kwargs):
+    return FakeCredentials()
+
+def Credentials(*args, **kwargs):
+    return FakeCredentials()
+
+
+class FakeCredentials:
+    """google-auth style credentials whose refresh() mints a local token"""
+
+    def __init__(self, lifetime=3600):
+        self.lifetime = lifetime
+        self.token = None
+        self.expiry = None
+
+    def refresh(self, request):
+        self.token = 'fake-' + hashlib.sha1(str(time.time()).encode()).hexdigest()[:16]
+        self.expiry = datetime.now(timezone.utc).replace(tzinfo=None) + timedelta(seconds=self.lifetime)
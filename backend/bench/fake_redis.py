@@ -0,0 +1,95 @@
+"""Local stand-in for a Redis server.
+
+Speaks enough RESP for the app's cache backend: PING, AUTH, SELECT, GET,
+SET with EX/PX, DEL, SCAN, DBSIZE and FLUSHDB, with per-key expiry. Point
+the backend at it with CACHE_BACKEND=redis and CACHE_REDIS_URL.
+"""
+import time
+import fnmatch
+import threading
+import socketserver
+
+
+class Store:
+    def __init__(self):
+        self.data = {}
+        self.commands = 0
+        self.lock = threading.Lock()
+
+    def _live(self, key):
+        entry = self.data.get(key)
+        if entry is not None and entry[1] is not None and entry[1] <= time.time():
+            del self.data[key]
+            return None
+        return entry
+
+    def execute(self, name, args):
+        with self.lock:
+            self.commands += 1
+            if name in ('PING',):
+                return 'PONG'
+            if name in ('AUTH', 'SELECT', 'FLUSHDB'):
+                if name == 'FLUSHDB':
+                    self.data.clear()
+                return 'OK'
+            if name == 'GET':
+                entry = self._live(args[0])
+                return entry[0] if entry else None
+            if name == 'SET':
+                expires_at = None
+                options = [a.decode().upper() if i % 2 == 0 else a for i, a in enumerate(args[2:])]
+                for option, value in zip(options[::2], options[1::2]):
+                    if option == 'EX':
+                        expires_at = time.time() + int(value)
+                    elif option == 'PX':
+                        expires_at = time.time() + int(value) / 1000
+                self.data[args[0]] = (args[1], expires_at)
+                return 'OK'
+            if name == 'DEL':
+                return sum(self.data.pop(key, None) is not None for key in args)
+            if name == 'DBSIZE':
+                return sum(self._live(key) is not None for key in list(self.data))
+            if name == 'SCAN':
+                # One pass returns every match; cursor 0 ends the iteration
+                pattern = args[args.index(b'MATCH') + 1].decode() if b'MATCH' in args else '*'
+                keys = [k for k in list(self.data) if self._live(k) and fnmatch.fnmatchcase(k.decode(), pattern)]
+                return [b'0', keys]
+            return Exception(f"ERR unknown command '{name}'")
+
+
+def encode(value):
+    if value is None:
+        return b'$-1\r\n'
+    if isinstance(value, Exception):
+        return f"-{value}\r\n".encode()
+    if isinstance(value, str):
+        return f"+{value}\r\n".encode()
+    if isinstance(value, int):
+        return f":{value}\r\n".encode()
+    if isinstance(value, list):
+        return b'*%d\r\n' % len(value) + b''.join(encode(v) for v in value)
+    return b'$%d\r\n%s\r\n' % (len(value), value)
+
+
+class RedisHandler(socketserver.StreamRequestHandler):
+    store = Store()
+
+    def handle(self):
+        while True:
+            line = self.rfile.readline()
+            if not line.startswith(b'*'):
+                return
+            args = []
+            for _ in range(int(line[1:])):
+                length = int(self.rfile.readline()[1:])
+                args.append(self.rfile.read(length + 2)[:-2])
+            reply = self.store.execute(args[0].decode().upper(), args[1:])
+            self.wfile.write(encode(reply))
+
+
+def start(host='127.0.0.1', port=0):
+    """Start the server on a background thread and return (server, redis_url)"""
+    server = socketserver.ThreadingTCPServer((host, port), RedisHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name='fake-redis', daemon=True).start()
+    return server, f"redis://{host}:{server.server_address[1]}/0"
@@ -0,0 +1,46 @@
+"""Local stand-in for the Earth Engine tile host.
+
+Serves ``/v1alpha/projects/{project}/maps/{mapid}/tiles/{z}/{x}/{y}`` with a
+fixed-size PNG after a configurable delay. Point the backend at it with
+EE_TILE_BASE_URL.
+"""
+import os
+import time
+import random
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+# Seconds per tile request and bytes per tile body
+FAKE_TILE_LATENCY = float(os.getenv('FAKE_TILE_LATENCY', 0.05))
+FAKE_TILE_BYTES = int(os.getenv('FAKE_TILE_BYTES', 20000))
+
+PNG_HEADER = b'\x89PNG\r\n\x1a\n'
+
+
+class TileHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    body = PNG_HEADER + random.Random(7).randbytes(max(FAKE_TILE_BYTES - len(PNG_HEADER), 0))
+    requests = 0
+
+    def do_GET(self):
+        TileHandler.requests += 1
+        if '/tiles/' not in self.path:
+            self.send_error(404)
+            return
+        time.sleep(FAKE_TILE_LATENCY)
+        self.send_response(200)
+        self.send_header('Content-Type', 'image/png')
+        self.send_header('Content-Length', str(len(self.body)))
+        self.end_headers()
+        self.wfile.write(self.body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start(host='127.0.0.1', port=0):
+    """Start the tile server on a background thread and return (server, base_url)"""
+    server = ThreadingHTTPServer((host, port), TileHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name='fake-tiles', daemon=True).start()
+    return server, f"http://{host}:{server.server_address[1]}"
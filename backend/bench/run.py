@@ -0,0 +1,352 @@
+"""Load/latency benchmark for the backend, run fully offline.
+
+The app is served in-process by uvicorn. ``ee`` is replaced by bench.fake_ee
+and the tile host by bench.fake_tiles. Every endpoint is driven at each
+concurrency level, and the run reports throughput plus p50/p95/p99 latency.
+Results can be stored as a baseline and later runs checked against it.
+
+    cd backend
+    python -m bench.run                              # all scenarios at 1, 8, 32
+    python -m bench.run --only stats,point -c 1,64   # a subset
+    python -m bench.run --save-baseline              # write bench/baselines.json
+    python -m bench.run --check                      # exit 1 on regression
+    python -m bench.run --cache redis                # result caches on bench.fake_redis
+
+Concurrency levels run in order against the same process, so caches warm up
+across levels. --distinct controls how many different points and tiles are
+cycled through, i.e. the cache hit rate.
+"""
+import os
+import sys
+import json
+import time
+import socket
+import argparse
+import tempfile
+import itertools
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+BASELINE_PATH = os.path.join(BENCH_DIR, 'baselines.json')
+
+# Allowed slowdown before --check fails: p95 may grow by this fraction, throughput may drop by this fraction
+DEFAULT_THRESHOLDS = {"p95": 0.5, "throughput": 0.35}
+# Absolute p95 slack in seconds so sub-millisecond endpoints do not flap
+P95_SLACK = 0.005
+
+FAKE_SETTINGS = ['FAKE_EE_LATENCY', 'FAKE_EE_JITTER', 'FAKE_EE_MAPID_LATENCY', 'FAKE_EE_PIXELS_LATENCY',
+                 'FAKE_EE_LATENCY_PER_ITEM', 'FAKE_EE_REVISIT_DAYS', 'FAKE_EE_MASKED',
+                 'FAKE_TILE_LATENCY', 'FAKE_TILE_BYTES']
+
+NYC = (40.7128, -74.0060)
+
+
+def _points(n):
+    """n distinct Sentinel-2 pixels around Manhattan, ~100 m apart"""
+    return [(round(NYC[0] + (i // 10) * 0.001, 6), round(NYC[1] + (i % 10) * 0.001, 6)) for i in range(n)]
+
+def _square(lat, lng, half):
+    """GeoJSON Polygon of a square centred on a point, half its side in degrees"""
+    return {"type": "Polygon", "coordinates": [[
+        [lng - half, lat - half], [lng + half, lat - half], [lng + half, lat + half],
+        [lng - half, lat + half], [lng - half, lat - half]]]}
+
+def _parcels(n):
+    """GeoJSON FeatureCollection of n ~50 m parcels, one per point of _points(n)"""
+    return {"type": "FeatureCollection", "features": [
+        {"type": "Feature", "properties": {"parcel": f"p{i}"}, "geometry": _square(lat, lng, 0.00025)}
+        for i, (lat, lng) in enumerate(_points(n))]}
+
+def _tiles(n):
+    """n tiles of the NYC pyramid at zoom 10-12"""
+    from app.tile_warmer import tile_range
+    from app.aois import BUILTIN_AOIS
+    tiles = []
+    for z in (10, 11, 12):
+        x0, x1, y0, y1 = tile_range(BUILTIN_AOIS['nyc']['bounds'], z)
+        tiles.extend((z, x, y) for x in range(x0, x1 + 1) for y in range(y0, y1 + 1))
+    return tiles[:n] or tiles
+
+
+def scenarios(distinct):
+    """(name, method, path(i), body(i) or None, options) for every endpoint of the app.
+
+    options: max_requests / max_concurrency cap a scenario, needs_cube ingests the NYC
+    cube first, and prepare(base_url, count) runs before each concurrency level.
+    """
+    points = _points(distinct)
+    aois = ['nyc', 'amazon', 'sahara']
+    batch = {"points": [{"lat": lat, "lng": lng} for lat, lng in _points(200)]}
+
+    def point_path(template):
+        return lambda i: template.format(lat=points[i % len(points)][0], lng=points[i % len(points)][1])
+
+    tiles = _tiles(distinct)
+    zonal = {"features": _parcels(20), "id_property": "parcel", "start": "2024-01-01", "end": "2024-07-01"}
+    months = [f"2024-{m:02d}" for m in range(1, 13)]
+    # Registered ids never repeat across levels; deletes consume AOIs registered by prepare
+    registered, deleted = itertools.count(), itertools.count()
+    state = {}
+
+    def new_aoi(i):
+        n = next(registered)
+        return {"id": f"bench-{n}", "geometry": _square(*points[n % len(points)], 0.005)}
+
+    def register_aois(base_url, count):
+        import requests
+        for i in range(count):
+            requests.post(f"{base_url}/aois", json=new_aoi(i), timeout=30)
+
+    def finished_job(base_url, count):
+        if "job" not in state:
+            import requests
+            job = requests.post(f"{base_url}/jobs", json={"kind": "zonal-stats", "params": zonal}, timeout=30).json()
+            state["job"] = wait_for_job(base_url, job["id"])["id"]
+
+    return [
+        ("root", "GET", lambda i: "/", None, {}),
+        ("health", "GET", lambda i: "/health", None, {}),
+        ("metrics", "GET", lambda i: "/metrics", None, {}),
+        ("test", "GET", lambda i: "/test", None, {}),
+        ("ndvi-tiles", "GET", lambda i: "/ndvi-tiles", None, {}),
+        ("aoi", "GET", lambda i: f"/aoi/{aois[i % 3]}", None, {}),
+        ("aoi-summary", "GET", lambda i: f"/aoi/{aois[i % 3]}/summary", None, {}),
+        ("tiles", "GET", lambda i: "/tiles/nyc/{}/{}/{}.png".format(*tiles[i % len(tiles)]), None, {}),
+        ("time-series", "GET", point_path("/time-series/{lat}/{lng}"), None, {}),
+        ("time-series-stream", "GET", point_path("/time-series/{lat}/{lng}/stream?start=2022-01-01&end=2024-01-01"),
+         None, {}),
+        ("stats", "GET", point_path("/stats/{lat}/{lng}"), None, {}),
+        ("point", "GET", point_path("/point/{lat}/{lng}"), None, {}),
+        ("cube", "POST", lambda i: "/aoi/nyc/cube?width=64&height=64", None, {"max_requests": 2, "max_concurrency": 1}),
+        ("stats-local", "GET", point_path("/stats/{lat}/{lng}?engine=local"), None, {"needs_cube": True}),
+        ("point-local", "GET", point_path("/point/{lat}/{lng}?engine=local"), None, {"needs_cube": True}),
+        ("composite-png", "GET", lambda i: "/aoi/nyc/composite.png", None, {"needs_cube": True}),
+        ("composites", "POST", lambda i: "/aoi/nyc/composites?percentiles=10,50,90", None, {"needs_cube": True}),
+        ("batch-stats", "POST", lambda i: "/ndvi/stats", lambda i: batch, {"max_requests": 50}),
+        ("batch-timeseries", "POST", lambda i: "/ndvi/timeseries", lambda i: batch, {"max_requests": 50}),
+        ("ndvi-tile", "GET", lambda i: "/ndvi/tile", None, {}),
+        ("zonal-stats", "POST", lambda i: "/ndvi/zonal-stats", lambda i: zonal, {"max_requests": 50}),
+        ("ready", "GET", lambda i: "/ready", None, {}),
+        ("aois", "GET", lambda i: "/aois", None, {}),
+        ("aoi-get", "GET", lambda i: f"/aois/{aois[i % 3]}", None, {}),
+        ("aois-at", "GET", point_path("/aois/at/{lat}/{lng}"), None, {}),
+        ("aoi-register", "POST", lambda i: "/aois", new_aoi, {}),
+        ("aoi-delete", "DELETE", lambda i: f"/aois/bench-{next(deleted)}", None, {"prepare": register_aois}),
+        ("scenes", "GET", lambda i: f"/aoi/nyc/scenes?start={months[i % 12]}-01&end=2025-01-01", None, {}),
+        ("catalog", "GET", lambda i: f"/aoi/{aois[i % 3]}/catalog", None, {}),
+        ("catalog-period", "GET", lambda i: f"/aoi/nyc/catalog/{months[i % 12]}", None, {}),
+        ("jobs-submit", "POST", lambda i: "/jobs", lambda i: {"kind": "zonal-stats", "params": zonal},
+         {"prepare": finished_job}),
+        ("jobs", "GET", lambda i: "/jobs", None, {}),
+        ("job", "GET", lambda i: f"/jobs/{state['job']}", None, {"prepare": finished_job}),
+        ("job-result", "GET", lambda i: f"/jobs/{state['job']}/result", None, {"prepare": finished_job}),
+        ("job-cancel", "DELETE", lambda i: f"/jobs/{state['job']}", None, {"prepare": finished_job}),
+    ]
+
+
+def wait_for_job(base_url, job_id, timeout=300):
+    """Poll a background job until it finishes; returns its final record"""
+    import requests
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        job = requests.get(f"{base_url}/jobs/{job_id}", timeout=30).json()
+        if job["status"] not in ("queued", "running"):
+            return job
+        time.sleep(0.2)
+    raise TimeoutError(f"job {job_id} still running after {timeout}s")
+
+
+def setup(workdir, cache='memory'):
+    """Install the fakes, import the app and serve it on a free port; returns the base URL"""
+    defaults = {
+        'TILE_CACHE_DIR': os.path.join(workdir, 'tiles'),
+        'SERIES_STORE_PATH': os.path.join(workdir, 'series.sqlite'),
+        'LOCAL_CUBE_DIR': os.path.join(workdir, 'cubes'),
+        'COMPOSITE_DIR': os.path.join(workdir, 'composites'),
+        'CACHE_PATH': os.path.join(workdir, 'cache.sqlite'),
+        'AOI_REGISTRY_PATH': os.path.join(workdir, 'aois.sqlite'),
+        'JOB_DIR': os.path.join(workdir, 'jobs'),
+        'CATALOG_PATH': os.path.join(workdir, 'catalog.sqlite'),
+        'CATALOG_ENABLED': 'false',
+        'SCENE_INDEX_PATH': os.path.join(workdir, 'scenes.sqlite'),
+        'TILE_WARM_ENABLED': 'false',
+        # No real credentials: the fake ones are installed below
+        'GOOGLE_APPLICATION_CREDENTIALS': os.path.join(workdir, 'no-key.json'),
+    }
+    for name, value in defaults.items():
+        os.environ.setdefault(name, value)
+
+    from bench import fake_ee, fake_tiles
+    sys.modules['ee'] = fake_ee
+    _, tile_base = fake_tiles.start()
+    os.environ['EE_TILE_BASE_URL'] = tile_base
+    os.environ['CACHE_BACKEND'] = cache
+    if cache == 'redis':
+        from bench import fake_redis
+        _, os.environ['CACHE_REDIS_URL'] = fake_redis.start()
+
+    import uvicorn
+    from app.main import app
+    from app.token_manager import token_manager
+    token_manager.start(fake_ee.FakeCredentials())
+
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        port = s.getsockname()[1]
+    server = uvicorn.Server(uvicorn.Config(app, host='127.0.0.1', port=port, log_level='warning'))
+    threading.Thread(target=server.run, name='bench-server', daemon=True).start()
+    while not server.started:
+        time.sleep(0.05)
+    return f"http://127.0.0.1:{port}"
+
+
+def percentile(sorted_values, p):
+    if not sorted_values:
+        return 0.0
+    index = max(0, min(len(sorted_values) - 1, int(round(p / 100 * len(sorted_values) + 0.5)) - 1))
+    return sorted_values[index]
+
+def _failed(response):
+    if response.status_code == 503:
+        return 'shed'
+    if response.status_code >= 400:
+        return True
+    if response.headers.get('content-type', '').startswith('application/json'):
+        body = response.json()
+        # Job records carry "error": null until they fail
+        return isinstance(body, dict) and body.get('error') is not None
+    return False
+
+def drive(base_url, method, path, body, requests_count, concurrency):
+    """Issue requests_count requests with concurrency workers; return throughput and latency percentiles"""
+    import requests
+    local = threading.local()
+
+    def one(i):
+        session = getattr(local, 'session', None)
+        if session is None:
+            session = local.session = requests.Session()
+        started = time.perf_counter()
+        try:
+            response = session.request(method, base_url + path(i), json=body(i) if body else None, timeout=300)
+            failed = _failed(response)
+        except Exception:
+            failed = True
+        return time.perf_counter() - started, failed
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        results = list(pool.map(one, range(requests_count)))
+    elapsed = time.perf_counter() - started
+    latencies = sorted(r[0] for r in results)
+    return {
+        "requests": requests_count,
+        "concurrency": concurrency,
+        "errors": sum(1 for r in results if r[1] is True),
+        # Rejected with 503 by the EE lanes' load shedding
+        "shed": sum(1 for r in results if r[1] == 'shed'),
+        "throughput": round(requests_count / elapsed, 2),
+        "p50": round(percentile(latencies, 50), 4),
+        "p95": round(percentile(latencies, 95), 4),
+        "p99": round(percentile(latencies, 99), 4),
+    }
+
+
+def check(results, baseline):
+    """Return regression messages for results that fall outside the baseline thresholds"""
+    thresholds = {**DEFAULT_THRESHOLDS, **baseline.get("thresholds", {})}
+    regressions = []
+    for key, result in results.items():
+        base = baseline.get("results", {}).get(key)
+        if base is None:
+            continue
+        if result["p95"] > base["p95"] * (1 + thresholds["p95"]) + P95_SLACK:
+            regressions.append(f"{key}: p95 {result['p95']:.4f}s vs baseline {base['p95']:.4f}s")
+        if result["throughput"] < base["throughput"] * (1 - thresholds["throughput"]):
+            regressions.append(f"{key}: throughput {result['throughput']:.1f}/s vs baseline {base['throughput']:.1f}/s")
+        if result["errors"] > base.get("errors", 0):
+            regressions.append(f"{key}: {result['errors']} errors vs baseline {base['errors']}")
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('-c', '--concurrency', default='1,8,32', help='comma-separated concurrency levels')
+    parser.add_argument('-n', '--requests', type=int, default=50, help='requests per scenario and level')
+    parser.add_argument('--only', help='comma-separated scenario names')
+    parser.add_argument('--distinct', type=int, default=20, help='distinct points/tiles cycled through')
+    parser.add_argument('--output', help='write results as JSON to this file')
+    parser.add_argument('--baseline', default=BASELINE_PATH)
+    parser.add_argument('--save-baseline', action='store_true', help='store these results as the baseline')
+    parser.add_argument('--check', action='store_true', help='exit 1 if results regress against the baseline')
+    parser.add_argument('--cache', default='memory', choices=['memory', 'sqlite', 'redis'],
+                        help='result cache backend; redis runs against bench.fake_redis')
+    parser.add_argument('--verbose', action='store_true', help="show the app's own log output")
+    args = parser.parse_args(argv)
+
+    out = sys.stdout
+    if not args.verbose:
+        sys.stdout = open(os.devnull, 'w')
+
+    base_url = setup(tempfile.mkdtemp(prefix='ndvi-bench-'), args.cache)
+    levels = [int(c) for c in args.concurrency.split(',')]
+    selected = set(args.only.split(',')) if args.only else None
+    from bench import fake_ee, fake_tiles
+    config = {name: getattr(fake_ee if hasattr(fake_ee, name) else fake_tiles, name) for name in FAKE_SETTINGS}
+
+    import requests
+    results = {}
+    cube_ready = False
+    print(f"{'scenario':<22}{'conc':>5}{'reqs':>6}{'err':>5}{'shed':>5}{'req/s':>9}{'p50':>9}{'p95':>9}{'p99':>9}",
+          file=out)
+    for name, method, path, body, options in scenarios(args.distinct):
+        if selected and name not in selected:
+            continue
+        if options.get("needs_cube") and not cube_ready:
+            job = requests.post(base_url + "/aoi/nyc/cube?width=64&height=64", timeout=30).json()
+            wait_for_job(base_url, job["id"])
+            cube_ready = True
+        for concurrency in levels:
+            concurrency = min(concurrency, options.get("max_concurrency", concurrency))
+            count = min(args.requests, options.get("max_requests", args.requests))
+            key = f"{name}@{concurrency}"
+            if key in results:
+                continue
+            if options.get("prepare"):
+                options["prepare"](base_url, count)
+            result = results[key] = drive(base_url, method, path, body, count, concurrency)
+            print(f"{name:<22}{concurrency:>5}{count:>6}{result['errors']:>5}{result['shed']:>5}"
+                  f"{result['throughput']:>9.1f}{result['p50']:>9.4f}{result['p95']:>9.4f}{result['p99']:>9.4f}",
+                  file=out)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({"config": config, "results": results}, f, indent=2)
+    if args.save_baseline:
+        baseline = {"config": config, "thresholds": DEFAULT_THRESHOLDS, "results": results}
+        if os.path.exists(args.baseline):
+            with open(args.baseline) as f:
+                previous = json.load(f)
+            # Keep scenarios that were not re-run and any tuned thresholds
+            baseline["results"] = {**previous.get("results", {}), **results}
+            baseline["thresholds"] = previous.get("thresholds", DEFAULT_THRESHOLDS)
+        with open(args.baseline, 'w') as f:
+            json.dump(baseline, f, indent=2, sort_keys=True)
+        print(f"Baseline written to {args.baseline}", file=out)
+    if args.check:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        if baseline.get("config", {}) != config:
+            print(f"Warning: fake latency settings differ from the baseline ({baseline.get('config')})", file=out)
+        regressions = check(results, baseline)
+        for message in regressions:
+            print(f"REGRESSION {message}", file=out)
+        if regressions:
+            return 1
+        print("No regressions against baseline", file=out)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
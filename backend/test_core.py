@@ -0,0 +1,274 @@
+import os
+import sys
+import time
+import asyncio
+import tempfile
+import threading
+from datetime import date, timedelta
+
+# Keep the stores the app opens at import time out of /tmp/ndvi-*
+_workdir = tempfile.mkdtemp()
+for _name, _file in [('SERIES_STORE_PATH', 'series.sqlite'), ('CACHE_PATH', 'cache.sqlite'),
+                     ('AOI_REGISTRY_PATH', 'aois.sqlite'), ('CATALOG_PATH', 'catalog.sqlite'),
+                     ('SCENE_INDEX_PATH', 'scenes.sqlite'), ('JOB_DIR', 'jobs'),
+                     ('TILE_CACHE_DIR', 'tiles'), ('LOCAL_CUBE_DIR', 'cubes'), ('COMPOSITE_DIR', 'composites')]:
+    os.environ.setdefault(_name, os.path.join(_workdir, _file))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from app import cache, encoding, geometry
+from app.ee_executor import Lane, Overloaded
+from app.single_flight import SingleFlight, BlockingSingleFlight
+from app.pixel_grid import snap, to_utm, utm_zone
+from app.series_store import SeriesStore
+from app.gee import month_windows
+from app.catalog import parse_period
+
+
+def _backends():
+    from bench import fake_redis
+    _, url = fake_redis.start()
+    return [cache.MemoryBackend(max_bytes=1000),
+            cache.SqliteBackend(path=os.path.join(tempfile.mkdtemp(), 'cache.sqlite'), max_bytes=1000),
+            cache.RedisBackend(url=url)]
+
+def test_cache_backends():
+    """Every backend stores, expires and clears values under a namespace"""
+    for backend in _backends():
+        values = cache.Cache('test', ttl=60, backend=backend)
+        assert values.get(('a', 1)) is None
+        values.put(('a', 1), {"ndvi": 0.5})
+        assert values.get(('a', 1)) == {"ndvi": 0.5}, backend.name
+        values.put(('short',), [1, 2], ttl=0.2)
+        time.sleep(0.4)
+        assert values.get(('short',)) is None, backend.name
+        values.clear()
+        assert values.get(('a', 1)) is None, backend.name
+        assert values.hits == 1 and values.misses == 3, (backend.name, values.status())
+
+def test_memory_and_sqlite_evict_to_their_byte_limit():
+    for backend in _backends()[:2]:
+        values = cache.Cache('lru', ttl=60, backend=backend)
+        for i in range(20):
+            values.put((i,), 'x' * 90)
+            values.get((0,))
+        status = backend.status()
+        assert status["bytes"] <= 1000, (backend.name, status)
+        # The entry read after every write stays the most recently used
+        assert values.get((0,)) is not None, backend.name
+        assert values.get((1,)) is None, backend.name
+
+def test_cache_skips_oversized_values():
+    values = cache.Cache('big', ttl=60, backend=cache.MemoryBackend())
+    values.put(('big',), 'x' * (cache.CACHE_MAX_ITEM_BYTES + 1))
+    assert values.skipped == 1 and values.get(('big',)) is None
+
+
+def test_single_flight_coalesces_concurrent_calls():
+    flights = SingleFlight()
+    calls = []
+
+    async def compute():
+        calls.append(1)
+        await asyncio.sleep(0.1)
+        return 42
+
+    async def main():
+        return await asyncio.gather(*[flights.run('k', compute) for _ in range(10)])
+
+    assert asyncio.run(main()) == [42] * 10
+    assert len(calls) == 1
+    assert flights.status() == {"in_flight": 0, "leaders": 1, "followers": 9, "timeouts": 0}
+
+def test_single_flight_shares_failures_only_with_waiters():
+    flights = SingleFlight()
+
+    async def fail():
+        await asyncio.sleep(0.05)
+        raise ValueError("boom")
+
+    async def main():
+        results = await asyncio.gather(*[flights.run('k', fail) for _ in range(3)], return_exceptions=True)
+        assert all(isinstance(r, ValueError) for r in results)
+        # The key is forgotten once the computation finishes
+        return await flights.run('k', lambda: asyncio.sleep(0, result='ok'))
+
+    assert asyncio.run(main()) == 'ok'
+
+def test_blocking_single_flight_coalesces_threads():
+    flights = BlockingSingleFlight()
+    calls = []
+    results = []
+
+    def build():
+        calls.append(1)
+        time.sleep(0.1)
+        return 'mapid'
+
+    threads = [threading.Thread(target=lambda: results.append(flights.run('k', build))) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert results == ['mapid'] * 8 and len(calls) == 1
+    assert flights.status()["in_flight"] == 0
+
+def test_blocking_single_flight_times_out_followers():
+    flights = BlockingSingleFlight(wait=0.05)
+    started = threading.Event()
+    leader = threading.Thread(target=lambda: flights.run('k', lambda: (started.set(), time.sleep(0.3))))
+    leader.start()
+    started.wait()
+    try:
+        flights.run('k', lambda: None)
+        assert False, "follower should have timed out"
+    except Overloaded:
+        pass
+    leader.join()
+    assert flights.timeouts == 1
+
+
+def test_lane_sheds_beyond_its_queue():
+    lane = Lane('test', limit=1, timeout=5, max_queue=1)
+
+    async def main():
+        running = asyncio.ensure_future(lane.run(time.sleep, 0.3))
+        await asyncio.sleep(0.05)
+        queued = asyncio.ensure_future(lane.run(time.sleep, 0.01))
+        await asyncio.sleep(0.05)
+        try:
+            await lane.run(time.sleep, 0.01)
+            assert False, "third call should have been shed"
+        except Overloaded:
+            pass
+        await asyncio.gather(running, queued)
+
+    asyncio.run(main())
+    assert lane.active == 0 and lane.waiting == 0
+
+
+def test_snap_returns_the_containing_pixel():
+    lat, lng = 40.7484, -73.9857
+    pixel = snap(lat, lng)
+    zone, north = utm_zone(lat, lng)
+    assert pixel.epsg == 32618
+    easting, northing = to_utm(lat, lng, zone, north)
+    assert (pixel.col, pixel.row) == (int(easting // 10), int(northing // 10))
+    # The centre lies half a pixel from the pixel's corner and snaps to the same pixel
+    centre_e, centre_n = to_utm(pixel.lat, pixel.lng, zone, north)
+    assert abs(centre_e - (pixel.col + 0.5) * 10) < 0.01 and abs(centre_n - (pixel.row + 0.5) * 10) < 0.01
+    assert snap(pixel.lat, pixel.lng).key == pixel.key
+
+def test_snap_coalesces_nearby_points():
+    pixel = snap(51.5, -0.12)
+    assert snap(pixel.lat + 0.00002, pixel.lng + 0.00002).key == pixel.key
+    assert snap(pixel.lat + 0.0002, pixel.lng).key != pixel.key
+
+def test_snap_southern_hemisphere():
+    pixel = snap(-33.8688, 151.2093)
+    assert pixel.epsg == 32756
+    assert snap(pixel.lat, pixel.lng).key == pixel.key
+
+
+def test_series_gaps():
+    from app import main
+    store = SeriesStore(path=os.path.join(tempfile.mkdtemp(), 'series.sqlite'))
+    original, main.series_store = main.series_store, store
+    try:
+        assert main._series_gaps('p', '2024-01-01', '2024-06-01') == [('2024-01-01', '2024-06-01')]
+        store.append('p', [('2024-02-03', 0.4)], '2024-02-01', '2024-05-01')
+        # Covered: nothing to fetch
+        assert main._series_gaps('p', '2024-02-01', '2024-05-01') == []
+        # Earlier start: fetch up to the synced range so it stays contiguous
+        assert main._series_gaps('p', '2024-01-01', '2024-03-01') == [('2024-01-01', '2024-02-01')]
+        # Later end: re-fetch the overlap days before synced_through
+        overlap = (date(2024, 5, 1) - timedelta(days=main.TIMESERIES_OVERLAP_DAYS)).isoformat()
+        assert main._series_gaps('p', '2024-03-01', '2024-06-01') == [(overlap, '2024-06-01')]
+        assert main._series_gaps('p', '2024-01-01', '2024-06-01') == [('2024-01-01', '2024-02-01'),
+                                                                     (overlap, '2024-06-01')]
+    finally:
+        main.series_store = original
+
+def test_series_store_merges_synced_ranges():
+    store = SeriesStore(path=os.path.join(tempfile.mkdtemp(), 'series.sqlite'))
+    store.append('p', [('2024-03-02', 0.2), ('2024-03-20', 0.3)], '2024-03-01', '2024-04-01')
+    store.append('p', [('2024-01-10', 0.1), ('2024-03-20', 0.35)], '2024-01-01', '2024-03-25')
+    assert store.synced_range('p') == ('2024-01-01', '2024-04-01')
+    assert store.get_series('p', '2024-01-01', '2024-04-01') == [('2024-01-10', 0.1), ('2024-03-02', 0.2),
+                                                                  ('2024-03-20', 0.35)]
+    # Nothing past today counts as synced
+    future = (date.today() + timedelta(days=30)).isoformat()
+    store.append('q', [], '2024-01-01', future)
+    assert store.synced_range('q')[1] == date.today().isoformat()
+
+
+def test_month_windows():
+    assert month_windows('2024-01-15', '2024-04-10') == [('2024-01-15', '2024-02-01'), ('2024-02-01', '2024-03-01'),
+                                                         ('2024-03-01', '2024-04-01'), ('2024-04-01', '2024-04-10')]
+    assert month_windows('2023-11-01', '2024-03-01', months=3) == [('2023-11-01', '2024-02-01'),
+                                                                    ('2024-02-01', '2024-03-01')]
+    assert month_windows('2024-01-01', '2024-01-01') == []
+
+def test_parse_period():
+    assert parse_period('2024-02') == ('month', date(2024, 2, 1), date(2024, 3, 1))
+    assert parse_period('2024-12') == ('month', date(2024, 12, 1), date(2025, 1, 1))
+    assert parse_period('2024-DJF') == ('season', date(2023, 12, 1), date(2024, 3, 1))
+    assert parse_period('2024-son') == ('season', date(2024, 9, 1), date(2024, 12, 1))
+    for bad in ('2024-13', '2024-2', '2024', 'spring-2024'):
+        try:
+            parse_period(bad)
+            assert False, bad
+        except ValueError:
+            pass
+
+
+def test_negotiate():
+    assert encoding.negotiate(None) == encoding.JSON
+    assert encoding.negotiate('*/*') == encoding.JSON
+    assert encoding.negotiate('text/html, application/*;q=0.5') == encoding.JSON
+    try:
+        encoding.negotiate('text/html')
+        assert False, "text/html should not be acceptable"
+    except encoding.NotAcceptable:
+        pass
+    if encoding._HAS_MSGPACK:
+        assert encoding.negotiate('application/json;q=0.5, application/x-msgpack') == encoding.MSGPACK
+    if encoding._HAS_ARROW:
+        assert encoding.negotiate('application/vnd.apache.arrow.stream;q=0, */*') == encoding.JSON
+
+
+def _square(west, south, east, north):
+    return geometry.rectangle([west, south, east, north])
+
+def test_validate_closes_rings_and_rejects_bad_input():
+    shape = geometry.validate({"type": "Feature", "geometry": {
+        "type": "Polygon", "coordinates": [[[0, 0], [1, 0], [1, 1]]]}})
+    assert shape["coordinates"][0][-1] == [0.0, 0.0]
+    for bad in ({"type": "Point", "coordinates": [0, 0]}, {"type": "Polygon", "coordinates": [[[0, 0], [1, 0]]]},
+                {"type": "Polygon", "coordinates": [[[0, 0], [200, 0], [1, 1]]]}, "polygon"):
+        try:
+            geometry.validate(bad)
+            assert False, bad
+        except ValueError:
+            pass
+
+def test_simplify_keeps_shape_within_tolerance():
+    ring = [[i / 100, 0.0001 * (i % 2)] for i in range(101)] + [[1, 1], [0, 1], [0, 0]]
+    simplified = geometry.simplify({"type": "Polygon", "coordinates": [ring]}, 0.001)
+    assert geometry.vertex_count(simplified) < 10
+    assert geometry.bbox(simplified) == [0, 0, 1, 1]
+
+def test_intersects():
+    notch = {"type": "Polygon", "coordinates": [[[0, 0], [4, 0], [4, 1], [1, 1], [1, 4], [0, 4], [0, 0]]]}
+    assert not geometry.intersects(_square(2, 2, 3, 3), notch)
+    assert geometry.intersects(_square(0.2, 0.2, 0.8, 0.8), notch)
+    assert geometry.intersects(_square(-1, -1, 5, 5), notch)
+    # Edges cross with no vertex of either inside the other
+    assert geometry.intersects(_square(1, -1, 2, 3), _square(-1, 0.5, 4, 1.5))
+    assert not geometry.intersects(_square(5, 5, 6, 6), notch)
+
+def test_str_tree_query_point():
+    items = [(geometry.bbox(_square(i, 0, i + 1, 1)), i) for i in range(100)]
+    tree = geometry.STRTree(items, node_size=4)
+    assert sorted(tree.query_point(10.5, 0.5)) == [10]
+    assert sorted(tree.query_point(10, 0.5)) == [9, 10]
+    assert tree.query_point(10.5, 2) == []
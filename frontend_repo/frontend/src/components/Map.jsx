@@ -107,14 +107,15 @@ const MapComponent = () => {
         throw new Error(data.error);
       }
 
-      if (data.tile_url && mapInstanceRef.current) {
+      if ((data.proxy_tile_url || data.tile_url) && mapInstanceRef.current) {
         // Remove existing NDVI layer
         if (ndviLayerRef.current) {
           ndviLayerRef.current.remove();
         }
 
-        // Add new NDVI layer
-        const ndviTileLayer = L.tileLayer(data.tile_url, {
+        // Add new NDVI layer, preferring the backend's caching tile proxy
+        const tileUrl = data.proxy_tile_url ? `${API_BASE}${data.proxy_tile_url}` : data.tile_url;
+        const ndviTileLayer = L.tileLayer(tileUrl, {
           attribution: 'NDVI Data from Google Earth Engine',
           opacity: opacity,
           zIndex: 1000
@@ -161,13 +162,14 @@ const MapComponent = () => {
       `)
       .openOn(mapInstanceRef.current);
 
-    // Load pixel statistics
+    // Load pixel statistics and time series in a single request
     try {
-      const statsResponse = await fetch(`${API_BASE}/stats/${lat}/${lng}`);
+      const statsResponse = await fetch(`${API_BASE}/point/${lat}/${lng}`);
       if (statsResponse.ok) {
         const statsData = await statsResponse.json();
         if (!statsData.error) {
           setPixelStats(statsData);
+          setTimeSeriesData(statsData);
           
           // Update popup with stats
           popup.setContent(`
@@ -192,11 +194,6 @@ const MapComponent = () => {
     } catch (err) {
       console.error("Error loading pixel stats:", err);
     }
-
-    // Load time series if enabled
-    if (showTimeSeries) {
-      loadTimeSeriesData(lat, lng);
-    }
   };
 
   // Load time series data
@@ -277,7 +274,7 @@ const MapComponent = () => {
   // Handle time series toggle
   const handleToggleTimeSeries = () => {
     setShowTimeSeries(!showTimeSeries);
-    if (!showTimeSeries && clickedPoint) {
+    if (!showTimeSeries && clickedPoint && !timeSeriesData) {
       loadTimeSeriesData(clickedPoint.lat, clickedPoint.lng);
     }
   };